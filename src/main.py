@@ -14,6 +14,11 @@ from src.routes.category import category_bp # This is the import causing the err
 from src.routes.formula import formula_bp
 from src.routes.import_bp import import_bp # Assuming this is your import blueprint
 from src.routes.ai import ai_bp
+from src.routes.ifra import ifra_bp
+from src.services.trigram_index import build_trigram_index
+from src.services.autocomplete import build_autocomplete_index
+from src.services.formula_similarity import build_similarity_index
+from src.services.import_jobs import fail_interrupted_jobs
 
 # Create Flask app
 app = Flask(__name__)
@@ -38,12 +43,20 @@ app.config['SQLALCHEMY_TRACK_MODIFICATIONS'] = False
 # Initialize database
 init_db(app)
 
+# Build in-memory search indexes up front so the first search doesn't pay for it
+with app.app_context():
+    build_trigram_index()
+    build_autocomplete_index()
+    build_similarity_index()
+    fail_interrupted_jobs() # Their worker threads died with the previous process
+
 # Register blueprints
 app.register_blueprint(ingredient_bp)
 app.register_blueprint(category_bp) # This is the registration
 app.register_blueprint(formula_bp)
 app.register_blueprint(import_bp) # Register the import blueprint
 app.register_blueprint(ai_bp)
+app.register_blueprint(ifra_bp)
 
 # Serve static files (Vue frontend)
 @app.route('/')
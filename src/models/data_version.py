@@ -0,0 +1,148 @@
+# src/models/data_version.py
+"""Per-table data-version counters, stored in the data_version table.
+
+Every transaction that writes to a tracked table bumps that table's counter
+(and its last-modified time) in the same transaction, the first time the table
+is written. The new version therefore becomes visible together with the data
+it describes, and is shared by every server process using the database. Read
+endpoints turn the counters of the tables they depend on into an ETag, and
+in-memory caches compare counters to know when to rebuild. Either way the
+check is a single query on a small table.
+
+A rolled-back transaction (or savepoint) rolls its bump back with it. The
+versions a transaction gave its tables stay readable with transaction_version()
+until it ends, so after_commit listeners know which version their changes
+produced.
+"""
+from datetime import datetime, timezone
+from sqlalchemy import event, select, update, insert, inspect as sa_inspect
+from sqlalchemy.orm import Session
+from src.models.models import db, DataVersion
+from src.models import pending_changes
+
+TRACKED_TABLES = ('ingredient', 'category', 'formula', 'ingredient_category', 'formula_ingredient', 'formula_component', 'formula_revision', 'ifra_limit')
+
+_table = DataVersion.__table__
+
+_BUMPED_KEY = 'data_version_bumped_tables' # {table name: new version} for tables the current transaction bumped
+pending_changes.register(_BUMPED_KEY)
+
+
+def ensure_version_rows():
+    """Create the counter row of any tracked table that doesn't have one yet."""
+    existing = set(db.session.execute(select(_table.c.table_name)).scalars())
+    missing = [name for name in TRACKED_TABLES if name not in existing]
+    if missing:
+        db.session.execute(insert(_table), [
+            {'table_name': name, 'version': 0, 'modified_at': datetime.utcnow()} for name in missing
+        ])
+        db.session.commit()
+
+
+def _read(table_names):
+    rows = db.session.execute(
+        select(_table.c.table_name, _table.c.version, _table.c.modified_at)
+        .where(_table.c.table_name.in_(table_names))
+    )
+    return {name: (version, modified_at) for name, version, modified_at in rows}
+
+
+def get_version(table_name):
+    return versions(table_name)[0]
+
+
+def versions(*table_names):
+    """Current counters for `table_names`, as a tuple in the same order."""
+    current = _read(table_names)
+    return tuple(current[table_name][0] if table_name in current else 0 for table_name in table_names)
+
+
+def version_state(*table_names):
+    """(tag, last modified) for `table_names`, from one query.
+
+    The tag, e.g. '4.0.7@2025-01-02 10:11:12.345678', joins the counters with the
+    latest modification time, so a database recreated from scratch (counters back
+    at 0) doesn't reproduce old tags. Last modified is an aware UTC datetime in
+    whole seconds, for the Last-Modified header.
+    """
+    current = _read(table_names)
+    latest = max((modified_at for _, modified_at in current.values()), default=datetime.utcnow())
+    tag = '.'.join(str(current[table_name][0] if table_name in current else 0) for table_name in table_names)
+    return f"{tag}@{latest}", latest.replace(tzinfo=timezone.utc, microsecond=0)
+
+
+def transaction_version(session, table_name):
+    """Version the session's current transaction gave `table_name`, or None if it hasn't written the table.
+
+    Inside after_commit hooks this is the version just committed. Caches use it
+    to tell their own commits from writes made elsewhere, and to avoid storing
+    results built from uncommitted writes.
+    """
+    return session.info.get(_BUMPED_KEY, {}).get(table_name)
+
+
+def versions_after_commit(built_at, committed):
+    """Versions a cache built at `built_at` ({table: version}) reaches by applying one commit's changes.
+
+    `committed` maps tables to the versions that commit gave them (None for tables
+    it didn't write). Returns None if some other write came in between, so the
+    commit's changes alone can't bring the cache up to date.
+    """
+    result = {}
+    for table_name, version in built_at.items():
+        new_version = committed.get(table_name)
+        if new_version is not None and new_version != version + 1:
+            return None
+        result[table_name] = version if new_version is None else new_version
+    return result
+
+
+# --- Change detection ---
+
+def _bump(session, table_names):
+    bumped = session.info.setdefault(_BUMPED_KEY, {})
+    table_names = sorted(name for name in table_names if name in TRACKED_TABLES and name not in bumped)
+    if not table_names:
+        return
+    # On the session's connection, so the bump commits (or rolls back) with the write.
+    # Core execution on the connection doesn't go through do_orm_execute again.
+    rows = session.connection().execute(
+        update(_table).where(_table.c.table_name.in_(table_names))
+        .values(version=_table.c.version + 1, modified_at=datetime.utcnow())
+        .returning(_table.c.table_name, _table.c.version)
+    )
+    bumped.update(rows.all())
+
+
+def _tables_touched_by(obj, deleted=False):
+    mapper = sa_inspect(obj).mapper
+    touched = {mapper.local_table.name}
+    for rel in mapper.relationships:
+        if rel.secondary is None:
+            continue
+        # Many-to-many collections write their association table during the same flush
+        if deleted or sa_inspect(obj).attrs[rel.key].history.has_changes():
+            touched.add(rel.secondary.name)
+    return touched
+
+
+@event.listens_for(Session, 'after_flush')
+def _record_flushed_tables(session, flush_context):
+    touched = set()
+    for obj in (*session.new, *session.dirty):
+        touched |= _tables_touched_by(obj)
+    for obj in session.deleted:
+        touched |= _tables_touched_by(obj, deleted=True)
+    if touched:
+        _bump(session, touched)
+
+
+@event.listens_for(Session, 'do_orm_execute')
+def _record_executed_tables(orm_execute_state):
+    # Bulk and Core statements (query.delete(), formula_ingredient.insert(), ...) bypass the flush
+    if orm_execute_state.is_select:
+        return
+    table = getattr(orm_execute_state.statement, 'table', None)
+    table_name = getattr(table, 'name', None)
+    if table_name:
+        _bump(orm_execute_state.session, {table_name})
@@ -0,0 +1,126 @@
+# src/models/fts.py
+"""SQLite FTS5 full-text index over ingredients.
+
+The index is a standalone FTS5 table keyed by ingredient id (its rowid) and is
+kept in sync by SQLite triggers, so every write path (ORM, bulk deletes, the
+import route) updates it without any Python-side bookkeeping.
+"""
+import re
+from sqlalchemy import text, table, column, literal_column
+
+FTS_TABLE = 'ingredient_fts'
+
+# Flipped on by setup_ingredient_fts() when the SQLite build supports FTS5.
+_fts_enabled = False
+
+# Expression used to (re)compute the space-separated category names for one ingredient.
+_CATEGORY_NAMES_SQL = (
+    "(SELECT group_concat(c.name, ' ') FROM category c "
+    "JOIN ingredient_category ic ON ic.category_id = c.id "
+    "WHERE ic.ingredient_id = {ingredient_id})"
+)
+
+_TRIGGERS = {
+    'ingredient_fts_ai': f"""
+        CREATE TRIGGER IF NOT EXISTS ingredient_fts_ai AFTER INSERT ON ingredient BEGIN
+            INSERT INTO {FTS_TABLE}(rowid, name, description, notes, odor_profile, category_names)
+            VALUES (NEW.id, NEW.name, NEW.description, NEW.notes, NEW.odor_profile,
+                    {_CATEGORY_NAMES_SQL.format(ingredient_id='NEW.id')});
+        END""",
+    'ingredient_fts_au': f"""
+        CREATE TRIGGER IF NOT EXISTS ingredient_fts_au
+        AFTER UPDATE OF name, description, notes, odor_profile ON ingredient BEGIN
+            DELETE FROM {FTS_TABLE} WHERE rowid = OLD.id;
+            INSERT INTO {FTS_TABLE}(rowid, name, description, notes, odor_profile, category_names)
+            VALUES (NEW.id, NEW.name, NEW.description, NEW.notes, NEW.odor_profile,
+                    {_CATEGORY_NAMES_SQL.format(ingredient_id='NEW.id')});
+        END""",
+    'ingredient_fts_ad': f"""
+        CREATE TRIGGER IF NOT EXISTS ingredient_fts_ad AFTER DELETE ON ingredient BEGIN
+            DELETE FROM {FTS_TABLE} WHERE rowid = OLD.id;
+        END""",
+    'ingredient_category_fts_ai': f"""
+        CREATE TRIGGER IF NOT EXISTS ingredient_category_fts_ai AFTER INSERT ON ingredient_category BEGIN
+            UPDATE {FTS_TABLE} SET category_names = {_CATEGORY_NAMES_SQL.format(ingredient_id='NEW.ingredient_id')}
+            WHERE rowid = NEW.ingredient_id;
+        END""",
+    'ingredient_category_fts_ad': f"""
+        CREATE TRIGGER IF NOT EXISTS ingredient_category_fts_ad AFTER DELETE ON ingredient_category BEGIN
+            UPDATE {FTS_TABLE} SET category_names = {_CATEGORY_NAMES_SQL.format(ingredient_id='OLD.ingredient_id')}
+            WHERE rowid = OLD.ingredient_id;
+        END""",
+    'category_fts_au': f"""
+        CREATE TRIGGER IF NOT EXISTS category_fts_au AFTER UPDATE OF name ON category BEGIN
+            UPDATE {FTS_TABLE} SET category_names = {_CATEGORY_NAMES_SQL.format(ingredient_id=f'{FTS_TABLE}.rowid')}
+            WHERE rowid IN (SELECT ingredient_id FROM ingredient_category WHERE category_id = NEW.id);
+        END""",
+}
+
+
+def setup_ingredient_fts(db):
+    """Create the FTS5 table and its sync triggers. Must run inside an app context.
+
+    Returns True when full-text search is usable. On non-SQLite databases or SQLite
+    builds without FTS5 this returns False and searches fall back to ILIKE.
+    """
+    global _fts_enabled
+    _fts_enabled = False
+    if db.engine.dialect.name != 'sqlite':
+        return False
+    try:
+        with db.engine.begin() as conn:
+            exists = conn.execute(
+                text("SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = :name"),
+                {'name': FTS_TABLE}
+            ).first() is not None
+            if not exists:
+                conn.execute(text(
+                    f"CREATE VIRTUAL TABLE {FTS_TABLE} USING fts5("
+                    "name, description, notes, odor_profile, category_names, "
+                    "tokenize = 'unicode61 remove_diacritics 2')"
+                ))
+            for ddl in _TRIGGERS.values():
+                conn.execute(text(ddl))
+            if not exists:
+                _rebuild(conn)
+    except Exception as e:
+        print(f"FTS5 unavailable, ingredient search will use ILIKE: {str(e)}")
+        return False
+    _fts_enabled = True
+    return True
+
+
+def _rebuild(conn):
+    """Repopulate the index from the ingredient table (used when the index is first created)."""
+    conn.execute(text(f"DELETE FROM {FTS_TABLE}"))
+    conn.execute(text(
+        f"INSERT INTO {FTS_TABLE}(rowid, name, description, notes, odor_profile, category_names) "
+        "SELECT i.id, i.name, i.description, i.notes, i.odor_profile, "
+        f"{_CATEGORY_NAMES_SQL.format(ingredient_id='i.id')} FROM ingredient i"
+    ))
+
+
+def fts_available():
+    return _fts_enabled
+
+
+def build_match_expression(search_term):
+    """Turn free user input into a safe FTS5 query: every word must match as a prefix.
+
+    Returns None when the input has no indexable words (e.g. only punctuation).
+    """
+    tokens = re.findall(r'\w+', search_term or '', re.UNICODE)
+    if not tokens:
+        return None
+    return ' '.join(f'"{token}"*' for token in tokens)
+
+
+def ingredient_fts_matches(match_expression):
+    """Subquery of (ingredient_id, rank) for a MATCH expression; lower rank is more relevant."""
+    fts = table(FTS_TABLE, column('rowid'), column('rank'))
+    return (
+        fts.select()
+        .with_only_columns(fts.c.rowid.label('ingredient_id'), fts.c.rank.label('rank'))
+        .where(literal_column(FTS_TABLE).op('MATCH')(match_expression))
+        .subquery('fts_match')
+    )
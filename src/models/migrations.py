@@ -0,0 +1,159 @@
+# src/models/migrations.py
+"""Versioned schema migrations.
+
+`db.create_all()` only creates missing tables, so anything added to an existing
+table later (indexes, columns) never reaches an existing perfumery.db. Each
+migration below runs once per database, in order, and is recorded in the
+`schema_migrations` table. Migrations run at startup (unless AUTO_MIGRATE is
+False) or on demand:
+
+    flask --app src.main db upgrade
+    flask --app src.main db status
+
+Migrations must be idempotent: on a fresh database `create_all()` has already
+built the current schema, and the migration only has to record itself.
+"""
+from datetime import datetime
+import click
+from sqlalchemy import Table, Column, Integer, String, DateTime, MetaData, select, inspect as sa_inspect
+
+# Kept out of db.metadata so create_all() never treats it as part of the app schema
+_migration_metadata = MetaData()
+schema_migrations = Table(
+    'schema_migrations',
+    _migration_metadata,
+    Column('version', Integer, primary_key=True),
+    Column('name', String(200), nullable=False),
+    Column('applied_at', DateTime, nullable=False)
+)
+
+MIGRATIONS = [] # (version, name, function(connection, metadata)), filled in by @migration
+
+
+def migration(version, name):
+    def decorator(fn):
+        MIGRATIONS.append((version, name, fn))
+        MIGRATIONS.sort(key=lambda m: m[0])
+        return fn
+    return decorator
+
+
+def _index_exists(connection, index):
+    if connection.dialect.name == 'sqlite':
+        # The SQLite inspector skips expression indexes such as lower(name), so ask sqlite_master directly
+        return connection.exec_driver_sql(
+            "SELECT 1 FROM sqlite_master WHERE type = 'index' AND name = ?", (index.name,)
+        ).first() is not None
+    return index.name in {ix['name'] for ix in sa_inspect(connection).get_indexes(index.table.name)}
+
+
+def _create_indexes(connection, metadata, *index_names):
+    """Create the named indexes (declared on the models) if they don't exist yet."""
+    indexes = {index.name: index for table in metadata.tables.values() for index in table.indexes}
+    for index_name in index_names:
+        if not _index_exists(connection, indexes[index_name]):
+            indexes[index_name].create(bind=connection)
+
+
+def _add_columns(connection, metadata, table_name, *column_names):
+    """Add columns declared on the model to an existing table, skipping any that exist."""
+    existing = {col['name'] for col in sa_inspect(connection).get_columns(table_name)}
+    for column_name in column_names:
+        if column_name in existing:
+            continue
+        column = metadata.tables[table_name].c[column_name]
+        column_type = column.type.compile(dialect=connection.dialect)
+        connection.exec_driver_sql(f'ALTER TABLE {table_name} ADD COLUMN {column_name} {column_type}')
+
+
+# --- Migrations ---
+
+@migration(1, 'Add indexes for reverse lookups, sorting and supplier codes')
+def _m0001_performance_indexes(connection, metadata):
+    _create_indexes(
+        connection, metadata,
+        'ix_formula_ingredient_ingredient_id',
+        'ix_ingredient_category_category_id',
+        'ix_ingredient_last_updated',
+        'ix_ingredient_supplier_code',
+        'ix_category_parent_id',
+    )
+
+
+@migration(2, 'Add case-insensitive name indexes')
+def _m0002_lower_name_indexes(connection, metadata):
+    _create_indexes(connection, metadata, 'ix_ingredient_name_lower', 'ix_category_name_lower')
+
+
+@migration(3, 'Add ingredient.synonyms')
+def _m0003_ingredient_synonyms(connection, metadata):
+    _add_columns(connection, metadata, 'ingredient', 'synonyms')
+
+
+@migration(4, 'Add ingredient.density and ingredient.drop_volume')
+def _m0004_ingredient_unit_properties(connection, metadata):
+    _add_columns(connection, metadata, 'ingredient', 'density', 'drop_volume')
+
+
+@migration(5, 'Add formula.ingredient_count')
+def _m0005_formula_ingredient_count(connection, metadata):
+    _add_columns(connection, metadata, 'formula', 'ingredient_count')
+    _create_indexes(connection, metadata, 'ix_formula_ingredient_count')
+    connection.exec_driver_sql(
+        'UPDATE formula SET ingredient_count = '
+        '(SELECT COUNT(*) FROM formula_ingredient WHERE formula_ingredient.formula_id = formula.id)'
+    )
+
+
+@migration(6, 'Add dilution and IFRA product category columns')
+def _m0006_ifra_columns(connection, metadata):
+    _add_columns(connection, metadata, 'ingredient', 'dilution_of_id', 'dilution_percent')
+    _create_indexes(connection, metadata, 'ix_ingredient_dilution_of_id')
+    _add_columns(connection, metadata, 'formula', 'product_category', 'dosage_percent')
+
+
+# --- Runner ---
+
+def applied_versions(connection):
+    schema_migrations.create(bind=connection, checkfirst=True)
+    return {row[0] for row in connection.execute(select(schema_migrations.c.version))}
+
+
+def run_migrations(db):
+    """Apply pending migrations, each in its own transaction. Returns the versions applied."""
+    with db.engine.begin() as connection:
+        done = applied_versions(connection)
+    newly_applied = []
+    for version, name, fn in MIGRATIONS:
+        if version in done:
+            continue
+        with db.engine.begin() as connection:
+            fn(connection, db.metadata)
+            connection.execute(schema_migrations.insert().values(
+                version=version, name=name, applied_at=datetime.utcnow()
+            ))
+        print(f"Applied migration {version}: {name}")
+        newly_applied.append(version)
+    return newly_applied
+
+
+def register_migration_commands(app):
+    from src.models.models import db
+
+    @app.cli.group('db')
+    def db_group():
+        """Database schema migrations."""
+
+    @db_group.command('upgrade')
+    def upgrade_command():
+        """Apply all pending migrations."""
+        applied = run_migrations(db)
+        click.echo(f"Applied {len(applied)} migration(s)." if applied else "Database is up to date.")
+
+    @db_group.command('status')
+    def status_command():
+        """List migrations and whether they have been applied."""
+        with db.engine.begin() as connection:
+            done = applied_versions(connection)
+        for version, name, _ in MIGRATIONS:
+            click.echo(f"[{'x' if version in done else ' '}] {version:04d} {name}")
@@ -1,6 +1,6 @@
 from datetime import datetime
 from flask_sqlalchemy import SQLAlchemy
-from sqlalchemy import Column, Integer, String, Float, Text, DateTime, Boolean, ForeignKey, Table
+from sqlalchemy import Column, Integer, String, Float, Text, DateTime, Boolean, ForeignKey, Table, Index, func
 from sqlalchemy.orm import relationship
 
 db = SQLAlchemy()
@@ -10,7 +10,7 @@ ingredient_category = Table(
     'ingredient_category',
     db.metadata,
     Column('ingredient_id', Integer, ForeignKey('ingredient.id'), primary_key=True),
-    Column('category_id', Integer, ForeignKey('category.id'), primary_key=True)
+    Column('category_id', Integer, ForeignKey('category.id'), primary_key=True, index=True) # Reverse lookups by category
 )
 
 # Association table for many-to-many relationship between Formula and Ingredient with additional data
@@ -18,7 +18,19 @@ formula_ingredient = Table(
     'formula_ingredient',
     db.metadata,
     Column('formula_id', Integer, ForeignKey('formula.id'), primary_key=True),
-    Column('ingredient_id', Integer, ForeignKey('ingredient.id'), primary_key=True),
+    Column('ingredient_id', Integer, ForeignKey('ingredient.id'), primary_key=True, index=True), # Formulas using an ingredient
+    Column('quantity', Float, nullable=False),
+    Column('unit', String(20), nullable=False),
+    Column('percentage', Float),
+    Column('notes', Text)
+)
+
+# Formula lines that use another formula (an accord) instead of a raw ingredient
+formula_component = Table(
+    'formula_component',
+    db.metadata,
+    Column('formula_id', Integer, ForeignKey('formula.id'), primary_key=True),
+    Column('component_id', Integer, ForeignKey('formula.id'), primary_key=True, index=True), # Formulas using a sub-formula
     Column('quantity', Float, nullable=False),
     Column('unit', String(20), nullable=False),
     Column('percentage', Float),
@@ -31,9 +43,10 @@ class Ingredient(db.Model):
     
     id = Column(Integer, primary_key=True)
     name = Column(String(100), nullable=False, unique=True)
+    synonyms = Column(Text)  # Comma-separated alternative/trade names, used by fuzzy search
     description = Column(Text)
     supplier = Column(String(100))
-    supplier_code = Column(String(50))
+    supplier_code = Column(String(50), index=True)
     cost_per_unit = Column(Float)
     unit_of_measurement = Column(String(20), default='g')
     stock_quantity = Column(Float, default=0)
@@ -41,6 +54,8 @@ class Ingredient(db.Model):
     
     # Physical properties
     viscosity = Column(String(50))
+    density = Column(Float)  # g/mL, used to convert volume lines in formulas (water-like if unset)
+    drop_volume = Column(Float)  # mL per drop, used to convert drop lines in formulas
     color = Column(String(50))
     odor_profile = Column(Text)
     
@@ -48,10 +63,13 @@ class Ingredient(db.Model):
     ifra_restricted = Column(Boolean, default=False)
     ifra_restriction_details = Column(Text)
     safety_notes = Column(Text)
+    # Dilutions: this ingredient is `dilution_percent`% of the material `dilution_of_id` (or of itself if unset)
+    dilution_of_id = Column(Integer, ForeignKey('ingredient.id'), index=True)
+    dilution_percent = Column(Float)
     
     # Additional fields
     date_added = Column(DateTime, default=datetime.utcnow)
-    last_updated = Column(DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
+    last_updated = Column(DateTime, default=datetime.utcnow, onupdate=datetime.utcnow, index=True)
     notes = Column(Text)
     
     # Relationships
@@ -73,7 +91,7 @@ class Category(db.Model):
     icon = Column(String(50))  # Icon identifier
     
     # Self-referential relationship for hierarchical structure
-    parent_id = Column(Integer, ForeignKey('category.id'))
+    parent_id = Column(Integer, ForeignKey('category.id'), index=True)
     parent = relationship('Category', remote_side=[id], backref='subcategories')
     
     # Relationships
@@ -103,8 +121,13 @@ class Formula(db.Model):
     # Formula details
     total_quantity = Column(Float)
     total_cost = Column(Float)
+    ingredient_count = Column(Integer, default=0, index=True)  # Denormalized line count, kept in step by the write paths
     notes = Column(Text)
     
+    # IFRA compliance defaults
+    product_category = Column(String(10))  # IFRA product category, e.g. '4'
+    dosage_percent = Column(Float)  # Concentrate in the finished product, in % (100 if unset)
+    
     # Relationships
     ingredients = relationship('Ingredient', secondary=formula_ingredient, back_populates='formulas')
     
@@ -112,8 +135,102 @@ class Formula(db.Model):
         return f'<Formula {self.name} v{self.version}>'
 
 
+class FormulaRevision(db.Model):
+    """One saved revision of a formula: either a full snapshot or a diff against the previous revision"""
+    __tablename__ = 'formula_revision'
+    
+    id = Column(Integer, primary_key=True)
+    formula_id = Column(Integer, ForeignKey('formula.id'), nullable=False)
+    revision = Column(Integer, nullable=False)  # 1, 2, 3... per formula
+    is_snapshot = Column(Boolean, nullable=False, default=False)
+    data = Column(Text, nullable=False)  # JSON: full state for snapshots, changes only for deltas
+    version_label = Column(String(20))  # Formula.version at the time
+    message = Column(Text)
+    created_at = Column(DateTime, default=datetime.utcnow)
+    
+    __table_args__ = (
+        Index('ix_formula_revision_formula_revision', 'formula_id', 'revision', unique=True),
+    )
+    
+    def __repr__(self):
+        return f'<FormulaRevision {self.formula_id}@{self.revision}>'
+
+
+class IfraLimit(db.Model):
+    """Maximum concentration of a material in the finished product, per IFRA product category"""
+    __tablename__ = 'ifra_limit'
+    
+    id = Column(Integer, primary_key=True)
+    ingredient_id = Column(Integer, ForeignKey('ingredient.id'), nullable=False, index=True)
+    product_category = Column(String(10), nullable=False)
+    max_concentration = Column(Float, nullable=False)  # % in finished product; 0 means prohibited
+    amendment = Column(String(20))  # e.g. '51st'
+    notes = Column(Text)
+    updated_at = Column(DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
+    
+    __table_args__ = (
+        Index('ix_ifra_limit_ingredient_category', 'ingredient_id', 'product_category', unique=True),
+    )
+    
+    def __repr__(self):
+        return f'<IfraLimit {self.ingredient_id} cat {self.product_category}: {self.max_concentration}%>'
+
+
+class ImportJob(db.Model):
+    """Ingredient import running (or run) in the background, with its progress and result"""
+    __tablename__ = 'import_job'
+    
+    id = Column(Integer, primary_key=True)
+    status = Column(String(20), nullable=False, default='queued')  # queued, running, completed, failed
+    filename = Column(String(255))
+    file_format = Column(String(10), nullable=False)  # json or csv
+    total_bytes = Column(Integer)
+    bytes_read = Column(Integer, default=0)  # Progress through the upload, for the ETA
+    rows_processed = Column(Integer, default=0)
+    imported_count = Column(Integer, default=0)
+    skipped_count = Column(Integer, default=0)
+    error_count = Column(Integer, default=0)
+    warning_count = Column(Integer, default=0)
+    errors = Column(Text)  # JSON list (the first MAX_REPORTED_MESSAGES)
+    warnings = Column(Text)  # JSON list (the first MAX_REPORTED_MESSAGES)
+    message = Column(Text)
+    created_at = Column(DateTime, default=datetime.utcnow, index=True)
+    started_at = Column(DateTime)
+    finished_at = Column(DateTime)
+    updated_at = Column(DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
+    
+    def __repr__(self):
+        return f'<ImportJob {self.id} {self.status}>'
+
+
+class DataVersion(db.Model):
+    """Change counter of one table, bumped by every transaction that writes to it (see data_version.py)"""
+    __tablename__ = 'data_version'
+    
+    table_name = Column(String(50), primary_key=True)
+    version = Column(Integer, nullable=False, default=0)
+    modified_at = Column(DateTime, nullable=False, default=datetime.utcnow)
+    
+    def __repr__(self):
+        return f'<DataVersion {self.table_name}: {self.version}>'
+
+
+# Case-insensitive name indexes, used by the lower(name) == ... duplicate checks
+Index('ix_ingredient_name_lower', func.lower(Ingredient.name))
+Index('ix_category_name_lower', func.lower(Category.name))
+
+
 # Function to initialize database
 def init_db(app):
+    from src.models.fts import setup_ingredient_fts
+    from src.models.data_version import ensure_version_rows
+    from src.models.migrations import run_migrations, register_migration_commands
+    from src.services import cost_propagation  # noqa: F401 - registers the formula cost listeners
     db.init_app(app)
+    register_migration_commands(app)
     with app.app_context():
         db.create_all()
+        if app.config.get('AUTO_MIGRATE', True): # Set to False to apply migrations only via `flask db upgrade`
+            run_migrations(db)
+        setup_ingredient_fts(db) # Full-text index for ingredient search (falls back to ILIKE if unsupported)
+        ensure_version_rows() # One data_version counter per tracked table
@@ -0,0 +1,65 @@
+# src/models/pending_changes.py
+"""Savepoint-aware bookkeeping for changes recorded on a session.
+
+Several listeners (data versions, ingredient and formula events, cost
+propagation) note what a transaction wrote in `session.info` and act on it once
+the transaction commits. Savepoints complicate that: SQLAlchemy fires
+before_commit/after_commit when a savepoint is released, and a rolled-back
+savepoint must drop only what was recorded inside it. Listeners register their
+`session.info` key here and skip nested commits (see is_nested_commit); this
+module then:
+
+- snapshots the registered keys when a savepoint begins and restores the
+  snapshot if the savepoint is rolled back,
+- discards the keys when the outermost transaction ends without committing.
+"""
+import copy
+from sqlalchemy import event
+from sqlalchemy.orm import Session
+
+_keys = []
+
+_CHECKPOINTS_KEY = 'pending_changes_checkpoints'
+
+
+def register(key):
+    """Have `session.info[key]` follow savepoint rollbacks and be dropped on rollback."""
+    if key not in _keys:
+        _keys.append(key)
+
+
+def is_nested_commit(session):
+    """True inside before_commit/after_commit hooks fired by releasing a savepoint."""
+    return session.in_nested_transaction()
+
+
+@event.listens_for(Session, 'after_transaction_create')
+def _checkpoint_savepoint(session, transaction):
+    if transaction.nested:
+        snapshot = {key: copy.deepcopy(session.info[key]) for key in _keys if key in session.info}
+        session.info.setdefault(_CHECKPOINTS_KEY, {})[transaction] = snapshot
+
+
+@event.listens_for(Session, 'after_commit')
+def _release_savepoint(session):
+    # The savepoint's changes now belong to the enclosing transaction
+    if session.in_nested_transaction():
+        session.info.get(_CHECKPOINTS_KEY, {}).pop(session.get_nested_transaction(), None)
+
+
+@event.listens_for(Session, 'after_transaction_end')
+def _restore_or_discard(session, transaction):
+    if transaction.nested:
+        snapshot = session.info.get(_CHECKPOINTS_KEY, {}).pop(transaction, None)
+        if snapshot is None:
+            return # Released (committed)
+        for key in _keys:
+            if key in snapshot:
+                session.info[key] = snapshot[key]
+            else:
+                session.info.pop(key, None)
+    elif transaction.parent is None:
+        # Runs after the after_commit hooks, so they can still read what was recorded
+        for key in _keys:
+            session.info.pop(key, None)
+        session.info.pop(_CHECKPOINTS_KEY, None)
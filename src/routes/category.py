@@ -1,12 +1,37 @@
 # src/routes/category.py
 from flask import Blueprint, jsonify, request
+from sqlalchemy import func
+from sqlalchemy.exc import IntegrityError
 from src.models.models import db, Category, ingredient_category # Ensure ingredient_category is imported
+from src.utils.http_cache import conditional_get
 
 # Correct Blueprint definition
 # This is the line that defines category_bp. Ensure it's exactly like this.
 category_bp = Blueprint('category_bp', __name__)
 
+def _ingredient_counts_by_category(category_ids=None):
+    """Map category id -> number of ingredients, from one GROUP BY over ingredient_category."""
+    query = db.session.query(
+        ingredient_category.c.category_id, func.count(ingredient_category.c.ingredient_id)
+    )
+    if category_ids is not None:
+        query = query.filter(ingredient_category.c.category_id.in_(category_ids))
+    return dict(query.group_by(ingredient_category.c.category_id).all())
+
+def _category_named(name, exclude_id=None):
+    """Existing category whose name matches `name` case-insensitively, if any.
+
+    Both sides are lowered by the database, so the check uses ix_category_name_lower
+    and folds case exactly as the database does (SQLite's lower() only folds ASCII;
+    an exact match, accents included, is always found).
+    """
+    query = Category.query.filter(func.lower(Category.name) == func.lower(name))
+    if exclude_id is not None:
+        query = query.filter(Category.id != exclude_id)
+    return query.first()
+
 @category_bp.route('/api/categories', methods=['GET'])
+@conditional_get('category', 'ingredient_category')
 def get_categories():
     """Get all categories with optional parent filter"""
     parent_id = request.args.get('parent_id', type=int)
@@ -15,6 +40,11 @@ def get_categories():
         query = query.filter(Category.parent_id == parent_id)
     
     categories = query.order_by(Category.name).all()
+    # Counts for all categories in two grouped queries instead of loading every relationship
+    ingredient_counts = _ingredient_counts_by_category()
+    parent_ids_with_children = {
+        row[0] for row in db.session.query(Category.parent_id).filter(Category.parent_id.isnot(None)).distinct()
+    }
     result = [{
         'id': category.id,
         'name': category.name,
@@ -22,12 +52,13 @@ def get_categories():
         'color_code': category.color_code,
         'icon': category.icon,
         'parent_id': category.parent_id,
-        'has_subcategories': len(category.subcategories) > 0,
-        'ingredient_count': len(category.ingredients) 
+        'has_subcategories': category.id in parent_ids_with_children,
+        'ingredient_count': ingredient_counts.get(category.id, 0)
     } for category in categories]
     return jsonify(result)
 
 @category_bp.route('/api/categories/<int:id>', methods=['GET'])
+@conditional_get('category', 'ingredient_category')
 def get_category(id):
     """Get a specific category by ID"""
     category = Category.query.get_or_404(id)
@@ -40,7 +71,7 @@ def get_category(id):
         'icon': category.icon,
         'parent_id': category.parent_id,
         'subcategories': subcategories,
-        'ingredient_count': len(category.ingredients)
+        'ingredient_count': _ingredient_counts_by_category([category.id]).get(category.id, 0)
     }
     return jsonify(result)
 
@@ -51,7 +82,7 @@ def create_category():
     if not data.get('name'):
         return jsonify({'error': 'Name is required'}), 400
     # Case-insensitive check for existing category name
-    existing = Category.query.filter(Category.name.ilike(data['name'])).first() 
+    existing = _category_named(data['name'])
     if existing:
         return jsonify({'error': 'A category with this name already exists'}), 409
     
@@ -63,7 +94,11 @@ def create_category():
         parent_id=data.get('parent_id')
     )
     db.session.add(category)
-    db.session.commit()
+    try:
+        db.session.commit()
+    except IntegrityError: # Created concurrently, or differs only by case the database doesn't fold
+        db.session.rollback()
+        return jsonify({'error': 'A category with this name already exists'}), 409
     return jsonify({
         'id': category.id,
         'name': category.name,
@@ -79,7 +114,7 @@ def update_category(id):
     if 'name' in data:
         # Case-insensitive comparison for new name
         if data['name'].lower() != category.name.lower(): 
-            existing = Category.query.filter(Category.name.ilike(data['name']), Category.id != id).first()
+            existing = _category_named(data['name'], exclude_id=id)
             if existing:
                 return jsonify({'error': 'A category with this name already exists'}), 409
         category.name = data['name']
@@ -96,7 +131,11 @@ def update_category(id):
             return jsonify({'error': 'A category cannot be its own parent'}), 400
         category.parent_id = data['parent_id']
     
-    db.session.commit()
+    try:
+        db.session.commit()
+    except IntegrityError:
+        db.session.rollback()
+        return jsonify({'error': 'A category with this name already exists'}), 409
     return jsonify({
         'id': category.id,
         'name': category.name,
@@ -172,7 +211,7 @@ def reset_categories_to_defaults():
         created_categories_info = []
         for cat_data in default_categories:
             # Check if category already exists (case-insensitive)
-            existing_cat = Category.query.filter(Category.name.ilike(cat_data["name"])).first()
+            existing_cat = _category_named(cat_data["name"])
             if not existing_cat:
                 new_cat = Category(name=cat_data["name"], description=cat_data.get("description", ""))
                 db.session.add(new_cat)
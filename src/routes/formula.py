@@ -1,24 +1,118 @@
 # src/routes/formula.py
-from flask import Blueprint, jsonify, request
-from src.models.models import db, Formula, Ingredient, formula_ingredient
+from flask import Blueprint, jsonify, request, Response, stream_with_context
+from src.models.models import db, Formula, Ingredient, formula_ingredient, formula_component
+from src.utils.pagination import get_bool_arg, keyset_paginate, InvalidCursor
+from src.utils.http_cache import conditional_get
+from src.services.formula_calc import (
+    calculate_formula, insert_formula_lines, formula_total_unit, load_formula_pricing,
+    recompute_parent_totals, formula_ids_containing, FormulaInputError
+)
+from src.services.formula_explosion import explode, check_acyclic, FormulaCycleError
+from src.services.units import line_cost
+from src.services import formula_history
+from src.services.formula_similarity import find_similar, DEFAULT_K
+from src.services.ifra import normalize_category, normalize_dosage, IfraInputError
+from src.services.batch_planner import plan_batches, parse_plan_item, PlanInputError, MAX_PLAN_FORMULAS
+from src.services.export import iter_formula_records, formula_ndjson_chunks, formula_zip_chunks
 from datetime import datetime # Ensure datetime is imported
 
 formula_bp = Blueprint('formula', __name__)
 
+def _line_inputs(data, formula_id=None):
+    """Raw lines for calculate_formula() from a create/update body.
+
+    Sub-formula lines come from `sub_formulas` ([{'formula_id', 'quantity', 'unit', 'notes'}])
+    and, as before, from `formula_id` lines inside `ingredients`. When updating
+    (`formula_id` given), a kind of line the request doesn't send keeps its stored
+    lines: an `ingredients` list without sub-formula lines leaves the accords alone,
+    and `sub_formulas` alone leaves the ingredient lines alone.
+    """
+    ingredients_input = data.get('ingredients', [])
+    sub_formulas_input = data.get('sub_formulas', [])
+    if not isinstance(ingredients_input, list):
+        raise FormulaInputError('Ingredients must be a list')
+    if not isinstance(sub_formulas_input, list):
+        raise FormulaInputError('Sub-formulas must be a list')
+    for position, line in enumerate(sub_formulas_input):
+        if not isinstance(line, dict) or line.get('formula_id') is None:
+            raise FormulaInputError(f"Sub-formula line {position + 1} needs a 'formula_id'")
+
+    ingredient_lines, component_lines = [], []
+    for line in ingredients_input:
+        is_component = isinstance(line, dict) and line.get('formula_id') is not None
+        (component_lines if is_component else ingredient_lines).append(line)
+    component_lines += sub_formulas_input
+    if formula_id is not None:
+        if 'ingredients' not in data:
+            ingredient_lines = [{'id': row.ingredient_id, 'quantity': row.quantity, 'unit': row.unit, 'notes': row.notes}
+                                for row in db.session.query(formula_ingredient).filter_by(formula_id=formula_id)]
+        if 'sub_formulas' not in data and not component_lines:
+            component_lines = [{'formula_id': row.component_id, 'quantity': row.quantity, 'unit': row.unit, 'notes': row.notes}
+                               for row in db.session.query(formula_component).filter_by(formula_id=formula_id)]
+    return ingredient_lines + component_lines
+
+# Columns the formula list can be sorted by
+FORMULA_SORT_COLUMNS = ('updated_at', 'created_at', 'name', 'ingredient_count', 'total_quantity', 'total_cost')
+
 @formula_bp.route('/api/formulas', methods=['GET'])
+@conditional_get('formula', 'formula_ingredient', 'formula_component')
 def get_formulas():
-    """Get all formulas with pagination"""
+    """Get all formulas with pagination.
+
+    Pass `cursor=` to use keyset pagination (returns `next_cursor`), and
+    `include_total=false` to skip the total count. `sort_by`/`sort_direction`
+    choose the order (default: most recently updated first), and
+    `min_ingredients`/`max_ingredients` filter by formula size.
+    """
     page = request.args.get('page', 1, type=int)
     per_page = request.args.get('per_page', 10, type=int)
     
     search_term = request.args.get('search', '')
+    cursor = request.args.get('cursor') # Presence of the parameter (even empty) opts into keyset pagination
+    include_total = get_bool_arg('include_total', default=cursor is None)
+    min_ingredients = request.args.get('min_ingredients', type=int)
+    max_ingredients = request.args.get('max_ingredients', type=int)
+    
+    sort_by = request.args.get('sort_by', 'updated_at')
+    if sort_by not in FORMULA_SORT_COLUMNS:
+        return jsonify({'error': f"'sort_by' must be one of: {', '.join(FORMULA_SORT_COLUMNS)}"}), 400
+    descending = request.args.get('sort_direction', 'desc').lower() == 'desc'
+    sort_column = getattr(Formula, sort_by)
     
     query = Formula.query
     
     if search_term:
         query = query.filter(Formula.name.ilike(f'%{search_term}%'))
+    # Size filters use the denormalized column, so they need no join or subquery
+    if min_ingredients is not None:
+        query = query.filter(Formula.ingredient_count >= min_ingredients)
+    if max_ingredients is not None:
+        query = query.filter(Formula.ingredient_count <= max_ingredients)
     
-    paginated_formulas = query.order_by(Formula.updated_at.desc()).paginate(page=page, per_page=per_page, error_out=False)
+    if cursor is not None:
+        total_items = query.count() if include_total else None
+        try:
+            page_items, next_cursor = keyset_paginate(query, sort_column, Formula.id, descending, cursor, per_page)
+        except InvalidCursor as e:
+            return jsonify({'error': str(e)}), 400
+        pagination = {
+            'per_page': per_page,
+            'next_cursor': next_cursor,
+            'has_more': next_cursor is not None,
+            'total_items': total_items
+        }
+    else:
+        order = (sort_column.desc(), Formula.id.desc()) if descending else (sort_column.asc(), Formula.id.asc())
+        paginated_formulas = query.order_by(*order).paginate(
+            page=page, per_page=per_page, error_out=False, count=include_total
+        )
+        page_items = paginated_formulas.items
+        pagination = {
+            'page': paginated_formulas.page,
+            'per_page': paginated_formulas.per_page,
+            'total_pages': paginated_formulas.pages if include_total else None,
+            'total_items': paginated_formulas.total
+        }
     
     result = {
         'items': [{
@@ -32,19 +126,15 @@ def get_formulas():
             'updated_at': formula.updated_at.isoformat() if formula.updated_at else None,
             'total_quantity': formula.total_quantity,
             'total_cost': formula.total_cost,
-            'ingredient_count': db.session.query(formula_ingredient).filter_by(formula_id=formula.id).count() # More direct count
-        } for formula in paginated_formulas.items],
-        'pagination': {
-            'page': paginated_formulas.page,
-            'per_page': paginated_formulas.per_page,
-            'total_pages': paginated_formulas.pages,
-            'total_items': paginated_formulas.total
-        }
+            'ingredient_count': formula.ingredient_count or 0 # Denormalized, kept in step by the write paths
+        } for formula in page_items],
+        'pagination': pagination
     }
     
     return jsonify(result)
 
 @formula_bp.route('/api/formulas/<int:id>', methods=['GET'])
+@conditional_get('formula', 'formula_ingredient', 'formula_component', 'ingredient')
 def get_formula(id):
     """Get a specific formula by ID"""
     formula = Formula.query.get_or_404(id)
@@ -59,15 +149,17 @@ def get_formula(id):
         Ingredient.id,
         Ingredient.name,
         Ingredient.cost_per_unit,
-        Ingredient.unit_of_measurement
+        Ingredient.unit_of_measurement,
+        Ingredient.density,
+        Ingredient.drop_volume
     ).join(Ingredient, formula_ingredient.c.ingredient_id == Ingredient.id).filter(
         formula_ingredient.c.formula_id == formula.id
     ).all()
 
     for assoc in formula_ingredients_assoc:
-        cost = None
-        if assoc.cost_per_unit is not None and assoc.quantity is not None:
-            cost = assoc.cost_per_unit * assoc.quantity
+        # Line quantity converted into the unit the ingredient is priced in
+        cost = line_cost(assoc.quantity, assoc.unit, assoc.cost_per_unit, assoc.unit_of_measurement,
+                         assoc.density, assoc.drop_volume)
         
         ingredients_data.append({
             'id': assoc.id, # Ingredient ID
@@ -80,6 +172,28 @@ def get_formula(id):
             'base_unit_of_measurement': assoc.unit_of_measurement # Original UOM of ingredient
         })
     
+    # Lines that use other formulas (accords), priced from their stored totals
+    component_rows = db.session.query(
+        formula_component.c.component_id, formula_component.c.quantity, formula_component.c.unit,
+        formula_component.c.percentage, formula_component.c.notes, Formula.name
+    ).join(Formula, Formula.id == formula_component.c.component_id).filter(
+        formula_component.c.formula_id == formula.id
+    ).all()
+    component_pricing = load_formula_pricing(row.component_id for row in component_rows) if component_rows else {}
+    sub_formulas_data = []
+    for row in component_rows:
+        cost_per_unit, total_unit, _, _ = component_pricing[row.component_id]
+        sub_formulas_data.append({
+            'formula_id': row.component_id,
+            'name': row.name,
+            'quantity': row.quantity,
+            'unit': row.unit,
+            'percentage': row.percentage,
+            'notes': row.notes,
+            'cost': line_cost(row.quantity, row.unit, cost_per_unit, total_unit),
+            'base_unit_of_measurement': total_unit
+        })
+    
     result = {
         'id': formula.id,
         'name': formula.name,
@@ -90,53 +204,17 @@ def get_formula(id):
         'created_at': formula.created_at.isoformat() if formula.created_at else None,
         'updated_at': formula.updated_at.isoformat() if formula.updated_at else None,
         'total_quantity': formula.total_quantity,
+        'total_unit': formula_total_unit([assoc.unit for assoc in formula_ingredients_assoc] + [row.unit for row in component_rows]),
         'total_cost': formula.total_cost,
         'notes': formula.notes,
-        'ingredients': ingredients_data
+        'product_category': formula.product_category,
+        'dosage_percent': formula.dosage_percent,
+        'ingredients': ingredients_data,
+        'sub_formulas': sub_formulas_data
     }
     
     return jsonify(result)
 
-def _calculate_totals_and_percentages(formula, ingredients_data_list):
-    """Helper function to calculate totals and percentages for a formula."""
-    current_total_quantity = 0
-    current_total_cost = 0
-    
-    # First pass to calculate total quantity based on provided ingredient data
-    for ing_data in ingredients_data_list:
-        quantity = ing_data.get('quantity', 0)
-        current_total_quantity += quantity
-        
-        ingredient_model = Ingredient.query.get(ing_data.get('id'))
-        if ingredient_model and ingredient_model.cost_per_unit is not None:
-            current_total_cost += ingredient_model.cost_per_unit * quantity
-
-    formula.total_quantity = current_total_quantity
-    formula.total_cost = current_total_cost
-    
-    # Prepare ingredient association data with percentages
-    processed_ingredients_for_db = []
-    for ing_data in ingredients_data_list:
-        ingredient_id = ing_data.get('id')
-        ingredient_model = Ingredient.query.get(ingredient_id)
-        if not ingredient_model:
-            continue # Or raise an error
-
-        quantity = ing_data.get('quantity', 0)
-        unit = ing_data.get('unit', ingredient_model.unit_of_measurement)
-        notes = ing_data.get('notes', '')
-        percentage = (quantity / current_total_quantity * 100) if current_total_quantity > 0 else 0
-        
-        processed_ingredients_for_db.append({
-            'ingredient_id': ingredient_id,
-            'quantity': quantity,
-            'unit': unit,
-            'percentage': percentage,
-            'notes': notes
-        })
-    return processed_ingredients_for_db
-
-
 @formula_bp.route('/api/formulas', methods=['POST'])
 def create_formula():
     """Create a new formula"""
@@ -145,6 +223,17 @@ def create_formula():
     if not data.get('name'):
         return jsonify({'error': 'Name is required'}), 400
     
+    try:
+        # Resolve and total all lines up front (one ingredient query); unknown ids are reported, not skipped
+        calculation = calculate_formula(_line_inputs(data))
+    except FormulaInputError as e:
+        return jsonify(e.to_dict()), 400
+    try:
+        product_category = normalize_category(data.get('product_category'))
+        dosage_percent = normalize_dosage(data.get('dosage_percent'))
+    except IfraInputError as e:
+        return jsonify({'error': str(e)}), 400
+    
     try:
         formula = Formula(
             name=data['name'],
@@ -152,35 +241,24 @@ def create_formula():
             creator=data.get('creator', ''),
             version=data.get('version', '1.0'),
             is_draft=data.get('is_draft', True),
-            notes=data.get('notes', '')
-            # total_quantity and total_cost will be set by helper
+            notes=data.get('notes', ''),
+            product_category=product_category,
+            dosage_percent=dosage_percent
         )
+        calculation.apply_to(formula)
         db.session.add(formula)
         db.session.flush()  # Get formula ID
 
-        ingredients_input = data.get('ingredients', [])
-        if not isinstance(ingredients_input, list):
-            return jsonify({'error': 'Ingredients must be a list'}), 400
-
-        processed_ingredients_db_data = _calculate_totals_and_percentages(formula, ingredients_input)
-        
-        for ing_db_data in processed_ingredients_db_data:
-            stmt = formula_ingredient.insert().values(
-                formula_id=formula.id,
-                ingredient_id=ing_db_data['ingredient_id'],
-                quantity=ing_db_data['quantity'],
-                unit=ing_db_data['unit'],
-                percentage=ing_db_data['percentage'],
-                notes=ing_db_data['notes']
-            )
-            db.session.execute(stmt)
+        insert_formula_lines(formula.id, calculation.lines, calculation.components) # One executemany per table
+        formula_history.record_revision(formula, message=data.get('revision_message'))
         
         db.session.commit()
         
         return jsonify({
             'id': formula.id,
             'name': formula.name,
-            'message': 'Formula created successfully'
+            'message': 'Formula created successfully',
+            **calculation.summary()
         }), 201
     except Exception as e:
         db.session.rollback()
@@ -192,45 +270,59 @@ def update_formula(id):
     formula = Formula.query.get_or_404(id)
     data = request.json
     
+    calculation = None
+    if 'ingredients' in data or 'sub_formulas' in data:
+        try:
+            calculation = calculate_formula(_line_inputs(data, formula.id))
+            check_acyclic(formula.id, [line['component_id'] for line in calculation.components])
+        except FormulaInputError as e: # Includes FormulaCycleError
+            return jsonify(e.to_dict()), 400
+    try:
+        ifra_settings = {
+            'product_category': normalize_category(data.get('product_category')),
+            'dosage_percent': normalize_dosage(data.get('dosage_percent'))
+        }
+    except IfraInputError as e:
+        return jsonify({'error': str(e)}), 400
+    
     try:
+        formula_history.ensure_baseline(formula) # Formulas saved before history existed get their old state as revision 1
         formula.name = data.get('name', formula.name)
         formula.description = data.get('description', formula.description)
         formula.creator = data.get('creator', formula.creator)
         formula.version = data.get('version', formula.version)
         formula.is_draft = data.get('is_draft', formula.is_draft)
         formula.notes = data.get('notes', formula.notes)
+        for field, value in ifra_settings.items():
+            if field in data: # Sending null/'' clears the setting
+                setattr(formula, field, value)
         
-        if 'ingredients' in data:
-            ingredients_input = data.get('ingredients', [])
-            if not isinstance(ingredients_input, list):
-                return jsonify({'error': 'Ingredients must be a list'}), 400
-
-            # Remove existing ingredient associations
+        if calculation is not None:
+            # Rewrite all lines: kept lines get new percentages when the total changes
             db.session.execute(formula_ingredient.delete().where(
                 formula_ingredient.c.formula_id == formula.id
             ))
-            
-            processed_ingredients_db_data = _calculate_totals_and_percentages(formula, ingredients_input)
-
-            for ing_db_data in processed_ingredients_db_data:
-                stmt = formula_ingredient.insert().values(
-                    formula_id=formula.id, # Use the current formula's ID
-                    ingredient_id=ing_db_data['ingredient_id'],
-                    quantity=ing_db_data['quantity'],
-                    unit=ing_db_data['unit'],
-                    percentage=ing_db_data['percentage'],
-                    notes=ing_db_data['notes']
-                )
-                db.session.execute(stmt)
+            db.session.execute(formula_component.delete().where(
+                formula_component.c.formula_id == formula.id
+            ))
+            calculation.apply_to(formula)
+            insert_formula_lines(formula.id, calculation.lines, calculation.components)
         
         formula.updated_at = datetime.utcnow() # Manually update timestamp
+        revision = formula_history.record_revision(formula, message=data.get('revision_message'))
+        if calculation is not None:
+            recompute_parent_totals([formula.id]) # Formulas using this one as an accord are priced from its totals
         db.session.commit()
         
-        return jsonify({
+        result = {
             'id': formula.id,
             'name': formula.name,
-            'message': 'Formula updated successfully'
-        })
+            'message': 'Formula updated successfully',
+            'revision': revision # None when nothing versioned changed
+        }
+        if calculation is not None:
+            result.update(calculation.summary())
+        return jsonify(result)
     except Exception as e:
         db.session.rollback()
         return jsonify({'error': str(e)}), 500
@@ -240,11 +332,22 @@ def delete_formula(id):
     """Delete a formula"""
     formula = Formula.query.get_or_404(id)
     
+    # Deleting an accord would silently change every formula built on it
+    parent_ids = formula_ids_containing([id]) - {id}
+    if parent_ids:
+        parents = db.session.query(Formula.id, Formula.name).filter(Formula.id.in_(parent_ids)).order_by(Formula.name).all()
+        return jsonify({
+            'error': f'Formula "{formula.name}" is used as a sub-formula by {len(parents)} other formula(s). Remove it from them first.',
+            'used_by': [{'id': parent.id, 'name': parent.name} for parent in parents]
+        }), 409
+    
     try:
         # Also delete associations from formula_ingredient table
         db.session.execute(formula_ingredient.delete().where(
             formula_ingredient.c.formula_id == id
         ))
+        db.session.execute(formula_component.delete().where(formula_component.c.formula_id == id)) # Its own sub-formula lines
+        formula_history.delete_history(id)
         db.session.delete(formula)
         db.session.commit()
         
@@ -268,25 +371,33 @@ def duplicate_formula(id):
             version="1.0", # Reset version or increment original_formula.version
             is_draft=True,
             notes=original_formula.notes,
+            product_category=original_formula.product_category,
+            dosage_percent=original_formula.dosage_percent,
             total_quantity=original_formula.total_quantity, # Will be recalculated if ingredients are deeply copied
-            total_cost=original_formula.total_cost
+            total_cost=original_formula.total_cost,
+            ingredient_count=original_formula.ingredient_count
         )
         db.session.add(new_formula)
         db.session.flush() # Get new_formula.id
 
         # Copy ingredients
         original_ingredients_assoc = db.session.query(formula_ingredient).filter_by(formula_id=original_formula.id).all()
+        original_components = db.session.query(formula_component).filter_by(formula_id=original_formula.id).all()
         
-        for assoc in original_ingredients_assoc:
-            stmt = formula_ingredient.insert().values(
-                formula_id=new_formula.id,
-                ingredient_id=assoc.ingredient_id,
-                quantity=assoc.quantity,
-                unit=assoc.unit,
-                percentage=assoc.percentage,
-                notes=assoc.notes
-            )
-            db.session.execute(stmt)
+        insert_formula_lines(new_formula.id, [{
+            'ingredient_id': assoc.ingredient_id,
+            'quantity': assoc.quantity,
+            'unit': assoc.unit,
+            'percentage': assoc.percentage,
+            'notes': assoc.notes
+        } for assoc in original_ingredients_assoc], [{
+            'component_id': assoc.component_id,
+            'quantity': assoc.quantity,
+            'unit': assoc.unit,
+            'percentage': assoc.percentage,
+            'notes': assoc.notes
+        } for assoc in original_components])
+        formula_history.record_revision(new_formula, message=f'Duplicated from formula {original_formula.id}')
             
         db.session.commit()
         return jsonify({
@@ -299,14 +410,187 @@ def duplicate_formula(id):
         db.session.rollback()
         return jsonify({'error': str(e)}), 500
 
-# Placeholder for formula export - can be expanded
+@formula_bp.route('/api/formulas/<int:id>/revisions', methods=['GET'])
+@conditional_get('formula_revision')
+def list_formula_revisions(id):
+    """List a formula's saved revisions, newest first"""
+    Formula.query.get_or_404(id)
+    return jsonify({'formula_id': id, 'items': formula_history.list_revisions(id)})
+
+@formula_bp.route('/api/formulas/<int:id>/revisions/<int:revision>', methods=['GET'])
+@conditional_get('formula_revision', 'ingredient', 'formula')
+def get_formula_revision(id, revision):
+    """Get a formula as it was at `revision`"""
+    try:
+        state = formula_history.materialize(id, revision)
+    except formula_history.RevisionNotFound as e:
+        return jsonify({'error': str(e)}), 404
+    names = formula_history.ingredient_names(state['lines'].keys())
+    sub_formula_names = formula_history.formula_names(state['components'].keys())
+    return jsonify({
+        'formula_id': id,
+        'revision': revision,
+        **state['fields'],
+        'ingredients': [{
+            'id': ingredient_id,
+            'name': names.get(ingredient_id), # None if the ingredient has since been deleted
+            'quantity': quantity,
+            'unit': unit,
+            'notes': notes
+        } for ingredient_id, (quantity, unit, notes) in state['lines'].items()],
+        'sub_formulas': [{
+            'formula_id': component_id,
+            'name': sub_formula_names.get(component_id),
+            'quantity': quantity,
+            'unit': unit,
+            'notes': notes
+        } for component_id, (quantity, unit, notes) in state['components'].items()]
+    })
+
+@formula_bp.route('/api/formulas/<int:id>/revisions/diff', methods=['GET'])
+@conditional_get('formula_revision')
+def diff_formula_revisions(id):
+    """Diff two revisions (`from` defaults to the one before `to`, `to` to the latest)"""
+    latest = formula_history.latest_revision_number(id)
+    if latest is None:
+        return jsonify({'error': f'Formula {id} has no revisions'}), 404
+    to_revision = request.args.get('to', latest, type=int)
+    from_revision = request.args.get('from', to_revision - 1, type=int)
+    try:
+        old_state = formula_history.materialize(id, from_revision)
+        new_state = formula_history.materialize(id, to_revision)
+    except formula_history.RevisionNotFound as e:
+        return jsonify({'error': str(e)}), 404
+    return jsonify({
+        'formula_id': id,
+        'from': from_revision,
+        'to': to_revision,
+        **formula_history.diff_states(old_state, new_state)
+    })
+
+@formula_bp.route('/api/formulas/<int:id>/similar', methods=['GET'])
+@conditional_get('formula', 'formula_ingredient')
+def similar_formulas(id):
+    """Formulas whose ingredient percentages are closest to this one (cosine similarity)"""
+    k = request.args.get('k', DEFAULT_K, type=int)
+    min_score = request.args.get('min_score', 0.0, type=float)
+    matches = find_similar(id, k, min_score)
+    if matches is None:
+        return jsonify({'error': f'Formula {id} not found'}), 404
+    return jsonify({
+        'formula_id': id,
+        'items': [{
+            'id': formula_id,
+            'name': name,
+            'score': score,
+            'shared_ingredients': shared
+        } for formula_id, name, score, shared in matches]
+    })
+
+@formula_bp.route('/api/formulas/<int:id>/explode', methods=['GET'])
+@conditional_get('formula', 'formula_ingredient', 'formula_component', 'ingredient')
+def explode_formula(id):
+    """Flatten a formula and its sub-formulas down to raw ingredients"""
+    try:
+        explosion = explode(id)
+    except FormulaCycleError as e:
+        return jsonify(e.to_dict()), 409
+    if explosion is None:
+        return jsonify({'error': f'Formula {id} not found'}), 404
+    ingredient_ids = explosion.lines.keys() | explosion.composition.keys()
+    names = formula_history.ingredient_names(ingredient_ids)
+    return jsonify({
+        'formula_id': id,
+        'name': explosion.name,
+        'total_quantity': explosion.total_quantity,
+        'total_unit': explosion.total_unit,
+        'depth': explosion.depth,
+        'sub_formula_ids': sorted(explosion.sub_formula_ids),
+        'ingredients': [{
+            'id': ingredient_id,
+            'name': names.get(ingredient_id),
+            'quantities': [
+                {'quantity': quantity, 'unit': unit} for unit, quantity in explosion.lines.get(ingredient_id, {}).items()
+            ],
+            'percentage': explosion.composition.get(ingredient_id, 0)
+        } for ingredient_id in sorted(ingredient_ids, key=lambda ing_id: (names.get(ing_id) or '').lower())],
+        'unconverted': explosion.unconverted
+    })
+
+@formula_bp.route('/api/formulas/<int:id>/plan', methods=['GET'])
+@conditional_get('formula', 'formula_ingredient', 'formula_component', 'ingredient')
+def plan_formula(id):
+    """Scale a formula to `target_quantity` x `batches` and check ingredient stock"""
+    try:
+        plan_item = parse_plan_item({
+            'id': id,
+            'target_quantity': request.args.get('target_quantity'),
+            'batches': request.args.get('batches')
+        })
+    except PlanInputError as e:
+        return jsonify(e.to_dict()), 400
+    Formula.query.get_or_404(id)
+    try:
+        return jsonify(plan_batches([plan_item]))
+    except PlanInputError as e:
+        return jsonify(e.to_dict()), 400
+
+@formula_bp.route('/api/formulas/plan', methods=['POST'])
+def plan_formulas():
+    """Plan several formulas at once; requirements are aggregated per ingredient.
+
+    Body: {"formulas": [{"id": 1, "target_quantity": 500, "batches": 2}, ...]}
+    """
+    data = request.json or {}
+    items = data.get('formulas')
+    if not isinstance(items, list) or not items:
+        return jsonify({'error': "'formulas' must be a non-empty list"}), 400
+    if len(items) > MAX_PLAN_FORMULAS:
+        return jsonify({'error': f'At most {MAX_PLAN_FORMULAS} formulas can be planned at once'}), 400
+    try:
+        return jsonify(plan_batches([parse_plan_item(item) for item in items]))
+    except PlanInputError as e:
+        return jsonify(e.to_dict()), 400
+
 @formula_bp.route('/api/formulas/<int:id>/export', methods=['GET'])
+@conditional_get('formula', 'formula_ingredient', 'formula_component', 'ingredient')
 def export_formula(id):
-    """Export a formula (simple JSON for now)"""
-    formula = Formula.query.get_or_404(id)
-    formula_data = get_formula(id).json # Leverage existing get_formula which returns jsonify
-    
-    # For a text format, you'd build a string here
-    # For CSV, you'd use the csv module
-    
-    return jsonify(formula_data)
\ No newline at end of file
+    """Export a formula as JSON (same shape as the bulk export records)"""
+    record = next(iter_formula_records(formula_ids=[id]), None)
+    if record is None:
+        return jsonify({'error': f'Formula {id} not found'}), 404
+    return jsonify(record)
+
+@formula_bp.route('/api/formulas/export', methods=['GET'])
+def export_formulas():
+    """Stream many formulas as NDJSON (default) or as a zip of per-formula JSON/CSV files.
+
+    Selects formulas by `ids=1,2,3` and/or the list filters `search=` and `is_draft=`;
+    with no filter the whole library is exported. `format=ndjson|zip`, and for zips
+    `files=json|csv`.
+    """
+    export_format = request.args.get('format', 'ndjson').lower()
+    if export_format not in ('ndjson', 'zip'):
+        return jsonify({'error': "Unsupported format. Use 'ndjson' or 'zip'."}), 400
+    file_format = request.args.get('files', 'json').lower()
+    if file_format not in ('json', 'csv'):
+        return jsonify({'error': "'files' must be 'json' or 'csv'"}), 400
+    formula_ids = None
+    if request.args.get('ids'):
+        try:
+            formula_ids = list(dict.fromkeys(int(part) for part in request.args['ids'].split(',') if part.strip()))
+        except ValueError:
+            return jsonify({'error': "'ids' must be a comma-separated list of integers"}), 400
+    filters = {
+        'formula_ids': formula_ids,
+        'search': request.args.get('search') or None,
+        'is_draft': get_bool_arg('is_draft', default=None)
+    }
+
+    if export_format == 'zip':
+        chunks, mimetype = formula_zip_chunks(file_format, **filters), 'application/zip'
+    else:
+        chunks, mimetype = formula_ndjson_chunks(**filters), 'application/x-ndjson'
+    response = Response(stream_with_context(chunks), mimetype=mimetype)
+    response.headers['Content-Disposition'] = f'attachment; filename=formulas.{export_format}'
+    return response
\ No newline at end of file
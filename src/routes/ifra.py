@@ -0,0 +1,161 @@
+# src/routes/ifra.py
+from flask import Blueprint, jsonify, request
+from src.models.models import db, Formula, Ingredient, IfraLimit
+from src.services.ifra import evaluate, normalize_category, normalize_dosage, IfraInputError, IFRA_CATEGORIES
+from src.utils.http_cache import conditional_get
+
+ifra_bp = Blueprint('ifra', __name__)
+
+IFRA_STATUSES = ('compliant', 'non_compliant', 'unverified', 'unevaluated')
+
+
+def _serialize_limit(limit, ingredient_name=None):
+    return {
+        'id': limit.id,
+        'ingredient_id': limit.ingredient_id,
+        'ingredient_name': ingredient_name,
+        'product_category': limit.product_category,
+        'max_concentration': limit.max_concentration,
+        'amendment': limit.amendment,
+        'notes': limit.notes,
+        'updated_at': limit.updated_at.isoformat() if limit.updated_at else None
+    }
+
+
+@ifra_bp.route('/api/ifra/categories', methods=['GET'])
+def get_ifra_categories():
+    return jsonify({'categories': list(IFRA_CATEGORIES)})
+
+
+@ifra_bp.route('/api/ifra/limits', methods=['GET'])
+@conditional_get('ifra_limit', 'ingredient')
+def get_ifra_limits():
+    """List restriction limits, optionally for one ingredient and/or product category"""
+    query = db.session.query(IfraLimit, Ingredient.name).join(Ingredient, Ingredient.id == IfraLimit.ingredient_id)
+    ingredient_id = request.args.get('ingredient_id', type=int)
+    if ingredient_id is not None:
+        query = query.filter(IfraLimit.ingredient_id == ingredient_id)
+    try:
+        category = normalize_category(request.args.get('category'))
+    except IfraInputError as e:
+        return jsonify({'error': str(e)}), 400
+    if category:
+        query = query.filter(IfraLimit.product_category == category)
+    rows = query.order_by(Ingredient.name, IfraLimit.product_category).all()
+    return jsonify({'items': [_serialize_limit(limit, name) for limit, name in rows]})
+
+
+@ifra_bp.route('/api/ifra/limits', methods=['POST'])
+def upsert_ifra_limits():
+    """Create or update limits in bulk.
+
+    Body: {"limits": [{"ingredient_id", "product_category", "max_concentration", "amendment", "notes"}]}
+    An existing limit for the same ingredient and category is updated in place.
+    """
+    data = request.json or {}
+    entries = data.get('limits')
+    if not isinstance(entries, list) or not entries:
+        return jsonify({'error': "'limits' must be a non-empty list"}), 400
+
+    parsed = {}
+    try:
+        for position, entry in enumerate(entries, start=1):
+            if not isinstance(entry, dict):
+                raise IfraInputError(f'Limit {position} must be an object')
+            try:
+                ingredient_id = int(entry.get('ingredient_id'))
+                max_concentration = float(entry.get('max_concentration'))
+            except (TypeError, ValueError):
+                raise IfraInputError(f'Limit {position} needs a numeric ingredient_id and max_concentration')
+            if not 0 <= max_concentration <= 100:
+                raise IfraInputError(f'Limit {position}: max_concentration must be between 0 and 100')
+            category = normalize_category(entry.get('product_category'))
+            if category is None:
+                raise IfraInputError(f'Limit {position} needs a product_category')
+            parsed[(ingredient_id, category)] = (max_concentration, entry.get('amendment'), entry.get('notes'))
+    except IfraInputError as e:
+        return jsonify({'error': str(e)}), 400
+
+    ingredient_ids = {ingredient_id for ingredient_id, _ in parsed}
+    known_ids = {row[0] for row in db.session.query(Ingredient.id).filter(Ingredient.id.in_(ingredient_ids))}
+    unknown_ids = sorted(ingredient_ids - known_ids)
+    if unknown_ids:
+        return jsonify({'error': 'Unknown ingredient id(s)', 'unknown_ingredient_ids': unknown_ids}), 400
+
+    try:
+        # All existing limits for these ingredients in one query
+        existing = {
+            (limit.ingredient_id, limit.product_category): limit
+            for limit in IfraLimit.query.filter(IfraLimit.ingredient_id.in_(ingredient_ids))
+        }
+        created = updated = 0
+        for (ingredient_id, category), (max_concentration, amendment, notes) in parsed.items():
+            limit = existing.get((ingredient_id, category))
+            if limit is None:
+                db.session.add(IfraLimit(
+                    ingredient_id=ingredient_id, product_category=category,
+                    max_concentration=max_concentration, amendment=amendment, notes=notes
+                ))
+                created += 1
+            else:
+                limit.max_concentration = max_concentration
+                limit.amendment = amendment if amendment is not None else limit.amendment
+                limit.notes = notes if notes is not None else limit.notes
+                updated += 1
+        db.session.commit()
+        return jsonify({'created': created, 'updated': updated, 'message': 'IFRA limits saved'}), 200
+    except Exception as e:
+        db.session.rollback()
+        return jsonify({'error': str(e)}), 500
+
+
+@ifra_bp.route('/api/ifra/limits/<int:id>', methods=['DELETE'])
+def delete_ifra_limit(id):
+    limit = IfraLimit.query.get_or_404(id)
+    try:
+        db.session.delete(limit)
+        db.session.commit()
+        return jsonify({'message': 'IFRA limit deleted'}), 200
+    except Exception as e:
+        db.session.rollback()
+        return jsonify({'error': str(e)}), 500
+
+
+def _evaluation_args():
+    return normalize_category(request.args.get('category')), normalize_dosage(request.args.get('dosage'))
+
+
+@ifra_bp.route('/api/formulas/<int:id>/ifra', methods=['GET'])
+@conditional_get('formula', 'formula_ingredient', 'formula_component', 'ingredient', 'ifra_limit')
+def get_formula_compliance(id):
+    """Check one formula; `category`/`dosage` override the formula's own settings"""
+    Formula.query.get_or_404(id)
+    try:
+        category, dosage = _evaluation_args()
+    except IfraInputError as e:
+        return jsonify({'error': str(e)}), 400
+    result = evaluate([id], category, dosage)[id]
+    if result['status'] == 'unevaluated':
+        return jsonify({'error': 'No product category: pass ?category= or set the formula\'s product_category'}), 400
+    return jsonify(result)
+
+
+@ifra_bp.route('/api/ifra/compliance', methods=['GET'])
+@conditional_get('formula', 'formula_ingredient', 'formula_component', 'ingredient', 'ifra_limit')
+def get_library_compliance():
+    """Check every formula at once. Filter with `status=` (e.g. non_compliant)."""
+    try:
+        category, dosage = _evaluation_args()
+    except IfraInputError as e:
+        return jsonify({'error': str(e)}), 400
+    status_filter = request.args.get('status')
+    if status_filter and status_filter not in IFRA_STATUSES:
+        return jsonify({'error': f"'status' must be one of: {', '.join(IFRA_STATUSES)}"}), 400
+
+    results = sorted(evaluate(None, category, dosage).values(), key=lambda r: r['name'].lower())
+    summary = {status: 0 for status in IFRA_STATUSES}
+    for result in results:
+        summary[result['status']] += 1
+    if status_filter:
+        results = [result for result in results if result['status'] == status_filter]
+    return jsonify({'summary': summary, 'items': results})
@@ -1,28 +1,74 @@
-from flask import Blueprint, jsonify, request
-from sqlalchemy import asc, desc, or_ # Import or_ for combining search conditions
-from src.models.models import db, Ingredient, Category, ingredient_category, formula_ingredient 
+from flask import Blueprint, jsonify, request, make_response, Response, stream_with_context
+from sqlalchemy import asc, desc, or_, func, case # Import or_ for combining search conditions
+from src.models.models import db, Ingredient, Category, IfraLimit, ingredient_category, formula_ingredient 
+from src.models.fts import fts_available, build_match_expression, ingredient_fts_matches
+from src.utils.pagination import get_bool_arg, keyset_paginate, InvalidCursor
+from src.utils.http_cache import conditional_get
+from src.utils.serializers import (
+    requested_fields, ingredient_load_options, serialize_ingredients, serialize_ingredient,
+    InvalidFields, INGREDIENT_LIST_FIELDS, INGREDIENT_DETAIL_FIELDS
+)
+from src.services import ingredient_lookup
+from src.services.trigram_index import fuzzy_search
+from src.services import autocomplete
+from src.services.formula_calc import formula_ids_using, recompute_formula_totals
+from src.services.export import ingredient_ndjson_chunks, ingredient_csv_chunks
 from datetime import datetime
 
 ingredient_bp = Blueprint('ingredient_bp', __name__)
 
 @ingredient_bp.route('/api/ingredients', methods=['GET'])
+@conditional_get('ingredient', 'category', 'ingredient_category')
 def get_ingredients():
-    """Get all ingredients with pagination, filtering, and sorting"""
+    """Get all ingredients with pagination, filtering, and sorting.
+
+    Pass `cursor=` to use keyset pagination (returns `next_cursor`), and
+    `include_total=false` to skip the total count. `category_ids=1,2,3` filters by
+    several categories (`category_mode=any|all`), and `facets=true` adds per-category
+    counts for the current search. `fuzzy=true` makes `search` a typo-tolerant
+    name/synonym match ranked by similarity.
+    """
     page = request.args.get('page', 1, type=int)
     per_page = request.args.get('per_page', 10, type=int)
     
     category_id_filter = request.args.get('category_id', type=int) # Renamed to avoid conflict
+    try:
+        category_ids_filter = _parse_id_list(request.args.get('category_ids', ''))
+    except ValueError:
+        return jsonify({'error': "'category_ids' must be a comma-separated list of integers"}), 400
+    if category_id_filter and category_id_filter not in category_ids_filter:
+        category_ids_filter.append(category_id_filter)
+    category_mode = request.args.get('category_mode', 'any').lower()
+    if category_mode not in ('any', 'all'):
+        return jsonify({'error': "'category_mode' must be 'any' or 'all'"}), 400
+    include_facets = get_bool_arg('facets', default=False)
     search_term = request.args.get('search', '')
+    fuzzy = get_bool_arg('fuzzy', default=False)
     
     sort_by = request.args.get('sort_by', 'name') 
     sort_direction = request.args.get('sort_direction', 'asc')
+    # Column used for keyset pagination; it is always loaded so the next cursor can be built
+    sort_column = getattr(Ingredient, sort_by) if sort_by in Ingredient.__table__.columns else Ingredient.name
 
-    query = Ingredient.query
-    
-    if category_id_filter:
-        query = query.join(Ingredient.categories).filter(Category.id == category_id_filter)
+    try:
+        fields = requested_fields(INGREDIENT_LIST_FIELDS)
+    except InvalidFields as e:
+        return jsonify({'error': str(e)}), 400
+
+    query = Ingredient.query.options(ingredient_load_options(fields, extra_columns=[sort_column]))
     
-    if search_term:
+    match_expression = build_match_expression(search_term) if search_term and not fuzzy and fts_available() else None
+    fts_match = None
+    similarity_by_id = None
+    if search_term and fuzzy:
+        # Typo-tolerant name/synonym search served by the in-memory trigram index
+        similarity_by_id = {ing_id: similarity for ing_id, similarity, _ in fuzzy_search(search_term)}
+        query = query.filter(Ingredient.id.in_(list(similarity_by_id)))
+    elif match_expression:
+        # Ranked full-text search via the FTS5 index (covers name, description, notes, odor profile and category names)
+        fts_match = ingredient_fts_matches(match_expression)
+        query = query.join(fts_match, fts_match.c.ingredient_id == Ingredient.id)
+    elif search_term:
         search_pattern = f"%{search_term}%"
         # Conditions for searching in various fields
         # We'll build a list of conditions to be ORed together
@@ -40,64 +86,144 @@ def get_ingredients():
         
         query = query.filter(or_(*search_conditions)).distinct()
 
-    # Apply sorting
-    if hasattr(Ingredient, sort_by):
-        column_to_sort = getattr(Ingredient, sort_by)
-        if sort_direction.lower() == 'desc':
-            query = query.order_by(desc(column_to_sort))
-        else:
-            query = query.order_by(asc(column_to_sort))
+    # Facets describe the current search, before the category filter narrows it down
+    facets = _category_facets(query) if include_facets else None
+
+    if category_ids_filter:
+        # Semi-join on the association table: no join fan-out, so no DISTINCT needed
+        matching_ids = db.session.query(ingredient_category.c.ingredient_id).filter(
+            ingredient_category.c.category_id.in_(category_ids_filter)
+        )
+        if category_mode == 'all':
+            matching_ids = matching_ids.group_by(ingredient_category.c.ingredient_id).having(
+                func.count(ingredient_category.c.category_id) == len(category_ids_filter)
+            )
+        query = query.filter(Ingredient.id.in_(matching_ids))
+
+    # Presence of the parameter (even empty, for the first page) opts into keyset pagination
+    cursor = request.args.get('cursor')
+    use_cursor = cursor is not None
+    include_total = get_bool_arg('include_total', default=not use_cursor)
+
+    if use_cursor:
+        # Keyset pagination seeks on a real column, so relevance ordering is not available in this mode
+        total_items = query.order_by(None).count() if include_total else None
+        try:
+            page_items, next_cursor = keyset_paginate(
+                query, sort_column, Ingredient.id, sort_direction.lower() == 'desc', cursor, per_page
+            )
+        except InvalidCursor as e:
+            return jsonify({'error': str(e)}), 400
+        pagination = {
+            'per_page': per_page,
+            'next_cursor': next_cursor,
+            'has_more': next_cursor is not None,
+            'total_items': total_items
+        }
     else:
-        # Default sort if sort_by is invalid or not applicable after joins in a simple way
-        query = query.order_by(Ingredient.name) 
+        # Apply sorting
+        relevance_sort = 'sort_by' not in request.args or sort_by == 'relevance'
+        if fts_match is not None and relevance_sort:
+            # Best matches first when searching without an explicit sort column
+            query = query.order_by(fts_match.c.rank, Ingredient.name)
+        elif similarity_by_id and relevance_sort:
+            ranked_positions = {ing_id: position for position, ing_id in enumerate(similarity_by_id)}
+            query = query.order_by(case(ranked_positions, value=Ingredient.id), Ingredient.name)
+        elif hasattr(Ingredient, sort_by):
+            column_to_sort = getattr(Ingredient, sort_by)
+            if sort_direction.lower() == 'desc':
+                query = query.order_by(desc(column_to_sort))
+            else:
+                query = query.order_by(asc(column_to_sort))
+        else:
+            # Default sort if sort_by is invalid or not applicable after joins in a simple way
+            query = query.order_by(Ingredient.name) 
 
-    paginated_ingredients = query.paginate(page=page, per_page=per_page, error_out=False)
-    
-    result = {
-        'items': [{
-            'id': ingredient.id,
-            'name': ingredient.name,
-            'description': ingredient.description,
-            'supplier': ingredient.supplier,
-            'cost_per_unit': ingredient.cost_per_unit,
-            'unit_of_measurement': ingredient.unit_of_measurement,
-            'stock_quantity': ingredient.stock_quantity,
-            'categories': [{'id': cat.id, 'name': cat.name} for cat in ingredient.categories],
-            'supplier_code': ingredient.supplier_code,
-            'minimum_stock_threshold': ingredient.minimum_stock_threshold,
-            'notes': ingredient.notes,
-            'date_added': ingredient.date_added.isoformat() if ingredient.date_added else None,
-            'last_updated': ingredient.last_updated.isoformat() if ingredient.last_updated else None,
-        } for ingredient in paginated_ingredients.items],
-        'pagination': {
+        # count=False skips the extra COUNT(*) query when the client doesn't need totals
+        paginated_ingredients = query.paginate(page=page, per_page=per_page, error_out=False, count=include_total)
+        page_items = paginated_ingredients.items
+        pagination = {
             'page': paginated_ingredients.page,
             'per_page': paginated_ingredients.per_page,
-            'total_pages': paginated_ingredients.pages,
+            'total_pages': paginated_ingredients.pages if include_total else None,
             'total_items': paginated_ingredients.total
         }
+    
+    result = {
+        'items': serialize_ingredients(page_items, fields), # Categories for the whole page in one query
+        'pagination': pagination
     }
+    if similarity_by_id is not None:
+        for item, ingredient in zip(result['items'], page_items):
+            item['similarity'] = similarity_by_id.get(ingredient.id)
+    if facets is not None:
+        result['facets'] = facets
     
     return jsonify(result)
 
+def _parse_id_list(raw_value):
+    """Parse '1,2,3' into [1, 2, 3]; raises ValueError on anything that isn't an integer."""
+    return list(dict.fromkeys(int(part) for part in raw_value.split(',') if part.strip()))
+
+def _category_facets(filtered_query):
+    """Ingredient counts per category over `filtered_query`, in one GROUP BY on ingredient_category."""
+    filtered_ids = filtered_query.with_entities(Ingredient.id).order_by(None)
+    rows = db.session.query(
+        Category.id, Category.name, func.count(ingredient_category.c.ingredient_id)
+    ).join(ingredient_category, ingredient_category.c.category_id == Category.id).filter(
+        ingredient_category.c.ingredient_id.in_(filtered_ids)
+    ).group_by(Category.id, Category.name).order_by(Category.name).all()
+    return [{'id': cat_id, 'name': name, 'count': count} for cat_id, name, count in rows]
+
+@ingredient_bp.route('/api/ingredients/lookup', methods=['GET'])
+def get_ingredient_lookup():
+    """Compact columnar id/name/unit/cost list for pickers, served from an in-memory snapshot."""
+    etag, body = ingredient_lookup.get_snapshot()
+    response = make_response(body)
+    response.mimetype = 'application/json'
+    response.set_etag(etag)
+    response.headers['Cache-Control'] = 'no-cache' # Always revalidate; unchanged inventories get a 304
+    return response.make_conditional(request)
+
+@ingredient_bp.route('/api/ingredients/suggest', methods=['GET'])
+def suggest_ingredients():
+    """As-you-type suggestions by name/word/supplier-code prefix, from the in-memory prefix index."""
+    prefix = request.args.get('q', '')
+    limit = request.args.get('limit', autocomplete.DEFAULT_LIMIT, type=int)
+    return jsonify({'query': prefix, 'items': autocomplete.suggest(prefix, limit)})
+
+@ingredient_bp.route('/api/ingredients/export', methods=['GET'])
+def export_ingredients():
+    """Stream the full inventory as NDJSON (default) or CSV without building it in memory."""
+    export_format = request.args.get('format', 'ndjson').lower()
+    if export_format not in ('ndjson', 'csv'):
+        return jsonify({'error': "Unsupported format. Use 'ndjson' or 'csv'."}), 400
+    try:
+        fields = requested_fields(INGREDIENT_DETAIL_FIELDS)
+    except InvalidFields as e:
+        return jsonify({'error': str(e)}), 400
+
+    if export_format == 'csv':
+        chunks, mimetype = ingredient_csv_chunks(fields), 'text/csv'
+    else:
+        chunks, mimetype = ingredient_ndjson_chunks(fields), 'application/x-ndjson'
+    response = Response(stream_with_context(chunks), mimetype=mimetype)
+    response.headers['Content-Disposition'] = f'attachment; filename=ingredients.{export_format}'
+    return response
+
 # --- Other ingredient routes (GET by ID, POST, PUT, DELETE) remain the same ---
 # For brevity, they are not repeated here but should be in your file.
 
 @ingredient_bp.route('/api/ingredients/<int:id>', methods=['GET'])
+@conditional_get('ingredient', 'category', 'ingredient_category')
 def get_ingredient(id):
     """Get a specific ingredient by ID"""
-    ingredient = Ingredient.query.get_or_404(id)
-    result = {
-        'id': ingredient.id, 'name': ingredient.name, 'description': ingredient.description,
-        'supplier': ingredient.supplier, 'supplier_code': ingredient.supplier_code,
-        'cost_per_unit': ingredient.cost_per_unit, 'unit_of_measurement': ingredient.unit_of_measurement,
-        'stock_quantity': ingredient.stock_quantity, 'minimum_stock_threshold': ingredient.minimum_stock_threshold,
-        'viscosity': ingredient.viscosity, 'color': ingredient.color, 'odor_profile': ingredient.odor_profile,
-        'ifra_restricted': ingredient.ifra_restricted, 'ifra_restriction_details': ingredient.ifra_restriction_details,
-        'safety_notes': ingredient.safety_notes, 'notes': ingredient.notes,
-        'categories': [{'id': cat.id, 'name': cat.name} for cat in ingredient.categories],
-        'date_added': ingredient.date_added.isoformat() if ingredient.date_added else None,
-        'last_updated': ingredient.last_updated.isoformat() if ingredient.last_updated else None
-    }
+    try:
+        fields = requested_fields(INGREDIENT_DETAIL_FIELDS)
+    except InvalidFields as e:
+        return jsonify({'error': str(e)}), 400
+    ingredient = Ingredient.query.options(ingredient_load_options(fields)).get_or_404(id)
+    result = serialize_ingredient(ingredient, fields)
     return jsonify(result)
 
 @ingredient_bp.route('/api/ingredients', methods=['POST'])
@@ -107,13 +233,17 @@ def create_ingredient():
     if Ingredient.query.filter_by(name=data['name']).first(): return jsonify({'error': 'Ingredient name already exists'}), 409
     try:
         new_ingredient = Ingredient(
-            name=data['name'], description=data.get('description'), supplier=data.get('supplier'),
+            name=data['name'], synonyms=data.get('synonyms'), description=data.get('description'), supplier=data.get('supplier'),
             supplier_code=data.get('supplier_code'),
             cost_per_unit=float(data['cost_per_unit']) if data.get('cost_per_unit') is not None else None,
             unit_of_measurement=data.get('unit_of_measurement', 'g'),
             stock_quantity=float(data['stock_quantity']) if data.get('stock_quantity') is not None else 0,
             minimum_stock_threshold=float(data.get('minimum_stock_threshold')) if data.get('minimum_stock_threshold') is not None else 0,
             viscosity=data.get('viscosity'), color=data.get('color'), odor_profile=data.get('odor_profile'),
+            density=float(data['density']) if data.get('density') is not None else None,
+            drop_volume=float(data['drop_volume']) if data.get('drop_volume') is not None else None,
+            dilution_of_id=int(data['dilution_of_id']) if data.get('dilution_of_id') is not None else None,
+            dilution_percent=float(data['dilution_percent']) if data.get('dilution_percent') is not None else None,
             ifra_restricted=data.get('ifra_restricted', False), ifra_restriction_details=data.get('ifra_restriction_details'),
             safety_notes=data.get('safety_notes'), notes=data.get('notes')
         )
@@ -135,12 +265,15 @@ def update_ingredient(id):
             if data['name'] != ingredient.name and Ingredient.query.filter(Ingredient.name == data['name'], Ingredient.id != id).first():
                 return jsonify({'error': 'Ingredient name already exists'}), 409
             ingredient.name = data['name']
-        for field in ['description','supplier','supplier_code','unit_of_measurement','viscosity','color','odor_profile','ifra_restriction_details','safety_notes','notes']:
+        for field in ['synonyms','description','supplier','supplier_code','unit_of_measurement','viscosity','color','odor_profile','ifra_restriction_details','safety_notes','notes']:
             if field in data: setattr(ingredient, field, data[field])
-        for field in ['cost_per_unit','stock_quantity','minimum_stock_threshold']:
+        for field in ['cost_per_unit','stock_quantity','minimum_stock_threshold','density','drop_volume','dilution_percent']:
             if field in data:
                 value = data[field]
                 setattr(ingredient, field, float(value) if value is not None and str(value).strip() != '' else None)
+        if 'dilution_of_id' in data:
+            value = data['dilution_of_id']
+            ingredient.dilution_of_id = int(value) if value not in (None, '') and int(value) != id else None
         if 'ifra_restricted' in data: ingredient.ifra_restricted = data['ifra_restricted']
         if 'category_ids' in data and isinstance(data['category_ids'], list):
             ingredient.categories = [] 
@@ -148,31 +281,29 @@ def update_ingredient(id):
                 ingredient.categories = Category.query.filter(Category.id.in_(data['category_ids'])).all()
         ingredient.last_updated = datetime.utcnow()
         db.session.commit()
-        updated_ingredient = Ingredient.query.get(id) # Re-fetch for updated relationships
         return jsonify({
-            'id': updated_ingredient.id, 'name': updated_ingredient.name, 'message': 'Ingredient updated successfully',
-            'ingredient': { # Return full object
-                'id': updated_ingredient.id, 'name': updated_ingredient.name, 'description': updated_ingredient.description,
-                'supplier': updated_ingredient.supplier, 'supplier_code': updated_ingredient.supplier_code,
-                'cost_per_unit': updated_ingredient.cost_per_unit, 'unit_of_measurement': updated_ingredient.unit_of_measurement,
-                'stock_quantity': updated_ingredient.stock_quantity, 'minimum_stock_threshold': updated_ingredient.minimum_stock_threshold,
-                'viscosity': updated_ingredient.viscosity, 'color': updated_ingredient.color, 'odor_profile': updated_ingredient.odor_profile,
-                'ifra_restricted': updated_ingredient.ifra_restricted, 'ifra_restriction_details': updated_ingredient.ifra_restriction_details,
-                'safety_notes': updated_ingredient.safety_notes, 'notes': updated_ingredient.notes,
-                'categories': [{'id': cat.id, 'name': cat.name} for cat in updated_ingredient.categories],
-                'date_added': updated_ingredient.date_added.isoformat() if updated_ingredient.date_added else None,
-                'last_updated': updated_ingredient.last_updated.isoformat() if updated_ingredient.last_updated else None
-            }
+            'id': ingredient.id, 'name': ingredient.name, 'message': 'Ingredient updated successfully',
+            'ingredient': serialize_ingredient(ingredient) # Return full object
         })
     except (ValueError, TypeError) as e: db.session.rollback(); return jsonify({'error': f'Invalid data type: {str(e)}'}), 400
     except Exception as e: db.session.rollback(); print(f"Error updating {id}: {str(e)}"); return jsonify({'error': f'Error: {str(e)}'}), 500
 
+def _detach_ifra_data(ingredient_ids):
+    """Drop IFRA limits of ingredients about to be deleted, and unlink dilutions pointing at them."""
+    db.session.execute(IfraLimit.__table__.delete().where(IfraLimit.ingredient_id.in_(ingredient_ids)))
+    db.session.execute(Ingredient.__table__.update().where(
+        Ingredient.dilution_of_id.in_(ingredient_ids)
+    ).values(dilution_of_id=None))
+
 @ingredient_bp.route('/api/ingredients/<int:id>', methods=['DELETE'])
 def delete_ingredient_single(id):
     ingredient = Ingredient.query.get_or_404(id)
     try:
         ingredient.categories = [] 
+        affected_formula_ids = formula_ids_using([id])
         db.session.execute(formula_ingredient.delete().where(formula_ingredient.c.ingredient_id == id))
+        recompute_formula_totals(affected_formula_ids) # Totals and ingredient_count no longer include it
+        _detach_ifra_data([id])
         db.session.delete(ingredient)
         db.session.commit()
         return jsonify({'message': f'Ingredient "{ingredient.name}" deleted'}), 200
@@ -182,6 +313,8 @@ def delete_ingredient_single(id):
 def delete_all_ingredients_endpoint():
     try:
         db.session.execute(formula_ingredient.delete())
+        recompute_formula_totals() # Every formula is now empty
+        db.session.execute(IfraLimit.__table__.delete())
         db.session.execute(ingredient_category.delete())
         num_deleted = db.session.query(Ingredient).delete()
         db.session.commit()
@@ -195,7 +328,10 @@ def delete_selected_ingredients_endpoint():
         return jsonify({'error': 'Invalid IDs.'}), 400
     if not ids: return jsonify({'message': 'No IDs provided.'}), 200
     try:
+        affected_formula_ids = formula_ids_using(ids)
         db.session.execute(formula_ingredient.delete().where(formula_ingredient.c.ingredient_id.in_(ids)))
+        recompute_formula_totals(affected_formula_ids)
+        _detach_ifra_data(ids)
         db.session.execute(ingredient_category.delete().where(ingredient_category.c.ingredient_id.in_(ids)))
         count = Ingredient.query.filter(Ingredient.id.in_(ids)).delete(synchronize_session='fetch') 
         db.session.commit()
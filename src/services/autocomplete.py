@@ -0,0 +1,151 @@
+# src/services/autocomplete.py
+"""Prefix autocomplete over ingredient names and supplier codes.
+
+Keys live in one sorted list of (key, ingredient id) tuples, so a prefix lookup
+is a bisect plus a short forward scan. Each ingredient contributes its full
+lowercased name, every later word of the name (so "sup" finds "Iso E Super")
+and its supplier code. The list is kept current from committed ingredient writes
+(see ingredient_events) and rebuilt after bulk statements, or when the
+ingredient data version in the database no longer matches the one it was built
+at (writes from another process or plain SQL).
+"""
+import bisect
+import threading
+from src.models.models import db, Ingredient
+from src.models import data_version
+from src.services import ingredient_events
+
+DEFAULT_LIMIT = 10
+MAX_LIMIT = 50
+_SCAN_FACTOR = 5 # Candidates examined per requested result before ranking
+
+# Match kinds, best first
+NAME_PREFIX, WORD_PREFIX, CODE_PREFIX = 0, 1, 2
+
+
+def _keys_for(name, supplier_code):
+    keys = []
+    lowered = (name or '').strip().lower()
+    if lowered:
+        keys.append((lowered, NAME_PREFIX))
+        words = lowered.split()
+        for position in range(1, len(words)):
+            keys.append((' '.join(words[position:]), WORD_PREFIX))
+    code = (supplier_code or '').strip().lower()
+    if code:
+        keys.append((code, CODE_PREFIX))
+    return keys
+
+
+class PrefixIndex:
+    """Sorted-array prefix index. Not thread-safe on its own."""
+
+    def __init__(self):
+        self._entries = [] # sorted [(key, ingredient id, match kind)]
+        self._entries_by_ingredient = {}
+        self._names = {} # ingredient id -> (name, supplier code)
+
+    def __len__(self):
+        return len(self._names)
+
+    @classmethod
+    def from_rows(cls, rows):
+        index = cls()
+        for ingredient_id, name, supplier_code in rows:
+            entries = [(key, ingredient_id, kind) for key, kind in _keys_for(name, supplier_code)]
+            index._entries.extend(entries)
+            index._entries_by_ingredient[ingredient_id] = entries
+            index._names[ingredient_id] = (name, supplier_code)
+        index._entries.sort()
+        return index
+
+    def add(self, ingredient_id, name, supplier_code=None):
+        self.remove(ingredient_id)
+        entries = [(key, ingredient_id, kind) for key, kind in _keys_for(name, supplier_code)]
+        for entry in entries:
+            bisect.insort(self._entries, entry)
+        self._entries_by_ingredient[ingredient_id] = entries
+        self._names[ingredient_id] = (name, supplier_code)
+
+    def remove(self, ingredient_id):
+        for entry in self._entries_by_ingredient.pop(ingredient_id, ()):
+            position = bisect.bisect_left(self._entries, entry)
+            if position < len(self._entries) and self._entries[position] == entry:
+                del self._entries[position]
+        self._names.pop(ingredient_id, None)
+
+    def suggest(self, prefix, limit=DEFAULT_LIMIT):
+        """Return up to `limit` [{'id', 'name', 'supplier_code', 'match'}], name-prefix matches first."""
+        prefix = (prefix or '').strip().lower()
+        if not prefix:
+            return []
+        best_kind = {}
+        position = bisect.bisect_left(self._entries, (prefix,))
+        scanned = 0
+        while position < len(self._entries) and scanned < limit * _SCAN_FACTOR:
+            key, ingredient_id, kind = self._entries[position]
+            if not key.startswith(prefix):
+                break
+            if kind < best_kind.get(ingredient_id, CODE_PREFIX + 1):
+                best_kind[ingredient_id] = kind
+            position += 1
+            scanned += 1
+
+        ranked = sorted(best_kind.items(), key=lambda item: (item[1], self._names[item[0]][0].lower()))
+        match_labels = {NAME_PREFIX: 'name', WORD_PREFIX: 'name_word', CODE_PREFIX: 'supplier_code'}
+        return [{
+            'id': ingredient_id,
+            'name': self._names[ingredient_id][0],
+            'supplier_code': self._names[ingredient_id][1],
+            'match': match_labels[kind]
+        } for ingredient_id, kind in ranked[:limit]]
+
+
+_lock = threading.Lock()
+_index = None # Built lazily; None also means "stale, rebuild on next request"
+_index_version = None # Ingredient data version _index reflects
+
+
+def build_autocomplete_index(version=None):
+    """(Re)build the index from the database. Must run inside an app context."""
+    global _index, _index_version
+    if version is None:
+        version = data_version.get_version(Ingredient.__tablename__) # Before the rows, as in build_trigram_index()
+    index = PrefixIndex.from_rows(
+        db.session.query(Ingredient.id, Ingredient.name, Ingredient.supplier_code).all()
+    )
+    if data_version.transaction_version(db.session, Ingredient.__tablename__) is not None:
+        return index # Built from uncommitted writes: use it for this request only
+    with _lock:
+        _index, _index_version = index, version
+    return index
+
+
+def suggest(prefix, limit=DEFAULT_LIMIT):
+    limit = max(1, min(limit, MAX_LIMIT))
+    version = data_version.get_version(Ingredient.__tablename__)
+    with _lock:
+        index = _index if _index_version == version else None
+    if index is None:
+        # Use the index just built: a commit may mark the global stale (None) meanwhile
+        index = build_autocomplete_index(version)
+    with _lock: # Incremental updates mutate the index in place
+        return index.suggest(prefix, limit)
+
+
+def _apply_ingredient_changes(upserts, deletes, stale, version):
+    global _index, _index_version
+    with _lock:
+        if _index is None:
+            return
+        if stale or version is None or version != _index_version + 1:
+            _index = None # Bulk statement, or writes this process didn't see
+            return
+        for ingredient_id in deletes:
+            _index.remove(ingredient_id)
+        for ingredient_id, values in upserts.items():
+            _index.add(ingredient_id, values['name'], values['supplier_code'])
+        _index_version = version
+
+
+ingredient_events.subscribe(_apply_ingredient_changes, ('name', 'supplier_code'))
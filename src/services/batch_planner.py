@@ -0,0 +1,174 @@
+# src/services/batch_planner.py
+"""Production batch planning: scale formulas and check the stock they need.
+
+A plan is a list of (formula id, target quantity, batches). Each formula's lines
+are scaled to the target size (in the formula's total unit, normally grams), and
+multiplied by the number of batches. Sub-formulas (accords) are exploded into
+their raw ingredients first (see formula_explosion). Each ingredient's requirement
+is converted into the unit it is stocked in and summed across all formulas, then
+compared with stock. The whole plan needs four queries for flat formulas
+(formulas, both kinds of lines, and the involved ingredients), three more per
+level of nesting, and just the ingredient query when the explosions are cached.
+"""
+from collections import defaultdict
+from src.models.models import db, Ingredient
+from src.services.formula_explosion import explode_many, FormulaCycleError
+from src.services.units import convert, UnitConversionError
+from src.utils.serializers import chunked
+
+MAX_PLAN_FORMULAS = 100
+
+
+class PlanInputError(ValueError):
+    """Raised for invalid plan requests (bad numbers, unknown formulas, unscalable formulas)."""
+
+    def __init__(self, message, unknown_ids=()):
+        super().__init__(message)
+        self.unknown_ids = sorted(unknown_ids)
+
+    def to_dict(self):
+        result = {'error': str(self)}
+        if self.unknown_ids:
+            result['unknown_formula_ids'] = self.unknown_ids
+        return result
+
+
+def _positive_number(value, name, default):
+    if value is None or value == '':
+        return default
+    try:
+        number = float(value)
+    except (TypeError, ValueError):
+        raise PlanInputError(f"'{name}' must be a number")
+    if number <= 0:
+        raise PlanInputError(f"'{name}' must be greater than zero")
+    return number
+
+
+def parse_plan_item(item):
+    """Validate one {'id', 'target_quantity', 'batches'} request entry; returns (id, target or None, batches)."""
+    if not isinstance(item, dict):
+        raise PlanInputError('Each plan entry must be an object')
+    try:
+        formula_id = int(item.get('id'))
+    except (TypeError, ValueError):
+        raise PlanInputError('Each plan entry needs a formula id')
+    target_quantity = _positive_number(item.get('target_quantity'), 'target_quantity', None)
+    batches = _positive_number(item.get('batches'), 'batches', 1)
+    if batches != int(batches):
+        raise PlanInputError("'batches' must be a whole number")
+    return formula_id, target_quantity, int(batches)
+
+
+def _load_ingredients(ingredient_ids):
+    ingredients = {}
+    for id_chunk in chunked(ingredient_ids):
+        for row in db.session.query(
+            Ingredient.id, Ingredient.name, Ingredient.unit_of_measurement, Ingredient.stock_quantity,
+            Ingredient.cost_per_unit, Ingredient.density, Ingredient.drop_volume
+        ).filter(Ingredient.id.in_(id_chunk)):
+            ingredients[row.id] = row
+    return ingredients
+
+
+def plan_batches(plan_items):
+    """Build a production plan for [(formula_id, target_quantity or None, batches)].
+
+    Returns {'formulas': [...], 'ingredients': [...], 'summary': {...}}.
+    """
+    formula_ids = {formula_id for formula_id, _, _ in plan_items}
+    try:
+        formulas = explode_many(formula_ids)
+    except FormulaCycleError as e:
+        raise PlanInputError(str(e))
+    unknown = formula_ids - formulas.keys()
+    if unknown:
+        raise PlanInputError('Unknown formula id(s)', unknown_ids=unknown)
+
+    # Flattened (ingredient id, quantity, unit) lines for one batch of each formula at its stored size
+    lines_by_formula = {
+        formula_id: [
+            (ingredient_id, quantity, unit)
+            for ingredient_id, by_unit in explosion.lines.items() for unit, quantity in by_unit.items()
+        ] for formula_id, explosion in formulas.items()
+    }
+    ingredients = _load_ingredients({ing_id for lines in lines_by_formula.values() for ing_id, _, _ in lines})
+
+    # ingredient id -> requirement in its stock unit, plus what could not be converted
+    required = defaultdict(float)
+    unconvertible = defaultdict(lambda: defaultdict(float)) # ingredient id -> {line unit: quantity}
+    used_by = defaultdict(set)
+    formula_plans = []
+    for formula_id, target_quantity, batches in plan_items:
+        formula = formulas[formula_id]
+        lines = lines_by_formula.get(formula_id, [])
+        total_quantity = formula.total_quantity or 0
+        if target_quantity is None:
+            scale = 1.0
+            target_quantity = total_quantity
+        elif total_quantity > 0:
+            scale = target_quantity / total_quantity
+        else:
+            raise PlanInputError(f"Formula {formula_id} has no total quantity to scale from")
+        factor = scale * batches
+        for ingredient_id, quantity, unit in lines:
+            ingredient = ingredients.get(ingredient_id)
+            if ingredient is None:
+                continue # Orphaned line (SQLite doesn't enforce the foreign key)
+            used_by[ingredient_id].add(formula_id)
+            try:
+                required[ingredient_id] += convert(
+                    quantity * factor, unit, ingredient.unit_of_measurement or 'g',
+                    ingredient.density, ingredient.drop_volume
+                )
+            except UnitConversionError:
+                unconvertible[ingredient_id][unit] += quantity * factor
+        formula_plans.append({
+            'id': formula_id,
+            'name': formula.name,
+            'scale_factor': scale,
+            'batch_quantity': target_quantity,
+            'batches': batches,
+            'total_quantity': target_quantity * batches,
+            'unit': formula.total_unit,
+            'sub_formula_ids': sorted(formula.sub_formula_ids)
+        })
+        if formula.unconverted:
+            formula_plans[-1]['unconverted_sub_formulas'] = formula.unconverted # Left out of the requirements
+
+    ingredient_plans = []
+    estimated_cost = 0
+    for ingredient_id in sorted(used_by, key=lambda ing_id: ingredients[ing_id].name.lower()):
+        ingredient = ingredients[ingredient_id]
+        in_stock = ingredient.stock_quantity or 0
+        needed = required.get(ingredient_id, 0)
+        shortfall = max(0.0, needed - in_stock)
+        if ingredient.cost_per_unit is not None:
+            estimated_cost += needed * ingredient.cost_per_unit
+        entry = {
+            'id': ingredient_id,
+            'name': ingredient.name,
+            'unit': ingredient.unit_of_measurement,
+            'required': needed,
+            'in_stock': in_stock,
+            'shortfall': shortfall,
+            'sufficient': shortfall == 0 and ingredient_id not in unconvertible,
+            'formula_ids': sorted(used_by[ingredient_id])
+        }
+        if ingredient_id in unconvertible:
+            # Lines in units that can't be expressed in the stock unit are reported as-is
+            entry['unconverted'] = [{'quantity': qty, 'unit': unit} for unit, qty in unconvertible[ingredient_id].items()]
+        ingredient_plans.append(entry)
+
+    shortfalls = [entry for entry in ingredient_plans if entry['shortfall'] > 0]
+    return {
+        'formulas': formula_plans,
+        'ingredients': ingredient_plans,
+        'summary': {
+            'can_produce': all(entry['sufficient'] for entry in ingredient_plans),
+            'ingredient_count': len(ingredient_plans),
+            'shortfall_count': len(shortfalls),
+            'unconverted_count': len(unconvertible),
+            'estimated_cost': estimated_cost
+        }
+    }
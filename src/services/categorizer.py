@@ -0,0 +1,326 @@
+# src/services/categorizer.py
+"""Filing ingredients under core categories from keywords in their text.
+
+KeywordCategorizer compiles the keyword table into one regular expression,
+shaped as a trie (keywords sharing a prefix share a branch), so a text is
+scanned once no matter how many keywords there are. Single-word keywords only
+match whole words ("lime" is not found in "sublime"); keywords containing a
+space match anywhere. Matches may overlap, as when "orange" and "orange peel"
+both apply.
+"""
+import re
+
+KEYWORD_TO_CORE_CATEGORY = {
+    # Citrus
+    "lemon": "Citrus", "lime": "Citrus", "bergamot": "Citrus", "orange": "Citrus",
+    "grapefruit": "Citrus", "mandarin": "Citrus", "tangerine": "Citrus", "yuzu": "Citrus",
+    "citron": "Citrus", "petitgrain": "Citrus", "neroli": "Citrus", "verbena": "Citrus",
+    "citric": "Citrus", "orange peel": "Citrus", "agrumen": "Citrus", "citral": "Citrus",
+    "citronellal": "Citrus", "citronellol": "Citrus", "citronellyl": "Citrus", 
+    "citrylal": "Citrus", "clonal": "Citrus", "peely": "Citrus",
+
+    # Woody
+    "sandalwood": "Woody", "cedarwood": "Woody", "cedar": "Woody", "vetiver": "Woody",
+    "patchouli": "Woody", "oud": "Woody", "agarwood": "Woody", "guaiacwood": "Woody",
+    "hinoki": "Woody", "cypress": "Woody", "pine": "Woody", "fir": "Woody", "fir needle": "Woody",
+    "rosewood": "Woody", "birch": "Woody", "oakwood": "Woody", "cashmeran": "Woody",
+    "iso e super": "Woody", "teakwood": "Woody", "coniferous": "Woody", "bois": "Woody",
+    "bornafix": "Woody", "andrane": "Woody", "blackwood": "Woody", "boisiris": "Woody", 
+    "bacdanol": "Woody", "sanjinol": "Woody", "cedrene": "Woody", "cedrol": "Woody",
+    "cedroxyde": "Woody", "cedryl": "Woody", "cedramber": "Woody", "clearwood": "Woody",
+    "coniferan": "Woody", "costausol": "Woody", "dreamwood": "Woody", "ebanol": "Woody",
+    "firsantol": "Woody", "guaiene": "Woody", "guaiol": "Woody", "koavone": "Woody",
+    "kohinool": "Woody", "madranol": "Woody", "norlimbanol": "Woody", "orinox": "Woody",
+    "osyrol": "Woody", "polysantol": "Woody", "timberol": "Woody", "trimofix": "Woody",
+    "vertofix": "Woody", "vetikone": "Woody", "ysamber": "Woody", "z11": "Woody",
+    "precious wood": "Woody",
+
+    # Floral
+    "rose": "Floral", "rosy": "Floral", "jasmine": "Floral", "jasmin": "Floral", "lily": "Floral", "lilly": "Floral", 
+    "lilac": "Floral", "lavender": "Floral", "tuberose": "Floral", "ylang ylang": "Floral", "ylang-ylang": "Floral",
+    "gardenia": "Floral", "peony": "Floral", "freesia": "Floral", "magnolia": "Floral",
+    "orange blossom": "Floral", "frangipani": "Floral", "violet": "Floral", "violettyne": "Floral",
+    "iris": "Floral", "orris": "Floral", "geranium": "Floral", "carnation": "Floral", 
+    "mimosa": "Floral", "osmanthus": "Floral", "honeysuckle": "Floral", "chamomile": "Floral",
+    "muguet": "Floral", "ionone": "Floral", "hawthorn": "Floral", "heliotrope": "Floral", "heliotropine": "Floral",
+    "orange flower": "Floral", "auralva": "Floral", "boronal": "Floral", "lilybelle": "Floral", "lilyflore": "Floral", "lilytol": "Floral",
+    "benzyl acetate": "Floral", "benzyl salicylate": "Floral", "amyl cinnamic aldehyde": "Floral",
+    "carbinol muguet": "Floral", "cyclamen": "Floral", "cyclemax": "Floral",
+    "cyclomethylene citronellol": "Floral", "cyclopidene": "Floral", "damascone": "Floral", 
+    "damascol": "Floral", "delphol": "Floral", "dihydro ionone beta": "Floral", 
+    "dimethyl benzyl carbinol": "Floral", "dupical": "Floral", "coranol": "Floral", 
+    "corps iris": "Floral", "floralol": "Floral", "floralozone": "Floral", "florhydral": "Floral",
+    "florocyclene": "Floral", "floropal": "Floral", "florosa": "Floral", "givescone": "Floral",
+    "glycolierral": "Floral", "hedione": "Floral", "jasmacyclene": "Floral", "jessemal": "Floral",
+    "kharismal": "Floral", "linalool": "Floral", "mayol": "Floral", "meijiff": "Floral",
+    "melafleur": "Floral", "methyl anthranilate": "Floral", "methyl dihydro jasmonate": "Floral",
+    "methyl ionone": "Floral", "methyl tuberate": "Floral", "muguet alcohol": "Floral",
+    "myraldyl acetate": "Floral", "narcisse": "Floral", "nerolione": "Floral", "neryl acetate": "Floral",
+    "nympheal": "Floral", "peomosa": "Floral", "peonile": "Floral", "phenethyl alcohol": "Floral",
+    "phenoxanol": "Floral", "phenyl propyl alcohol": "Floral", "rhodinol": "Floral", "rosalva": "Floral",
+    "rosamusk": "Floral", "rosaphen": "Floral", "rose crystals": "Floral", "rose oxide": "Floral",
+    "rosyrane": "Floral", "silvial": "Floral", "starfleur": "Floral", "syringa": "Floral",
+    "tubereuse": "Floral", "ylang oliffac": "Floral",
+
+    # Bases & Accords
+    "accord": "Bases & Accords", "base": "Bases & Accords", "compound": "Bases & Accords",
+    "specialty base": "Bases & Accords", "reconstitution": "Bases & Accords", "fixative base": "Bases & Accords",
+    "key accord": "Bases & Accords", "oliffac": "Bases & Accords", "timbrox base": "Bases & Accords",
+
+    # Spicy
+    "spice": "Spicy", "spicy": "Spicy", "cinnamon": "Spicy", "cinnamic": "Spicy", "clove": "Spicy", "clove bud": "Spicy",
+    "pepper": "Spicy", "peppercorn": "Spicy", "cardamom": "Spicy", "ginger": "Spicy", "nutmeg": "Spicy",
+    "coriander": "Spicy", "pimento": "Spicy", "saffron": "Spicy", "anise": "Spicy", "herbs and spices": "Spicy",
+    "anisic": "Spicy", "carvacrol": "Spicy", "carvone": "Spicy", "caryophyllene": "Spicy", 
+    "dihydro eugenol": "Spicy", "eugenol": "Spicy", "eugenyl acetate": "Spicy",
+    "cuminyl": "Spicy", "methyl eugenol": "Spicy", "methyl isoeugenol": "Spicy",
+    "poivrol": "Spicy", "prismantol": "Spicy", "safraleine": "Spicy", "safranal": "Spicy",
+    "valspice": "Spicy", "veraspice": "Spicy", "zingerone": "Spicy", "thymol": "Spicy", 
+
+    # Resinous & Balsamic
+    "resin": "Resinous & Balsamic", "resinous": "Resinous & Balsamic", "balsam": "Resinous & Balsamic", "balsamic": "Resinous & Balsamic",
+    "frankincense": "Resinous & Balsamic", "olibanum": "Resinous & Balsamic",
+    "myrrh": "Resinous & Balsamic", "benzoin": "Resinous & Balsamic",
+    "labdanum": "Resinous & Balsamic", "cistus": "Resinous & Balsamic", "dynamone": "Resinous & Balsamic",
+    "elemi": "Resinous & Balsamic", "opoponax": "Resinous & Balsamic",
+    "peru balsam": "Resinous & Balsamic", "tolu balsam": "Resinous & Balsamic", "styrax": "Resinous & Balsamic",
+    "benzyl cinnamate": "Resinous & Balsamic", "coumarex": "Resinous & Balsamic", 
+    "cyclohexyl salicylate": "Resinous & Balsamic", "gurjun balsam": "Resinous & Balsamic",
+    "hydrocarboresine": "Resinous & Balsamic",
+
+    # Fruity
+    "fruit": "Fruity", "fruity": "Fruity", "berry": "Fruity", "berries": "Fruity", "red fruit": "Fruity",
+    "peach": "Fruity", "apple": "Fruity", "pear": "Fruity", "plum": "Fruity",
+    "apricot": "Fruity", "fig": "Fruity", "blackcurrant": "Fruity", "cassis": "Fruity",
+    "raspberry": "Fruity", "strawberry": "Fruity", "mango": "Fruity", "passionfruit": "Fruity",
+    "pineapple": "Fruity", "davana": "Fruity", "cherry": "Fruity", "cranberry": "Fruity",
+    "buchu leaf": "Fruity", "frambinon": "Fruity", "raspberry ketone": "Fruity",
+    "allyl amyl glycolate": "Fruity", "allyl caproate": "Fruity", "amyl acetate": "Fruity", 
+    "amyl butyrate": "Fruity", "apritone": "Fruity", "berryflor": "Fruity", 
+    "bisabolene": "Fruity", "fructalate": "Fruity", "cassiffix": "Fruity", "cassione": "Fruity",
+    "citronellyl formate": "Fruity", "cyclabute": "Fruity", "datilat": "Fruity", 
+    "diethyl malonate": "Fruity", "dimethyl benzyl carbinyl acetate": "Fruity", 
+    "dimethyl benzyl carbinyl butyrate": "Fruity", "dimethyl octenone": "Fruity", 
+    "dynascone": "Fruity", "ethyl levulinate": "Fruity", "ethyl acetate": "Fruity",
+    "ethyl butyrate": "Fruity", "ethyl caprate": "Fruity", "ethyl heptoate": "Fruity",
+    "ethyl isobutyrate": "Fruity", "ethyl methyl-2-butyrate": "Fruity", "ethyl propionate": "Fruity",
+    "ethyl safranate": "Fruity", "fraise": "Fruity", "fraistone": "Fruity", "framboise": "Fruity",
+    "fruit sec": "Fruity", "fruitaleur": "Fruity", "grape butyrate": "Fruity", "guavanate": "Fruity",
+    "hexalon": "Fruity", "hexyl acetate": "Fruity", "isopropyl methyl-2-butyrate": "Fruity",
+    "manzanate": "Fruity", "nectarate": "Fruity", "nectaryl": "Fruity", "pharaone": "Fruity",
+    "prenyl acetate": "Fruity", "prunella": "Fruity", "pyroprunat": "Fruity",
+    "rhubofix": "Fruity", "sauvignone": "Fruity", "sultanene": "Fruity", "veloutone": "Fruity",
+    "vetikolacetat": "Fruity",
+
+    # Green & Herbal
+    "green": "Green & Herbal", "herbal": "Green & Herbal", "leaf": "Green & Herbal", "leaves": "Green & Herbal", "leafy": "Green & Herbal",
+    "grass": "Green & Herbal", "grassy": "Green & Herbal", "basil": "Green & Herbal", "mint": "Green & Herbal", "spearmint": "Green & Herbal", "peppermint": "Green & Herbal", "minty": "Green & Herbal",
+    "rosemary": "Green & Herbal", "thyme": "Green & Herbal", "sage": "Green & Herbal", "clary sage": "Green & Herbal",
+    "galbanum": "Green & Herbal", "artemisia": "Green & Herbal", "eucalyptus": "Green & Herbal", "eucalyptol": "Green & Herbal",
+    "tea": "Green & Herbal", "tomato leaf": "Green & Herbal", "helichrysum": "Green & Herbal", 
+    "agrestic": "Green & Herbal", "camphoraceous": "Green & Herbal", "borneol": "Green & Herbal", "camphene": "Green & Herbal",
+    "buchu": "Green & Herbal", "anther": "Green & Herbal", "apo patchone coeur": "Green & Herbal",
+    "canthoxal": "Green & Herbal", "carene": "Green & Herbal", "cis-3-hexenyl tiglate": "Green & Herbal",
+    "cyclogalbanate": "Green & Herbal", "cyclal c": "Green & Herbal", "triplal": "Green & Herbal", 
+    "dimetol": "Green & Herbal", "dimethyl hydroquinone": "Green & Herbal", "diphenyl oxide": "Green & Herbal",
+    "cucumber": "Green & Herbal", "farnesene": "Green & Herbal", "fenchol": "Green & Herbal",
+    "folione": "Green & Herbal", "freskomenthe": "Green & Herbal", "herboxane": "Green & Herbal",
+    "hexenol": "Green & Herbal", "isocyclocitral": "Green & Herbal", "ivy": "Green & Herbal",
+    "linalool oxide": "Green & Herbal", "liffarome": "Green & Herbal", "mintonat": "Green & Herbal",
+    "myrac aldehyde": "Green & Herbal", "myrcene": "Green & Herbal", "neofolione": "Green & Herbal",
+    "nonadienal": "Green & Herbal", "ocimene": "Green & Herbal", "phellandrene": "Green & Herbal",
+    "pino acetaldehyde": "Green & Herbal", "stemone": "Green & Herbal", "syringa aldehyde": "Green & Herbal",
+    "syvertal": "Green & Herbal", "terpinene": "Green & Herbal", "terpineol": "Green & Herbal",
+    "terpinolene": "Green & Herbal", "toscanol": "Green & Herbal", "trifernal": "Green & Herbal",
+    "undecavertol": "Green & Herbal", "vernaldehyde": "Green & Herbal",
+
+    # Musk
+    "musk": "Musk", "musky": "Musk", "ambrette": "Musk", "galaxolide": "Musk",
+    "tonalide": "Musk", "habanolide": "Musk", "ethylene brassylate": "Musk", "ambrettolide": "Musk",
+    "helvetolide": "Musk", "exaltolide": "Musk", "scentolide": "Musk", "ambrettex": "Musk",
+    "aurelione": "Musk", "celestolide": "Musk", "cosmone": "Musk", "civettone": "Musk",
+    "edenolide": "Musk", "exaltenone": "Musk", "exaltone": "Musk", "fixolide": "Musk",
+    "globacenide": "Musk", "globanone": "Musk", "isomuscone": "Musk", "muscenone": "Musk",
+    "muscone": "Musk", "musk ketone": "Musk", "musk r1": "Musk", "pentalide": "Musk",
+    "romandolide": "Musk", "silvanone": "Musk", "tonquitone": "Musk", "traseolide": "Musk",
+    "velvione": "Musk", "zenolide": "Musk",
+
+    # Amber
+    "amber": "Amber", "ambroxan": "Amber", "cetalox": "Amber", "ambergris": "Amber", "ambrox": "Amber",
+    "ambrox super": "Amber", "bornafix": "Amber", "amber xtreme": "Amber", "ambercore": "Amber", 
+    "ambermax": "Amber", "amberwood": "Amber", "ambrocenide": "Amber", "ambrox dl": "Amber", 
+    "aldambre": "Amber", "dihydro ambrate": "Amber", "dynamone": "Amber", "fixamber": "Amber",
+    "grisalva": "Amber", "karmawood": "Amber", "kephalis": "Amber", "kohinool": "Amber",
+    "norlimbanol": "Amber", "okoumal": "Amber", "oxyoctaline formate": "Amber", "sylvamber": "Amber",
+    "timberol": "Amber", "tobacarol": "Amber", "trisamber": "Amber",
+
+    # Aquatic & Ozonic
+    "aquatic": "Aquatic & Ozonic", "marine": "Aquatic & Ozonic", "oceanic": "Aquatic & Ozonic", "ozonic": "Aquatic & Ozonic", "ozone": "Aquatic & Ozonic",
+    "calone": "Aquatic & Ozonic", "seaweed": "Aquatic & Ozonic", "salt": "Aquatic & Ozonic", "water": "Aquatic & Ozonic", "watery": "Aquatic & Ozonic",
+    "seashore": "Aquatic & Ozonic", "adoxal": "Aquatic & Ozonic", "aquaflora": "Aquatic & Ozonic", 
+    "aquamate": "Aquatic & Ozonic", "cascalone": "Aquatic & Ozonic", "maritima": "Aquatic & Ozonic",
+    "ocean propanal": "Aquatic & Ozonic", "ozofleur": "Aquatic & Ozonic", "precyclemone": "Aquatic & Ozonic",
+    "scentenal": "Aquatic & Ozonic",
+
+    # Gourmand
+    "gourmand": "Gourmand", "vanilla": "Gourmand", "chocolate": "Gourmand", "caramel": "Gourmand", "cocoa": "Gourmand",
+    "tonka": "Gourmand", "tonka bean": "Gourmand", "coffee": "Gourmand", "coffee cake": "Gourmand",
+    "almond": "Gourmand", "honey": "Gourmand", "milk": "Gourmand", "sugar": "Gourmand", "brown sugar": "Gourmand", 
+    "cotton candy": "Gourmand", "praline": "Gourmand", "licorice": "Gourmand",
+    "madeleine": "Gourmand", "oatmeal": "Gourmand", "whiskey": "Gourmand", "cognac": "Gourmand", "boozy": "Gourmand", "boozy notes": "Gourmand",
+    "coumarin": "Gourmand", "acetanisole": "Gourmand", "anisyl acetone": "Gourmand", 
+    "azarbre": "Gourmand", "butyl butyro lactate": "Gourmand", "furaneol": "Gourmand",
+    "chocovan": "Gourmand", "dihydrocoumarin": "Gourmand", "espresso": "Gourmand",
+    "ethyl cyclopentenolone": "Gourmand", "ethyl maltol": "Gourmand", "ethyl vanillin": "Gourmand",
+    "homofuronol": "Gourmand", "isobutavan": "Gourmand", "jasminlactone": "Gourmand", 
+    "lactojasmone": "Gourmand", 
+    "levistamel": "Gourmand", "maltol": "Gourmand", "massoia lactone": "Gourmand", 
+    "methyl cyclo pentenolone": "Gourmand", "milk lactone": "Gourmand", 
+    "nuezate": "Gourmand", "sotolone": "Gourmand", "valeric acid": "Gourmand", 
+    "vanillin": "Gourmand", "whiskey lactone": "Gourmand", 
+
+    # Note Types
+    "top note": "Top Note", "head note": "Top Note",
+    "middle note": "Middle Note", "heart note": "Middle Note",
+    "base note": "Base Note", "fond": "Base Note", "dry down": "Base Note", "fixative": "Base Note",
+
+    # Olfactory Descriptors & Material Types
+    "aldehyde": "Aldehydic", "aldehydic": "Aldehydic", "agrumen aldehyde": "Aldehydic", "decanal": "Aldehydic", "undecylenic aldehyde": "Aldehydic", "lauric aldehyde": "Aldehydic", "mna": "Aldehydic", "hexanal": "Aldehydic",   
+    "cardamom aldehyde": "Aldehydic", "cyclamen aldehyde": "Aldehydic", "intreleven aldehyde": "Aldehydic", "mandarine aldehyde": "Aldehydic", "melon aldehyde": "Aldehydic", "myrac aldehyde": "Aldehydic", "phenyl acetaldehyde": "Aldehydic",
+    "lactone": "Lactonic", "nonalactone": "Lactonic", "undecalactone": "Lactonic", "octalactone": "Lactonic", "heptalactone": "Lactonic", "dodecalactone": "Lactonic", "bicyclononalactone": "Lactonic", "delta decalactone": "Lactonic", "delta undecalactone": "Lactonic", "gamma decalactone": "Lactonic", "gamma dodecalactone": "Lactonic", "gamma octalactone": "Lactonic", "methyl laitone": "Lactonic",
+    "creamy": "Lactonic", "milky": "Lactonic", "buttery": "Lactonic", 
+    
+    "molecule": "Aroma Chemicals",      
+    "aroma chemical": "Aroma Chemicals",
+    "scent molecule": "Aroma Chemicals",
+    "synthetic": "Aroma Chemicals", 
+    "crystals": "Aroma Chemicals", 
+
+    "iff": "Aroma Chemicals", 
+    "givaudan": "Aroma Chemicals",
+    "firmenich": "Aroma Chemicals",
+    "symrise": "Aroma Chemicals",
+    "takasago": "Aroma Chemicals",
+    "mane": "Aroma Chemicals",
+    "kao": "Aroma Chemicals",
+    "synarome": "Aroma Chemicals",
+    "bedoukian": "Aroma Chemicals",
+    "drt": "Aroma Chemicals",
+    "robertet": "Aroma Chemicals", 
+    "biolandes": "Aroma Chemicals",
+    "pfw": "Aroma Chemicals", "quest": "Aroma Chemicals", "kalama": "Aroma Chemicals",
+
+    "powdery": "Powdery",             
+    "leathery": "Leathery", "suederal": "Leathery",         
+    "animalic": "Animalic", "ambrinol": "Animalic", "civette": "Animalic", "costus": "Animalic", "indocolore": "Animalic", "indolarome": "Animalic", "indole": "Animalic", "skatole": "Animalic",
+    
+    "smoke": "Smoky & Incense",        
+    "smoky": "Smoky & Incense",
+    "incense": "Smoky & Incense", "bois dencens": "Smoky & Incense", "tabanon": "Smoky & Incense", 
+    "tobacco": "Smoky & Incense", "phenolic": "Smoky & Incense", "syringol": "Smoky & Incense",
+
+    "weird": "Unique & Niche", "sulfurous": "Unique & Niche", "yeasty": "Unique & Niche", "radish-like": "Unique & Niche", "acorn": "Unique & Niche",
+    "raw": "Raw Materials", 
+
+    "soapy": "Soapy & Clean",          
+    "clean": "Soapy & Clean",
+    "fresh": "Soapy & Clean", 
+
+    "earthy": "Earthy",                
+    "earth": "Earthy",
+    "damp": "Earthy",
+    "mushroom": "Earthy", "mushrooms": "Earthy", "matsutake": "Earthy",
+    "moss": "Earthy", "mossy": "Earthy", "oakmoss": "Earthy", 
+    "forest floor": "Earthy", "woodland": "Earthy", "terrasol": "Earthy", "soil": "Earthy",
+    "veramoss": "Earthy",
+
+    "metallic": "Metallic",            
+    "waxy": "Aldehydic", 
+    "fatty": "Aldehydic" 
+}
+FIELDS_TO_SCAN_FOR_KEYWORDS = ['name', 'description', 'odor_profile', 'notes']
+
+
+def _keyword_pattern(keyword):
+    escaped = re.escape(keyword)
+    return escaped if ' ' in keyword else rf'\b{escaped}\b'
+
+
+def _trie_pattern(keywords, word_boundary):
+    """Alternation for `keywords` nested by shared prefixes; longer keywords are preferred."""
+    trie = {}
+    for keyword in keywords:
+        node = trie
+        for char in keyword:
+            node = node.setdefault(char, {})
+        node[''] = True # End of a keyword
+
+    def build(node):
+        alternatives = [re.escape(char) + build(child) for char, child in sorted(node.items()) if char]
+        if '' in node:
+            alternatives.append(r'\b' if word_boundary else '') # Last, so longer matches win
+        if len(alternatives) == 1:
+            return alternatives[0]
+        return '(?:' + '|'.join(alternatives) + ')'
+
+    return build(trie) if trie else None
+
+
+class KeywordCategorizer:
+    """Finds the core categories whose keywords appear in a text, in one scan."""
+
+    def __init__(self, keyword_to_category=None):
+        if keyword_to_category is None:
+            keyword_to_category = KEYWORD_TO_CORE_CATEGORY
+        self._categories = {keyword.lower(): category for keyword, category in keyword_to_category.items()}
+        words = [keyword for keyword in self._categories if ' ' not in keyword]
+        phrases = [keyword for keyword in self._categories if ' ' in keyword]
+        alternatives = []
+        word_pattern = _trie_pattern(words, word_boundary=True)
+        if word_pattern:
+            alternatives.append(rf'\b{word_pattern}')
+        phrase_pattern = _trie_pattern(phrases, word_boundary=False)
+        if phrase_pattern:
+            alternatives.append(phrase_pattern)
+        # A lookahead finds a match starting at every position, so overlapping keywords are all seen
+        self._pattern = re.compile('(?=(' + '|'.join(alternatives) + '))') if alternatives else None
+
+        # Only one keyword is reported per position; keywords that are a prefix of it (or it of them)
+        # may match there too, and are checked individually
+        self._related = {}
+        for keyword in self._categories:
+            related = [
+                (other, re.compile(_keyword_pattern(other))) for other in self._categories
+                if other != keyword and (keyword.startswith(other) or other.startswith(keyword))
+            ]
+            if related:
+                self._related[keyword] = related
+
+    def category_for(self, keyword):
+        """Core category for an exact keyword, or None."""
+        return self._categories.get(str(keyword).lower())
+
+    def matches(self, text):
+        """{keyword: core category} for every keyword found in `text`, in order of appearance."""
+        found = {}
+        if self._pattern is None or not text:
+            return found
+        text = text.lower()
+        for match in self._pattern.finditer(text):
+            keyword = match.group(1)
+            found.setdefault(keyword, self._categories[keyword])
+            for other, pattern in self._related.get(keyword, ()):
+                if other not in found and pattern.match(text, match.start()):
+                    found[other] = self._categories[other]
+        return found
+
+    def categorize(self, text):
+        """{core category: first keyword that matched it} for `text`."""
+        categories = {}
+        for keyword, category in self.matches(text).items():
+            categories.setdefault(category, keyword)
+        return categories
+
+
+# Compiled once, when the module is first imported
+keyword_categorizer = KeywordCategorizer()
@@ -0,0 +1,51 @@
+# src/services/cost_propagation.py
+"""Keep stored formula totals in step with ingredient price changes.
+
+Formula.total_cost (and, for volume or drop lines, total_quantity and the line
+percentages) depends on each ingredient's price, pricing unit, density and drop
+volume. When a flush changes any of those on an existing ingredient, its id is
+noted. Just before the transaction commits, the formulas that use those
+ingredients are found through the formula_ingredient.ingredient_id index and
+recomputed in batches. Everything commits atomically with the price change.
+"""
+from sqlalchemy import event, inspect as sa_inspect
+from sqlalchemy.orm import Session
+from src.models.models import Ingredient
+from src.models import pending_changes
+from src.services.formula_calc import formula_ids_using, recompute_formula_totals
+
+COST_FIELDS = ('cost_per_unit', 'unit_of_measurement', 'density', 'drop_volume')
+
+_PENDING_KEY = 'formula_cost_pending'
+pending_changes.register(_PENDING_KEY)
+
+
+def _cost_inputs_changed(ingredient):
+    attrs = sa_inspect(ingredient).attrs
+    return any(attrs[field].history.has_changes() for field in COST_FIELDS)
+
+
+@event.listens_for(Session, 'after_flush')
+def _record_price_changes(session, flush_context):
+    for obj in session.dirty:
+        if isinstance(obj, Ingredient) and obj.id is not None and _cost_inputs_changed(obj):
+            session.info.setdefault(_PENDING_KEY, set()).add(obj.id)
+
+
+@event.listens_for(Session, 'before_commit')
+def _propagate_before_commit(session):
+    if pending_changes.is_nested_commit(session):
+        return # Propagated once, when the outer transaction commits
+    session.flush() # Make sure the last pending changes have gone through after_flush
+    ingredient_ids = session.info.pop(_PENDING_KEY, None)
+    if ingredient_ids:
+        propagate_ingredient_changes(ingredient_ids)
+
+
+
+def propagate_ingredient_changes(ingredient_ids):
+    """Recompute the totals of every formula that uses any of `ingredient_ids`. Returns the count updated."""
+    formula_ids = formula_ids_using(ingredient_ids)
+    if not formula_ids:
+        return 0
+    return recompute_formula_totals(sorted(formula_ids))
@@ -0,0 +1,219 @@
+# src/services/export.py
+"""Streaming exports.
+
+Rows are read with a `yield_per` server-side cursor and written out batch by
+batch, so memory use stays flat and the first bytes go out before the whole
+table has been read.
+
+Formulas are exported from one joined query that returns every line (ingredient
+and sub-formula lines) ordered by formula. Consecutive rows are grouped into one
+record per formula, so only a single formula is held in memory at a time.
+"""
+import csv
+import io
+import json
+import re
+import zipfile
+from sqlalchemy import select, union_all, literal, null
+from src.models.models import db, Formula, Ingredient, formula_ingredient, formula_component
+from src.services.formula_calc import formula_total_unit, load_formula_pricing
+from src.services.units import line_cost
+from src.utils.serializers import serialize_ingredients, chunked
+
+EXPORT_BATCH_SIZE = 1000
+
+
+def iter_ingredient_batches(fields, batch_size=EXPORT_BATCH_SIZE):
+    """Yield lists of serialized ingredient dicts, `batch_size` rows at a time, ordered by id."""
+    column_names = ['id'] + [f for f in fields if f != 'id' and f in Ingredient.__table__.columns]
+    # Plain rows rather than ORM objects: nothing accumulates in the session while streaming
+    statement = select(*(Ingredient.__table__.c[name] for name in column_names)).order_by(Ingredient.id)
+    result = db.session.execute(statement.execution_options(yield_per=batch_size))
+    for rows in result.partitions():
+        yield serialize_ingredients(rows, fields) # Categories for the batch in one query
+
+
+def ingredient_ndjson_chunks(fields, batch_size=EXPORT_BATCH_SIZE):
+    for items in iter_ingredient_batches(fields, batch_size):
+        yield ''.join(json.dumps(item, default=str) + '\n' for item in items)
+
+
+def _csv_value(field, value):
+    if field == 'categories':
+        return '; '.join(cat['name'] for cat in value)
+    return '' if value is None else value
+
+
+def ingredient_csv_chunks(fields, batch_size=EXPORT_BATCH_SIZE):
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+    writer.writerow(fields)
+    yield buffer.getvalue() # Header goes out before the first query finishes
+    for items in iter_ingredient_batches(fields, batch_size):
+        buffer.seek(0)
+        buffer.truncate()
+        writer.writerows([_csv_value(field, item[field]) for field in fields] for item in items)
+        yield buffer.getvalue()
+
+
+# --- Formulas ---
+
+FORMULA_EXPORT_FIELDS = (
+    'id', 'name', 'description', 'creator', 'version', 'is_draft', 'created_at', 'updated_at',
+    'total_quantity', 'total_cost', 'notes', 'product_category', 'dosage_percent'
+)
+FORMULA_CSV_HEADER = ('type', 'id', 'name', 'quantity', 'unit', 'percentage', 'cost', 'notes')
+
+
+def _formula_lines_statement(where):
+    """Ingredient lines UNION ALL sub-formula lines, with the owning formula's fields on every row."""
+    formula = Formula.__table__
+    ingredient = Ingredient.__table__
+    sub_formula = formula.alias('sub_formula')
+    header = [formula.c[name].label(f'f_{name}') for name in FORMULA_EXPORT_FIELDS]
+    # Outer joins keep formulas without ingredient lines (they come back as one row with a NULL line)
+    ingredient_lines = select(
+        *header, literal(0).label('is_component'), formula_ingredient.c.ingredient_id.label('ref_id'),
+        ingredient.c.name.label('ref_name'), formula_ingredient.c.quantity, formula_ingredient.c.unit,
+        formula_ingredient.c.percentage, formula_ingredient.c.notes, ingredient.c.cost_per_unit,
+        ingredient.c.unit_of_measurement, ingredient.c.density, ingredient.c.drop_volume
+    ).select_from(
+        formula.outerjoin(formula_ingredient, formula_ingredient.c.formula_id == formula.c.id)
+        .outerjoin(ingredient, ingredient.c.id == formula_ingredient.c.ingredient_id)
+    ).where(*where)
+    component_lines = select(
+        *header, literal(1).label('is_component'), formula_component.c.component_id.label('ref_id'),
+        sub_formula.c.name.label('ref_name'), formula_component.c.quantity, formula_component.c.unit,
+        formula_component.c.percentage, formula_component.c.notes, null(), null(), null(), null()
+    ).select_from(
+        formula.join(formula_component, formula_component.c.formula_id == formula.c.id)
+        .join(sub_formula, sub_formula.c.id == formula_component.c.component_id)
+    ).where(*where)
+    lines = union_all(ingredient_lines, component_lines).subquery()
+    return select(lines).order_by(lines.c.f_id, lines.c.is_component, lines.c.ref_id)
+
+
+def _formula_filters(formula_ids=None, search=None, is_draft=None):
+    """WHERE clauses for the export; with ids, one clause list per chunk of ids (in id order)."""
+    where = []
+    if search:
+        where.append(Formula.__table__.c.name.ilike(f'%{search}%'))
+    if is_draft is not None:
+        where.append(Formula.__table__.c.is_draft.is_(is_draft))
+    if formula_ids is None:
+        return [where]
+    return [where + [Formula.__table__.c.id.in_(id_chunk)] for id_chunk in chunked(sorted(set(formula_ids)))]
+
+
+def _start_formula_record(row):
+    record = {}
+    for name in FORMULA_EXPORT_FIELDS:
+        value = row._mapping[f'f_{name}']
+        record[name] = value.isoformat() if hasattr(value, 'isoformat') else value
+    record['ingredients'] = []
+    record['sub_formulas'] = []
+    return record
+
+
+def _finish_formula_record(record, component_pricing):
+    units = [line['unit'] for line in record['ingredients']] + [line['unit'] for line in record['sub_formulas']]
+    record['total_unit'] = formula_total_unit(units)
+    for line in record['sub_formulas']:
+        cost_per_unit, total_unit, _, _ = component_pricing.get(line['formula_id'], (None, None, None, None))
+        line['cost'] = line_cost(line['quantity'], line['unit'], cost_per_unit, total_unit)
+        line['base_unit_of_measurement'] = total_unit
+    return record
+
+
+def iter_formula_records(formula_ids=None, search=None, is_draft=None, batch_size=EXPORT_BATCH_SIZE):
+    """Yield one dict per formula (same shape as GET /api/formulas/<id>), ordered by id.
+
+    Lines come from one joined query (per 500 requested ids), read `batch_size` rows at a
+    time. Sub-formula prices are looked up once per batch for the sub-formulas it mentions.
+    """
+    component_pricing = {}
+    record = None
+    for where in _formula_filters(formula_ids, search, is_draft):
+        result = db.session.execute(_formula_lines_statement(where).execution_options(yield_per=batch_size))
+        for rows in result.partitions():
+            new_components = {row.ref_id for row in rows if row.is_component} - component_pricing.keys()
+            if new_components:
+                component_pricing.update(load_formula_pricing(new_components))
+            for row in rows:
+                if record is None or record['id'] != row.f_id:
+                    if record is not None:
+                        yield _finish_formula_record(record, component_pricing)
+                    record = _start_formula_record(row)
+                if row.ref_id is None:
+                    continue # Formula without ingredient lines
+                if row.is_component:
+                    record['sub_formulas'].append({
+                        'formula_id': row.ref_id, 'name': row.ref_name, 'quantity': row.quantity,
+                        'unit': row.unit, 'percentage': row.percentage, 'notes': row.notes
+                    })
+                else:
+                    record['ingredients'].append({
+                        'id': row.ref_id, 'name': row.ref_name, 'quantity': row.quantity, 'unit': row.unit,
+                        'percentage': row.percentage, 'notes': row.notes,
+                        'cost': line_cost(row.quantity, row.unit, row.cost_per_unit, row.unit_of_measurement,
+                                          row.density, row.drop_volume),
+                        'base_unit_of_measurement': row.unit_of_measurement
+                    })
+    if record is not None:
+        yield _finish_formula_record(record, component_pricing)
+
+
+def formula_ndjson_chunks(batch_size=EXPORT_BATCH_SIZE, **filters):
+    for record in iter_formula_records(batch_size=batch_size, **filters):
+        yield json.dumps(record, default=str) + '\n'
+
+
+def formula_csv(record):
+    """One formula as CSV: a row per ingredient or sub-formula line."""
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+    writer.writerow(FORMULA_CSV_HEADER)
+    for kind, id_key, lines in (('ingredient', 'id', record['ingredients']), ('sub_formula', 'formula_id', record['sub_formulas'])):
+        writer.writerows([
+            kind, line[id_key], line['name'], line['quantity'], line['unit'],
+            '' if line['percentage'] is None else line['percentage'],
+            '' if line['cost'] is None else line['cost'], line['notes'] or ''
+        ] for line in lines)
+    return buffer.getvalue()
+
+
+class _ZipSink(io.RawIOBase):
+    """Write-only target for ZipFile that hands the bytes written so far back to the caller."""
+
+    def __init__(self):
+        super().__init__()
+        self._chunks = []
+
+    def writable(self):
+        return True
+
+    def write(self, data):
+        self._chunks.append(bytes(data))
+        return len(data)
+
+    def take(self):
+        data = b''.join(self._chunks)
+        self._chunks.clear()
+        return data
+
+
+def _archive_name(record, extension):
+    slug = re.sub(r'[^A-Za-z0-9]+', '-', record['name'] or '').strip('-')[:50] or 'formula'
+    return f"{record['id']}-{slug}.{extension}"
+
+
+def formula_zip_chunks(file_format='json', batch_size=EXPORT_BATCH_SIZE, **filters):
+    """Stream a zip with one JSON or CSV file per formula; each file is sent as soon as it is compressed."""
+    sink = _ZipSink()
+    # ZipFile falls back to data descriptors on a non-seekable target, so nothing is rewritten later
+    with zipfile.ZipFile(sink, 'w', compression=zipfile.ZIP_DEFLATED) as archive:
+        for record in iter_formula_records(batch_size=batch_size, **filters):
+            content = formula_csv(record) if file_format == 'csv' else json.dumps(record, default=str, indent=2)
+            archive.writestr(_archive_name(record, file_format), content)
+            yield sink.take()
+    yield sink.take() # Central directory
@@ -0,0 +1,413 @@
+# src/services/formula_calc.py
+"""Formula totals, costs and percentages, computed in one pass.
+
+All ingredient ids referenced by a formula are resolved with a single IN query
+per chunk, and the association rows are written with one executemany insert,
+so saving a formula costs a fixed number of round trips regardless of its size.
+
+Lines may use different units. When every line is a mass, volume or drop unit,
+quantities are converted to grams (see units.py) and percentages are by weight,
+with `total_quantity` in grams. A formula written entirely in one non-physical
+unit ('parts', '%') is totalled in that unit. Line costs are converted into the
+unit each ingredient is priced in.
+
+A line can also use another formula (an accord) through `formula_component`.
+Such a line is priced from the sub-formula's stored totals, as if the accord
+were an ingredient costing total_cost / total_quantity per unit of its total.
+Because of that, recomputing a formula also recomputes every formula that
+contains it, children before parents.
+"""
+from collections import defaultdict
+from sqlalchemy import bindparam, func, select, update
+from src.models.models import db, Formula, Ingredient, formula_ingredient, formula_component
+from src.services import formula_events
+from src.services.units import canonical_unit, is_physical, to_grams, line_cost
+from src.utils.serializers import chunked
+
+RECOMPUTE_BATCH_SIZE = 200 # Formulas recomputed per batch when ingredient data changes
+
+
+class FormulaInputError(ValueError):
+    """Raised when formula lines reference unknown ingredients or carry bad values."""
+
+    def __init__(self, message, unknown_ids=(), duplicate_ids=(), unknown_formula_ids=(), duplicate_formula_ids=()):
+        super().__init__(message)
+        self.unknown_ids = sorted(unknown_ids)
+        self.duplicate_ids = sorted(duplicate_ids)
+        self.unknown_formula_ids = sorted(unknown_formula_ids)
+        self.duplicate_formula_ids = sorted(duplicate_formula_ids)
+
+    def to_dict(self):
+        result = {'error': str(self)}
+        if self.unknown_ids:
+            result['unknown_ingredient_ids'] = self.unknown_ids
+        if self.duplicate_ids:
+            result['duplicate_ingredient_ids'] = self.duplicate_ids
+        if self.unknown_formula_ids:
+            result['unknown_formula_ids'] = self.unknown_formula_ids
+        if self.duplicate_formula_ids:
+            result['duplicate_formula_ids'] = self.duplicate_formula_ids
+        return result
+
+
+class FormulaCalculation:
+    """Result of calculate_formula(): totals plus rows ready for formula_ingredient."""
+
+    def __init__(self, total_quantity, total_unit, total_cost, lines, unpriced_ids=(), components=(),
+                 unpriced_component_ids=()):
+        self.total_quantity = total_quantity
+        self.total_unit = total_unit
+        self.total_cost = total_cost
+        self.lines = lines # [{'ingredient_id', 'quantity', 'unit', 'percentage', 'notes'}]
+        self.components = list(components) # [{'component_id', 'quantity', 'unit', 'percentage', 'notes'}]
+        self.unpriced_ids = sorted(unpriced_ids) # Priced ingredients whose line unit can't be converted to the price unit
+        self.unpriced_component_ids = sorted(unpriced_component_ids)
+
+    def apply_to(self, formula):
+        formula.total_quantity = self.total_quantity
+        formula.total_cost = self.total_cost
+        formula.ingredient_count = len(self.lines) + len(self.components)
+
+    def summary(self):
+        result = {'total_quantity': self.total_quantity, 'total_unit': self.total_unit, 'total_cost': self.total_cost}
+        if self.unpriced_ids:
+            result['unpriced_ingredient_ids'] = self.unpriced_ids
+        if self.unpriced_component_ids:
+            result['unpriced_formula_ids'] = self.unpriced_component_ids
+        return result
+
+
+def _parse_lines(ingredients_input):
+    """Validate raw request lines; returns [(is_component, id, quantity, line)].
+
+    A line with 'formula_id' uses that formula as a sub-formula, otherwise 'id' is an ingredient id.
+    """
+    parsed = []
+    seen, duplicates = {False: set(), True: set()}, {False: set(), True: set()}
+    for position, line in enumerate(ingredients_input):
+        if not isinstance(line, dict):
+            raise FormulaInputError(f'Ingredient line {position + 1} must be an object')
+        is_component = line.get('formula_id') is not None
+        try:
+            ref_id = int(line.get('formula_id') if is_component else line.get('id'))
+        except (TypeError, ValueError):
+            raise FormulaInputError(f'Ingredient line {position + 1} has an invalid id')
+        try:
+            quantity = float(line.get('quantity') or 0)
+        except (TypeError, ValueError):
+            raise FormulaInputError(f'Ingredient line {position + 1} has an invalid quantity')
+        if ref_id in seen[is_component]:
+            duplicates[is_component].add(ref_id)
+        seen[is_component].add(ref_id)
+        parsed.append((is_component, ref_id, quantity, line))
+    if duplicates[False] or duplicates[True]:
+        raise FormulaInputError(
+            'Each ingredient and sub-formula may appear only once per formula',
+            duplicate_ids=duplicates[False], duplicate_formula_ids=duplicates[True]
+        )
+    return parsed
+
+
+def load_ingredient_pricing(ingredient_ids):
+    """Map ingredient id -> (cost_per_unit, unit_of_measurement, density, drop_volume), one query per chunk of ids."""
+    pricing = {}
+    for id_chunk in chunked(set(ingredient_ids)):
+        rows = db.session.query(
+            Ingredient.id, Ingredient.cost_per_unit, Ingredient.unit_of_measurement,
+            Ingredient.density, Ingredient.drop_volume
+        ).filter(Ingredient.id.in_(id_chunk))
+        for ingredient_id, cost_per_unit, unit, density, drop_volume in rows:
+            pricing[ingredient_id] = (cost_per_unit, unit, density, drop_volume)
+    return pricing
+
+
+def formula_total_units(formula_ids):
+    """Map formula id -> unit its total_quantity is in, from the units of its lines (two queries per chunk)."""
+    formula_ids = set(formula_ids)
+    units = defaultdict(set)
+    for id_chunk in chunked(formula_ids):
+        for table in (formula_ingredient, formula_component):
+            rows = db.session.execute(select(table.c.formula_id, table.c.unit).where(
+                table.c.formula_id.in_(id_chunk)
+            ).distinct())
+            for formula_id, unit in rows:
+                units[formula_id].add(unit)
+    return {formula_id: formula_total_unit(units.get(formula_id, ())) for formula_id in formula_ids}
+
+
+def _component_pricing(total_quantity, total_cost, total_unit):
+    # A sub-formula is priced like an ingredient: cost per unit of its total, at water-like density
+    cost_per_unit = (total_cost or 0) / total_quantity if total_quantity else None
+    return (cost_per_unit, total_unit, None, None)
+
+
+def load_formula_pricing(formula_ids):
+    """Map formula id -> pricing tuple (as load_ingredient_pricing) for formulas used as sub-formulas."""
+    formula_ids = set(formula_ids)
+    total_units = formula_total_units(formula_ids)
+    pricing = {}
+    for id_chunk in chunked(formula_ids):
+        rows = db.session.query(Formula.id, Formula.total_quantity, Formula.total_cost).filter(Formula.id.in_(id_chunk))
+        for formula_id, total_quantity, total_cost in rows:
+            pricing[formula_id] = _component_pricing(total_quantity, total_cost, total_units[formula_id])
+    return pricing
+
+
+def _line_unit(line, base_unit):
+    unit = line.get('unit') or base_unit or 'g'
+    return canonical_unit(unit) or str(unit).strip()
+
+
+def formula_total_unit(units):
+    """Unit `total_quantity` is expressed in for a formula whose lines use `units`."""
+    units = {canonical_unit(unit) or unit for unit in units}
+    if len(units) == 1 and not is_physical(next(iter(units))):
+        return units.pop()
+    return 'g'
+
+
+def _total_lines(entries, strict=True):
+    """Totals for [(ingredient_id, quantity, unit, pricing)] lines with canonical units.
+
+    Returns (total_quantity, total_cost, percentages, unpriced line positions). Mixing non-physical
+    units with others raises FormulaInputError, or with `strict=False` falls back to
+    summing raw quantities (for formulas saved before unit conversion existed).
+    """
+    units = [unit for _, _, unit, _ in entries]
+    if all(is_physical(unit) for unit in units):
+        amounts = to_grams(
+            (quantity, unit, pricing[2], pricing[3]) for _, quantity, unit, pricing in entries
+        )
+    elif len(set(units)) == 1 or not strict:
+        amounts = [quantity for _, quantity, _, _ in entries] # Same unit throughout: nothing to convert
+    else:
+        mixed = sorted(unit for unit in set(units) if not is_physical(unit))
+        raise FormulaInputError(f"Unit(s) {', '.join(mixed)} cannot be combined with other units in one formula")
+
+    total_quantity = sum(amounts)
+    total_cost = 0
+    unpriced = set()
+    for position, (_, quantity, unit, (cost_per_unit, base_unit, density, drop_volume)) in enumerate(entries):
+        cost = line_cost(quantity, unit, cost_per_unit, base_unit, density, drop_volume)
+        if cost is not None:
+            total_cost += cost
+        elif cost_per_unit is not None:
+            unpriced.add(position)
+    percentages = [(amount / total_quantity * 100) if total_quantity > 0 else 0 for amount in amounts]
+    return total_quantity, total_cost, percentages, unpriced
+
+
+def calculate_formula(ingredients_input):
+    """Resolve, validate and total a list of {'id' or 'formula_id', 'quantity', 'unit', 'notes'} lines.
+
+    Raises FormulaInputError listing every unknown ingredient and formula id rather than
+    skipping them, and when non-physical units ('parts', 'ea', ...) are mixed with other units.
+    Cycles through sub-formulas are not checked here (see formula_explosion.check_acyclic).
+    """
+    parsed = _parse_lines(ingredients_input)
+    pricing = {
+        False: load_ingredient_pricing(ref_id for is_component, ref_id, _, _ in parsed if not is_component),
+        True: load_formula_pricing(ref_id for is_component, ref_id, _, _ in parsed if is_component)
+    }
+    unknown = {False: set(), True: set()}
+    for is_component, ref_id, _, _ in parsed:
+        if ref_id not in pricing[is_component]:
+            unknown[is_component].add(ref_id)
+    if unknown[False] or unknown[True]:
+        message = 'Unknown ingredient id(s)' if not unknown[True] else 'Unknown ingredient or formula id(s)'
+        raise FormulaInputError(message, unknown_ids=unknown[False], unknown_formula_ids=unknown[True])
+
+    entries = [
+        (ref_id, quantity, _line_unit(line, pricing[is_component][ref_id][1]), pricing[is_component][ref_id])
+        for is_component, ref_id, quantity, line in parsed
+    ]
+    total_quantity, total_cost, percentages, unpriced = _total_lines(entries)
+    lines, components = [], []
+    for (ref_id, quantity, unit, _), (is_component, _, _, line), percentage in zip(entries, parsed, percentages):
+        row = {'quantity': quantity, 'unit': unit, 'percentage': percentage, 'notes': line.get('notes', '')}
+        if is_component:
+            components.append(dict(row, component_id=ref_id))
+        else:
+            lines.append(dict(row, ingredient_id=ref_id))
+    units = [unit for _, _, unit, _ in entries]
+    return FormulaCalculation(
+        total_quantity, formula_total_unit(units), total_cost, lines,
+        unpriced_ids={entries[position][0] for position in unpriced if not parsed[position][0]},
+        components=components,
+        unpriced_component_ids={entries[position][0] for position in unpriced if parsed[position][0]}
+    )
+
+
+def insert_formula_lines(formula_id, lines, components=()):
+    """Write association rows for `formula_id` with a single executemany insert per table."""
+    formula_events.mark_changed({formula_id})
+    if lines:
+        db.session.execute(formula_ingredient.insert(), [dict(line, formula_id=formula_id) for line in lines])
+    if components:
+        db.session.execute(formula_component.insert(), [dict(line, formula_id=formula_id) for line in components])
+
+
+def count_formula_lines(formula_ids):
+    """Map formula id -> number of lines (ingredients and sub-formulas), one grouped query per table and chunk."""
+    counts = {formula_id: 0 for formula_id in formula_ids}
+    for id_chunk in chunked(list(counts.keys())):
+        for table in (formula_ingredient, formula_component):
+            rows = db.session.query(
+                table.c.formula_id, func.count()
+            ).filter(table.c.formula_id.in_(id_chunk)).group_by(table.c.formula_id)
+            for formula_id, count in rows:
+                counts[formula_id] += count
+    return counts
+
+
+def formula_ids_using(ingredient_ids):
+    """Ids of formulas that contain any of `ingredient_ids`."""
+    formula_ids = set()
+    for id_chunk in chunked(ingredient_ids):
+        formula_ids.update(formula_id for (formula_id,) in db.session.query(
+            formula_ingredient.c.formula_id
+        ).filter(formula_ingredient.c.ingredient_id.in_(id_chunk)).distinct())
+    return formula_ids
+
+
+def formula_ids_containing(component_ids):
+    """Ids of formulas that use any of `component_ids` as a sub-formula (direct parents only)."""
+    formula_ids = set()
+    for id_chunk in chunked(component_ids):
+        formula_ids.update(formula_id for (formula_id,) in db.session.query(
+            formula_component.c.formula_id
+        ).filter(formula_component.c.component_id.in_(id_chunk)).distinct())
+    return formula_ids
+
+
+def _dependency_layers(formula_ids):
+    """`formula_ids` plus every formula containing them, as layers where sub-formulas come before their parents.
+
+    One query per nesting level (and chunk). Formulas caught in a cycle go in a final layer.
+    """
+    all_ids = set(formula_ids)
+    children = defaultdict(set) # parent id -> sub-formulas among all_ids
+    frontier = set(all_ids)
+    while frontier:
+        parents = set()
+        for id_chunk in chunked(frontier):
+            rows = db.session.query(formula_component.c.formula_id, formula_component.c.component_id).filter(
+                formula_component.c.component_id.in_(id_chunk)
+            )
+            for parent_id, component_id in rows:
+                children[parent_id].add(component_id)
+                parents.add(parent_id)
+        frontier = parents - all_ids
+        all_ids |= frontier
+
+    layers, done = [], set()
+    remaining = set(all_ids)
+    while remaining:
+        layer = {formula_id for formula_id in remaining if not (children[formula_id] - done - {formula_id})}
+        if not layer:
+            layer = remaining # Cycle: nothing left without pending sub-formulas
+        layers.append(sorted(layer))
+        done |= layer
+        remaining -= layer
+    return layers
+
+
+def recompute_parent_totals(formula_ids):
+    """Recompute formulas containing `formula_ids` as sub-formulas, after those changed in this session."""
+    parent_ids = formula_ids_containing(formula_ids)
+    if not parent_ids:
+        return 0
+    db.session.flush() # Parents are priced from the sub-formulas' stored totals
+    return recompute_formula_totals(parent_ids)
+
+
+def recompute_formula_totals(formula_ids=None, batch_size=RECOMPUTE_BATCH_SIZE):
+    """Recompute stored totals, line percentages and ingredient_count for existing formulas.
+
+    Used when the inputs change outside the formula routes: ingredient prices, units
+    or densities, deleted ingredients, or changed sub-formulas. `formula_ids=None` means
+    every formula. Formulas that contain the given ones are recomputed too, after them.
+    Formulas are processed `batch_size` at a time. Each batch takes one query for its
+    ingredient lines and one for its sub-formula lines (plus two for the sub-formulas'
+    units, if it has any), then one executemany UPDATE per table. Returns the number of
+    formulas updated.
+    """
+    if formula_ids is None:
+        formula_ids = [formula_id for (formula_id,) in db.session.query(Formula.id)]
+    updated = 0
+    for layer in _dependency_layers(formula_ids):
+        updated += _recompute_layer(layer, batch_size)
+    return updated
+
+
+def _recompute_layer(formula_ids, batch_size):
+    formula_table = Formula.__table__
+    update_formula = update(formula_table).where(formula_table.c.id == bindparam('b_formula_id')).values(
+        total_quantity=bindparam('total_quantity'), total_cost=bindparam('total_cost'),
+        ingredient_count=bindparam('ingredient_count')
+    )
+    update_line = update(formula_ingredient).where(
+        formula_ingredient.c.formula_id == bindparam('b_formula_id'),
+        formula_ingredient.c.ingredient_id == bindparam('b_ingredient_id')
+    ).values(percentage=bindparam('percentage'))
+    update_component = update(formula_component).where(
+        formula_component.c.formula_id == bindparam('b_formula_id'),
+        formula_component.c.component_id == bindparam('b_component_id')
+    ).values(percentage=bindparam('percentage'))
+
+    updated = 0
+    for id_chunk in chunked(formula_ids, batch_size):
+        entries_by_formula = {formula_id: [] for formula_id in id_chunk}
+        components_by_formula = {formula_id: [] for formula_id in id_chunk}
+        rows = db.session.query(
+            formula_ingredient.c.formula_id, formula_ingredient.c.ingredient_id,
+            formula_ingredient.c.quantity, formula_ingredient.c.unit,
+            Ingredient.cost_per_unit, Ingredient.unit_of_measurement, Ingredient.density, Ingredient.drop_volume
+        ).join(Ingredient, Ingredient.id == formula_ingredient.c.ingredient_id).filter(
+            formula_ingredient.c.formula_id.in_(id_chunk)
+        )
+        for formula_id, ingredient_id, quantity, unit, cost_per_unit, base_unit, density, drop_volume in rows:
+            entries_by_formula[formula_id].append((
+                ingredient_id, quantity or 0, canonical_unit(unit) or unit,
+                (cost_per_unit, base_unit, density, drop_volume)
+            ))
+        component_rows = db.session.query(
+            formula_component.c.formula_id, formula_component.c.component_id,
+            formula_component.c.quantity, formula_component.c.unit,
+            Formula.total_quantity, Formula.total_cost
+        ).join(Formula, Formula.id == formula_component.c.component_id).filter(
+            formula_component.c.formula_id.in_(id_chunk)
+        ).all()
+        component_units = formula_total_units({row.component_id for row in component_rows}) if component_rows else {}
+        for formula_id, component_id, quantity, unit, sub_total, sub_cost in component_rows:
+            components_by_formula[formula_id].append((
+                component_id, quantity or 0, canonical_unit(unit) or unit,
+                _component_pricing(sub_total, sub_cost, component_units[component_id])
+            ))
+
+        formula_params, line_params, component_params = [], [], []
+        for formula_id, entries in entries_by_formula.items():
+            components = components_by_formula[formula_id]
+            total_quantity, total_cost, percentages, _ = _total_lines(entries + components, strict=False)
+            formula_params.append({
+                'b_formula_id': formula_id, 'total_quantity': total_quantity,
+                'total_cost': total_cost, 'ingredient_count': len(entries) + len(components)
+            })
+            line_params.extend(
+                {'b_formula_id': formula_id, 'b_ingredient_id': entry[0], 'percentage': percentage}
+                for entry, percentage in zip(entries, percentages)
+            )
+            component_params.extend(
+                {'b_formula_id': formula_id, 'b_component_id': entry[0], 'percentage': percentage}
+                for entry, percentage in zip(components, percentages[len(entries):])
+            )
+        # Core statements with a parameter list run as executemany
+        if formula_params:
+            db.session.execute(update_formula, formula_params)
+        if line_params:
+            db.session.execute(update_line, line_params)
+        if component_params:
+            db.session.execute(update_component, component_params)
+        formula_events.mark_changed(id_chunk)
+        updated += len(formula_params)
+    return updated
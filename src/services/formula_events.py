@@ -0,0 +1,65 @@
+# src/services/formula_events.py
+"""Committed formula changes, delivered to in-memory indexes.
+
+Formula rows written through the ORM (create, update, delete) are picked up at
+flush. Formula lines are written with Core statements, so the helpers that write
+them (insert_formula_lines, recompute_formula_totals) report the formula ids
+with mark_changed(). Subscribers get the set of changed formula ids once the
+transaction commits. The set includes deleted formulas; subscribers re-read
+whatever they need.
+
+This is only the fast path: writes made by other processes, or with plain SQL,
+never show up here. Each delivery also carries the data versions the commit
+gave the formula tables, so subscribers can compare them with the versions
+they were built at.
+"""
+from sqlalchemy import event
+from sqlalchemy.orm import Session
+from src.models.models import db, Formula
+from src.models import data_version, pending_changes
+
+FORMULA_TABLES = ('formula', 'formula_ingredient', 'formula_component')
+
+_subscribers = []
+
+_PENDING_KEY = 'formula_events_pending'
+pending_changes.register(_PENDING_KEY)
+
+
+def subscribe(callback):
+    """Call `callback(formula_ids, versions)` after every commit that changed formulas or their lines.
+
+    `versions` maps each of FORMULA_TABLES to its data version after the commit,
+    or None for tables the commit didn't write.
+    """
+    _subscribers.append(callback)
+
+
+def mark_changed(formula_ids, session=None):
+    if not _subscribers:
+        return
+    session = session or db.session()
+    session.info.setdefault(_PENDING_KEY, set()).update(formula_ids)
+
+
+@event.listens_for(Session, 'after_flush')
+def _record_formula_writes(session, flush_context):
+    if not _subscribers:
+        return
+    changed = {obj.id for obj in (*session.new, *session.dirty, *session.deleted)
+               if isinstance(obj, Formula) and obj.id is not None}
+    if changed:
+        mark_changed(changed, session)
+
+
+@event.listens_for(Session, 'after_commit')
+def _deliver_on_commit(session):
+    if pending_changes.is_nested_commit(session):
+        return
+    formula_ids = session.info.pop(_PENDING_KEY, None)
+    if not formula_ids:
+        return
+    versions = {table_name: data_version.transaction_version(session, table_name) for table_name in FORMULA_TABLES}
+    for callback in _subscribers:
+        callback(formula_ids, versions)
+
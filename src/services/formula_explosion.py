@@ -0,0 +1,292 @@
+# src/services/formula_explosion.py
+"""Flatten nested formulas (accords used as sub-formulas) down to raw ingredients.
+
+A formula line is either an ingredient (formula_ingredient) or another formula
+(formula_component). explode_many() walks the tree one nesting level at a time,
+three queries per level, and builds for each formula:
+
+- lines: {ingredient id: {unit: quantity}} needed to make the formula once at its
+  stored total_quantity, with every sub-formula line scaled into its own lines
+- composition: {ingredient id: % by weight of the formula}, from the stored
+  line percentages (what IFRA checks need)
+
+Results are memoized per (formula id, version). A formula's version goes up
+whenever a commit changes it or its lines (see formula_events). Each result also
+records the versions of the sub-formulas it was built from, so a change anywhere
+down the tree invalidates it, and cached sub-trees are reused rather than walked.
+Those per-formula versions only see this process's commits, so the cache also
+keeps the data versions of the formula tables it matches, and is cleared when
+the database has moved past them (another worker, plain SQL).
+"""
+import threading
+from collections import OrderedDict, defaultdict
+from sqlalchemy import select
+from src.models.models import db, Formula, formula_ingredient, formula_component
+from src.models import data_version
+from src.services import formula_events
+from src.services.formula_calc import FormulaInputError, formula_total_unit
+from src.services.units import convert, UnitConversionError
+from src.utils.serializers import chunked
+
+CACHE_SIZE = 1024
+
+
+class FormulaCycleError(FormulaInputError):
+    """Raised when a formula would (directly or through sub-formulas) contain itself."""
+
+    def __init__(self, cycle):
+        super().__init__(f"Sub-formulas cannot contain the formula itself ({' -> '.join(str(i) for i in cycle)})")
+        self.cycle = list(cycle)
+
+    def to_dict(self):
+        result = super().to_dict()
+        result['cycle'] = self.cycle
+        return result
+
+
+class Explosion:
+    """Flattened view of one formula. Shared through the cache, so treat it as read-only."""
+
+    def __init__(self, formula_id, name, total_quantity, total_unit, lines, composition, versions, depth, unconverted):
+        self.formula_id = formula_id
+        self.name = name
+        self.total_quantity = total_quantity
+        self.total_unit = total_unit
+        self.lines = lines # {ingredient id: {unit: quantity}}
+        self.composition = composition # {ingredient id: % by weight}
+        self.versions = versions # {formula id: version} for this formula and every sub-formula used
+        self.depth = depth # 0 for a formula without sub-formulas
+        self.unconverted = unconverted # Sub-formula lines whose unit can't be expressed in the sub-formula's total unit
+
+    @property
+    def sub_formula_ids(self):
+        return set(self.versions) - {self.formula_id}
+
+
+class _Node:
+    """One formula as read from the database."""
+
+    def __init__(self, name, total_quantity):
+        self.name = name
+        self.total_quantity = total_quantity or 0
+        self.lines = [] # (ingredient id, quantity, unit, percentage)
+        self.components = [] # (component id, quantity, unit, percentage)
+
+
+_lock = threading.Lock()
+_versions = defaultdict(int)
+_cache = OrderedDict() # (formula id, version) -> Explosion
+_cache_data_versions = None # {table: data version} of formula_events.FORMULA_TABLES the cache matches
+
+
+def _bump_versions(formula_ids, data_versions):
+    global _cache_data_versions
+    with _lock:
+        for formula_id in formula_ids:
+            _versions[formula_id] += 1
+        if _cache_data_versions is not None:
+            _cache_data_versions = data_version.versions_after_commit(_cache_data_versions, data_versions)
+            if _cache_data_versions is None:
+                _cache.clear() # Writes this process didn't see
+
+
+formula_events.subscribe(_bump_versions)
+
+
+def _sync_cache():
+    """Clear the cache if the formula tables changed behind its back; returns the data versions it now matches.
+
+    Returns None while the current transaction has uncommitted formula writes:
+    results built then must neither come from nor go to the cache.
+    """
+    global _cache_data_versions
+    if any(data_version.transaction_version(db.session, table_name) is not None for table_name in formula_events.FORMULA_TABLES):
+        return None
+    data_versions = dict(zip(formula_events.FORMULA_TABLES, data_version.versions(*formula_events.FORMULA_TABLES)))
+    with _lock:
+        if _cache_data_versions != data_versions:
+            _cache.clear()
+            _cache_data_versions = data_versions
+    return data_versions
+
+
+def _current_versions(formula_ids):
+    with _lock:
+        return {formula_id: _versions[formula_id] for formula_id in formula_ids}
+
+
+def _cached(formula_id, data_versions):
+    if data_versions is None:
+        return None
+    with _lock:
+        if _cache_data_versions != data_versions:
+            return None
+        key = (formula_id, _versions[formula_id])
+        explosion = _cache.get(key)
+        if explosion is None:
+            return None
+        if any(_versions[sub_id] != version for sub_id, version in explosion.versions.items()):
+            del _cache[key] # A sub-formula changed since
+            return None
+        _cache.move_to_end(key)
+        return explosion
+
+
+def _store(explosion, data_versions):
+    with _lock:
+        if data_versions is None or _cache_data_versions != data_versions:
+            return # Built from data the cache no longer matches
+        key = (explosion.formula_id, explosion.versions[explosion.formula_id])
+        _cache[key] = explosion
+        _cache.move_to_end(key)
+        while len(_cache) > CACHE_SIZE:
+            _cache.popitem(last=False)
+
+
+def _load_level(formula_ids):
+    """Read formulas and both kinds of lines for `formula_ids` (three queries per chunk)."""
+    nodes = {}
+    for id_chunk in chunked(formula_ids):
+        formulas = select(Formula.__table__.c.id, Formula.__table__.c.name, Formula.__table__.c.total_quantity).where(
+            Formula.__table__.c.id.in_(id_chunk)
+        )
+        for formula_id, name, total_quantity in db.session.execute(formulas):
+            nodes[formula_id] = _Node(name, total_quantity)
+        for table, ref_column, attribute in (
+            (formula_ingredient, formula_ingredient.c.ingredient_id, 'lines'),
+            (formula_component, formula_component.c.component_id, 'components')
+        ):
+            rows = db.session.execute(select(
+                table.c.formula_id, ref_column, table.c.quantity, table.c.unit, table.c.percentage
+            ).where(table.c.formula_id.in_(id_chunk)))
+            for formula_id, ref_id, quantity, unit, percentage in rows:
+                if formula_id in nodes:
+                    getattr(nodes[formula_id], attribute).append((ref_id, quantity or 0, unit, percentage or 0))
+    return nodes
+
+
+def _build(formula_id, nodes, versions, built, path):
+    """Explosion for `formula_id` from loaded `nodes`, reusing (and filling) `built`."""
+    if formula_id in built:
+        return built[formula_id]
+    if formula_id in path:
+        raise FormulaCycleError(path[path.index(formula_id):] + [formula_id])
+    node = nodes.get(formula_id)
+    if node is None:
+        return None # Deleted sub-formula left behind by a raw write
+
+    path.append(formula_id)
+    lines = defaultdict(lambda: defaultdict(float))
+    composition = defaultdict(float)
+    explosion_versions = {formula_id: versions[formula_id]}
+    depth = 0
+    unconverted = []
+    for ingredient_id, quantity, unit, percentage in node.lines:
+        lines[ingredient_id][unit] += quantity
+        composition[ingredient_id] += percentage
+    for component_id, quantity, unit, percentage in node.components:
+        sub = _build(component_id, nodes, versions, built, path)
+        if sub is None:
+            continue
+        explosion_versions.update(sub.versions)
+        depth = max(depth, sub.depth + 1)
+        unconverted.extend(sub.unconverted)
+        for ingredient_id, share in sub.composition.items():
+            composition[ingredient_id] += percentage * share / 100
+        try:
+            amount = convert(quantity, unit, sub.total_unit) # Water-like density for accords
+        except UnitConversionError:
+            unconverted.append({'formula_id': formula_id, 'component_id': component_id, 'quantity': quantity, 'unit': unit})
+            continue
+        factor = amount / sub.total_quantity if sub.total_quantity else 0
+        for ingredient_id, by_unit in sub.lines.items():
+            for sub_unit, sub_quantity in by_unit.items():
+                lines[ingredient_id][sub_unit] += sub_quantity * factor
+    path.pop()
+
+    total_unit = formula_total_unit([unit for _, _, unit, _ in node.lines + node.components])
+    explosion = Explosion(
+        formula_id, node.name, node.total_quantity, total_unit,
+        {ingredient_id: dict(by_unit) for ingredient_id, by_unit in lines.items()}, dict(composition),
+        explosion_versions, depth, unconverted
+    )
+    built[formula_id] = explosion
+    return explosion
+
+
+def explode_many(formula_ids):
+    """Map formula id -> Explosion for the formulas that exist. Raises FormulaCycleError on cyclic data."""
+    results, pending = {}, set()
+    data_versions = _sync_cache()
+    for formula_id in set(formula_ids):
+        cached = _cached(formula_id, data_versions)
+        if cached is not None:
+            results[formula_id] = cached
+        else:
+            pending.add(formula_id)
+    if not pending:
+        return results
+
+    built = dict(results) # Sub-trees that need no walking
+    nodes, versions = {}, {}
+    frontier = pending
+    while frontier:
+        # Versions are read before the data, so a concurrent commit can only make the result stale, never wrong
+        versions.update(_current_versions(frontier))
+        level = _load_level(frontier)
+        nodes.update(level)
+        next_frontier = set()
+        for node in level.values():
+            for component_id, _, _, _ in node.components:
+                if component_id in nodes or component_id in built or component_id in next_frontier:
+                    continue
+                cached = _cached(component_id, data_versions)
+                if cached is not None:
+                    built[component_id] = cached
+                else:
+                    next_frontier.add(component_id)
+        frontier = next_frontier
+
+    cached_ids = set(built)
+    for formula_id in nodes:
+        _build(formula_id, nodes, versions, built, [])
+    for formula_id, explosion in built.items():
+        if formula_id not in cached_ids:
+            _store(explosion, data_versions)
+    results.update((formula_id, built[formula_id]) for formula_id in pending if formula_id in built)
+    return results
+
+
+def explode(formula_id):
+    """Explosion of one formula, or None if it doesn't exist."""
+    return explode_many([formula_id]).get(formula_id)
+
+
+def check_acyclic(formula_id, component_ids):
+    """Raise FormulaCycleError if using `component_ids` as sub-formulas of `formula_id` would create a cycle.
+
+    Walks down from the new sub-formulas one level (one query) at a time.
+    """
+    reached_from = {} # formula id -> formula it was first reached from
+    frontier = set()
+    for component_id in component_ids:
+        if component_id == formula_id:
+            raise FormulaCycleError([formula_id, formula_id])
+        reached_from[component_id] = formula_id
+        frontier.add(component_id)
+    while frontier:
+        next_frontier = set()
+        for id_chunk in chunked(frontier):
+            rows = db.session.execute(select(formula_component.c.formula_id, formula_component.c.component_id).where(
+                formula_component.c.formula_id.in_(id_chunk)
+            ))
+            for parent_id, child_id in rows:
+                if child_id == formula_id:
+                    chain = [parent_id]
+                    while reached_from[chain[-1]] != formula_id:
+                        chain.append(reached_from[chain[-1]])
+                    raise FormulaCycleError([formula_id, *reversed(chain), formula_id])
+                if child_id not in reached_from:
+                    reached_from[child_id] = parent_id
+                    next_frontier.add(child_id)
+        frontier = next_frontier
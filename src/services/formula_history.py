@@ -0,0 +1,278 @@
+# src/services/formula_history.py
+"""Formula revision history stored as diffs.
+
+Every save of a formula records one formula_revision row. Most rows hold only
+what changed since the previous revision: changed fields, and added, changed
+or removed lines. Every SNAPSHOT_INTERVAL-th revision stores the full state, so
+rebuilding any revision replays at most SNAPSHOT_INTERVAL - 1 diffs.
+Revisions never change once written, so materialized states are kept in an LRU
+cache keyed by (formula id, revision).
+
+State format: {'fields': {name: value}, 'lines': {ingredient_id: [quantity, unit, notes]},
+'components': {sub-formula id: [quantity, unit, notes]}}. Revisions saved before
+sub-formulas existed have no 'components' and read back with none; fields
+added to VERSIONED_FIELDS later are simply absent from older revisions.
+Derived values (totals, percentages) are not versioned; they follow from the lines.
+"""
+import copy
+import json
+import threading
+from collections import OrderedDict
+from sqlalchemy import func
+from src.models.models import db, Formula, FormulaRevision, Ingredient, formula_ingredient, formula_component
+from src.utils.serializers import chunked
+
+SNAPSHOT_INTERVAL = 10
+CACHE_SIZE = 256
+
+VERSIONED_FIELDS = ('name', 'description', 'creator', 'version', 'is_draft', 'notes', 'product_category', 'dosage_percent')
+
+
+class RevisionNotFound(LookupError):
+    """Raised when a formula has no such revision."""
+
+
+class _StateCache:
+    """Small thread-safe LRU of materialized states."""
+
+    def __init__(self, max_size):
+        self._max_size = max_size
+        self._items = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        with self._lock:
+            state = self._items.get(key)
+            if state is not None:
+                self._items.move_to_end(key)
+            return state
+
+    def put(self, key, state):
+        with self._lock:
+            self._items[key] = state
+            self._items.move_to_end(key)
+            while len(self._items) > self._max_size:
+                self._items.popitem(last=False)
+
+    def discard_formula(self, formula_id):
+        # Ids can be reused after a delete, so cached revisions of a deleted formula must go
+        with self._lock:
+            for key in [key for key in self._items if key[0] == formula_id]:
+                del self._items[key]
+
+
+_cache = _StateCache(CACHE_SIZE)
+
+
+# --- States and diffs ---
+
+def current_state(formula):
+    """The versioned state of `formula` as stored right now (one query per line table)."""
+    rows = db.session.query(
+        formula_ingredient.c.ingredient_id, formula_ingredient.c.quantity,
+        formula_ingredient.c.unit, formula_ingredient.c.notes
+    ).filter(formula_ingredient.c.formula_id == formula.id)
+    component_rows = db.session.query(
+        formula_component.c.component_id, formula_component.c.quantity,
+        formula_component.c.unit, formula_component.c.notes
+    ).filter(formula_component.c.formula_id == formula.id)
+    return {
+        'fields': {field: getattr(formula, field) for field in VERSIONED_FIELDS},
+        'lines': {ingredient_id: [quantity, unit, notes or ''] for ingredient_id, quantity, unit, notes in rows},
+        'components': {component_id: [quantity, unit, notes or ''] for component_id, quantity, unit, notes in component_rows}
+    }
+
+
+def make_delta(old_state, new_state):
+    """Changes that turn `old_state` into `new_state`, or None if they are equal."""
+    fields = {
+        field: value for field, value in new_state['fields'].items()
+        if old_state['fields'].get(field) != value
+    }
+    set_lines = {
+        ingredient_id: line for ingredient_id, line in new_state['lines'].items()
+        if old_state['lines'].get(ingredient_id) != line
+    }
+    removed = sorted(set(old_state['lines']) - set(new_state['lines']))
+    old_components, new_components = old_state['components'], new_state['components']
+    set_components = {
+        component_id: line for component_id, line in new_components.items()
+        if old_components.get(component_id) != line
+    }
+    removed_components = sorted(set(old_components) - set(new_components))
+    if not (fields or set_lines or removed or set_components or removed_components):
+        return None
+    delta = {'fields': fields, 'set': set_lines, 'removed': removed}
+    if set_components or removed_components: # Only stored when sub-formulas changed
+        delta.update(set_components=set_components, removed_components=removed_components)
+    return delta
+
+
+def apply_delta(state, delta):
+    state['fields'].update(delta['fields'])
+    state['lines'].update(delta['set'])
+    for ingredient_id in delta['removed']:
+        state['lines'].pop(ingredient_id, None)
+    state['components'].update(delta.get('set_components', {}))
+    for component_id in delta.get('removed_components', ()):
+        state['components'].pop(component_id, None)
+    return state
+
+
+_ID_KEYED = ('lines', 'set', 'components', 'set_components') # JSON object keys are strings; ids are ints
+
+
+def _encode(payload):
+    payload = dict(payload)
+    for key in _ID_KEYED:
+        if key in payload:
+            payload[key] = {str(k): v for k, v in payload[key].items()}
+    return json.dumps(payload, separators=(',', ':'))
+
+
+def _decode(data):
+    payload = json.loads(data)
+    for key in _ID_KEYED:
+        if key in payload:
+            payload[key] = {int(k): v for k, v in payload[key].items()}
+    if 'lines' in payload:
+        payload.setdefault('components', {}) # Snapshot from before sub-formulas existed
+    return payload
+
+
+def _diff_lines(old_lines, new_lines, id_key):
+    line_keys = ('quantity', 'unit', 'notes')
+    return {
+        'added': [dict(zip(line_keys, new_lines[i]), **{id_key: i}) for i in sorted(set(new_lines) - set(old_lines))],
+        'removed': [dict(zip(line_keys, old_lines[i]), **{id_key: i}) for i in sorted(set(old_lines) - set(new_lines))],
+        'changed': [{
+            id_key: i,
+            'from': dict(zip(line_keys, old_lines[i])),
+            'to': dict(zip(line_keys, new_lines[i]))
+        } for i in sorted(set(old_lines) & set(new_lines)) if old_lines[i] != new_lines[i]]
+    }
+
+
+def diff_states(old_state, new_state):
+    """Human-oriented diff: field changes plus added/removed/changed lines and sub-formula lines."""
+    fields = {
+        field: {'from': old_state['fields'].get(field), 'to': value}
+        for field, value in new_state['fields'].items()
+        if old_state['fields'].get(field) != value
+    }
+    return {
+        'fields': fields,
+        **_diff_lines(old_state['lines'], new_state['lines'], 'ingredient_id'),
+        'sub_formulas': _diff_lines(old_state['components'], new_state['components'], 'formula_id')
+    }
+
+
+# --- Reading ---
+
+def latest_revision_number(formula_id):
+    return db.session.query(func.max(FormulaRevision.revision)).filter(
+        FormulaRevision.formula_id == formula_id
+    ).scalar()
+
+
+def materialize(formula_id, revision):
+    """Full state of `formula_id` at `revision` (a fresh copy the caller may modify)."""
+    cached = _cache.get((formula_id, revision))
+    if cached is not None:
+        return copy.deepcopy(cached)
+
+    # Replay diffs forward from the nearest snapshot at or below the target
+    snapshot_revision = db.session.query(func.max(FormulaRevision.revision)).filter(
+        FormulaRevision.formula_id == formula_id,
+        FormulaRevision.revision <= revision,
+        FormulaRevision.is_snapshot.is_(True)
+    ).scalar()
+    if snapshot_revision is None:
+        raise RevisionNotFound(f'Formula {formula_id} has no revision {revision}')
+    # Start from a cached intermediate state if there is one
+    start_revision, state = snapshot_revision, None
+    for candidate in range(revision - 1, snapshot_revision - 1, -1):
+        cached = _cache.get((formula_id, candidate))
+        if cached is not None:
+            start_revision, state = candidate + 1, copy.deepcopy(cached)
+            break
+    rows = db.session.query(FormulaRevision.revision, FormulaRevision.is_snapshot, FormulaRevision.data).filter(
+        FormulaRevision.formula_id == formula_id,
+        FormulaRevision.revision.between(start_revision, revision)
+    ).order_by(FormulaRevision.revision).all()
+    if not rows or rows[-1].revision != revision:
+        raise RevisionNotFound(f'Formula {formula_id} has no revision {revision}')
+    for row in rows:
+        payload = _decode(row.data)
+        state = payload if row.is_snapshot else apply_delta(state, payload)
+
+    _cache.put((formula_id, revision), copy.deepcopy(state))
+    return state
+
+
+def list_revisions(formula_id):
+    rows = db.session.query(
+        FormulaRevision.revision, FormulaRevision.is_snapshot, FormulaRevision.version_label,
+        FormulaRevision.message, FormulaRevision.created_at
+    ).filter(FormulaRevision.formula_id == formula_id).order_by(FormulaRevision.revision.desc())
+    return [{
+        'revision': row.revision,
+        'is_snapshot': row.is_snapshot,
+        'version': row.version_label,
+        'message': row.message,
+        'created_at': row.created_at.isoformat() if row.created_at else None
+    } for row in rows]
+
+
+def ingredient_names(ingredient_ids):
+    names = {}
+    for id_chunk in chunked(ingredient_ids):
+        names.update(db.session.query(Ingredient.id, Ingredient.name).filter(Ingredient.id.in_(id_chunk)))
+    return names
+
+
+def formula_names(formula_ids):
+    names = {}
+    for id_chunk in chunked(formula_ids):
+        names.update(db.session.query(Formula.id, Formula.name).filter(Formula.id.in_(id_chunk)))
+    return names
+
+
+# --- Writing ---
+
+def _store(formula, revision, is_snapshot, payload, message):
+    db.session.add(FormulaRevision(
+        formula_id=formula.id, revision=revision, is_snapshot=is_snapshot, data=_encode(payload),
+        version_label=formula.version, message=message
+    ))
+
+
+def record_revision(formula, message=None):
+    """Record the formula's current (flushed) state as a new revision. Returns its number, or None if unchanged."""
+    db.session.flush()
+    state = current_state(formula)
+    latest = latest_revision_number(formula.id)
+    if latest is None:
+        _store(formula, 1, True, state, message)
+        return 1
+    delta = make_delta(materialize(formula.id, latest), state)
+    if delta is None:
+        return None
+    revision = latest + 1
+    if revision % SNAPSHOT_INTERVAL == 1:
+        _store(formula, revision, True, state, message)
+    else:
+        _store(formula, revision, False, delta, message)
+    # Not cached here: the transaction may still roll back, and the cache must only hold committed revisions
+    return revision
+
+
+def ensure_baseline(formula):
+    """Record the current state as revision 1 for formulas created before history was kept."""
+    if latest_revision_number(formula.id) is None:
+        record_revision(formula, message='Baseline')
+
+
+def delete_history(formula_id):
+    db.session.execute(FormulaRevision.__table__.delete().where(FormulaRevision.formula_id == formula_id))
+    _cache.discard_formula(formula_id)
@@ -0,0 +1,171 @@
+# src/services/formula_similarity.py
+"""In-process similarity index over formula compositions.
+
+Each formula is a sparse vector of ingredient percentages, stored L2-normalized
+so that cosine similarity is a plain dot product. An inverted index
+(ingredient id -> {formula id: weight}) means a query only visits formulas that
+share at least one ingredient with the target.
+
+The index is built on first use (or at startup via build_similarity_index()).
+Committed formula writes mark formulas dirty (see formula_events), and dirty
+formulas are re-read with one query just before the next search. The index
+also keeps the data versions of the formula and formula_ingredient tables it
+reflects; when the database has moved on without this process seeing the
+commit (another worker, plain SQL), the next search rebuilds it. Apart from
+that version check, searching never touches the database or loads ORM objects.
+"""
+import heapq
+import math
+import threading
+from collections import defaultdict
+from sqlalchemy import select
+from src.models.models import db, Formula, formula_ingredient
+from src.models import data_version
+from src.services import formula_events
+from src.utils.serializers import chunked
+
+DEFAULT_K = 10
+MAX_K = 100
+
+_SOURCE_TABLES = ('formula', 'formula_ingredient') # Names and ingredient lines
+
+
+class FormulaVectorIndex:
+    """Sparse normalized composition vectors with an ingredient -> formulas inverted index. Not thread-safe on its own."""
+
+    def __init__(self):
+        self._vectors = {} # formula id -> {ingredient id: weight}
+        self._postings = defaultdict(dict) # ingredient id -> {formula id: weight}
+        self._names = {}
+
+    def __len__(self):
+        return len(self._names)
+
+    def __contains__(self, formula_id):
+        return formula_id in self._names
+
+    def set_formula(self, formula_id, name, percentages):
+        """Insert or replace a formula; `percentages` maps ingredient id -> percentage."""
+        self.remove(formula_id)
+        self._names[formula_id] = name
+        norm = math.sqrt(sum(value * value for value in percentages.values()))
+        vector = {ing_id: value / norm for ing_id, value in percentages.items() if value} if norm else {}
+        self._vectors[formula_id] = vector
+        for ingredient_id, weight in vector.items():
+            self._postings[ingredient_id][formula_id] = weight
+
+    def remove(self, formula_id):
+        for ingredient_id in self._vectors.pop(formula_id, {}):
+            posting = self._postings.get(ingredient_id)
+            if posting is not None:
+                posting.pop(formula_id, None)
+                if not posting:
+                    del self._postings[ingredient_id]
+        self._names.pop(formula_id, None)
+
+    def similar(self, formula_id, k=DEFAULT_K, min_score=0.0):
+        """Return [(formula id, name, cosine score, shared ingredient count)], best first."""
+        scores = defaultdict(float)
+        shared = defaultdict(int)
+        for ingredient_id, weight in self._vectors.get(formula_id, {}).items():
+            for other_id, other_weight in self._postings[ingredient_id].items():
+                scores[other_id] += weight * other_weight
+                shared[other_id] += 1
+        scores.pop(formula_id, None)
+        best = heapq.nlargest(k, ((score, other_id) for other_id, score in scores.items() if score >= min_score))
+        return [(other_id, self._names[other_id], round(min(score, 1.0), 6), shared[other_id]) for score, other_id in best]
+
+
+def _load_compositions(formula_ids=None):
+    """Read {formula id: (name, {ingredient id: percentage})} with Core selects (all formulas if ids is None)."""
+    compositions = {}
+    id_chunks = [None] if formula_ids is None else list(chunked(formula_ids))
+    for id_chunk in id_chunks:
+        formulas = select(Formula.__table__.c.id, Formula.__table__.c.name)
+        lines = select(formula_ingredient.c.formula_id, formula_ingredient.c.ingredient_id, formula_ingredient.c.percentage)
+        if id_chunk is not None:
+            formulas = formulas.where(Formula.__table__.c.id.in_(id_chunk))
+            lines = lines.where(formula_ingredient.c.formula_id.in_(id_chunk))
+        for formula_id, name in db.session.execute(formulas):
+            compositions[formula_id] = (name, {})
+        for formula_id, ingredient_id, percentage in db.session.execute(lines):
+            if formula_id in compositions:
+                compositions[formula_id][1][ingredient_id] = percentage or 0
+    return compositions
+
+
+_lock = threading.Lock()
+_index = None # Built lazily; None also means "stale, rebuild on next search"
+_index_versions = None # {table: data version} _index reflects once _dirty is re-read
+_dirty = set() # Formulas changed since their vectors were last read
+
+
+def _current_versions():
+    return dict(zip(_SOURCE_TABLES, data_version.versions(*_SOURCE_TABLES)))
+
+
+def build_similarity_index(versions=None):
+    """(Re)build the index from the database. Must run inside an app context."""
+    global _index, _index_versions
+    if versions is None:
+        versions = _current_versions() # Before the data, so a write landing mid-build triggers another rebuild
+    index = FormulaVectorIndex()
+    for formula_id, (name, percentages) in _load_compositions().items():
+        index.set_formula(formula_id, name, percentages)
+    if any(data_version.transaction_version(db.session, table_name) is not None for table_name in _SOURCE_TABLES):
+        return index # Built from uncommitted writes: use it for this search only
+    with _lock:
+        _index, _index_versions = index, versions
+        _dirty.clear()
+    return index
+
+
+def _refresh_dirty():
+    with _lock:
+        formula_ids = set(_dirty)
+        _dirty.clear()
+    if not formula_ids:
+        return
+    compositions = _load_compositions(formula_ids)
+    with _lock:
+        if _index is None:
+            return # Invalidated meanwhile
+        for formula_id in formula_ids:
+            if formula_id in compositions:
+                name, percentages = compositions[formula_id]
+                _index.set_formula(formula_id, name, percentages)
+            else:
+                _index.remove(formula_id) # Deleted
+
+
+def find_similar(formula_id, k=DEFAULT_K, min_score=0.0):
+    """Nearest formulas to `formula_id` by cosine similarity; None if the formula doesn't exist."""
+    k = max(1, min(k, MAX_K))
+    versions = _current_versions()
+    with _lock:
+        index = _index if _index_versions == versions else None
+    if index is None:
+        index = build_similarity_index(versions)
+    else:
+        _refresh_dirty()
+    with _lock:
+        if formula_id not in index:
+            return None
+        return index.similar(formula_id, k, min_score)
+
+
+def _mark_dirty(formula_ids, versions):
+    global _index, _index_versions
+    with _lock:
+        if _index is None:
+            return
+        next_versions = data_version.versions_after_commit(_index_versions, versions)
+        if next_versions is None:
+            _index = None # Writes this process didn't see; rebuild on the next search
+            _dirty.clear()
+            return
+        _index_versions = next_versions
+        _dirty.update(formula_ids)
+
+
+formula_events.subscribe(_mark_dirty)
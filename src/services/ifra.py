@@ -0,0 +1,216 @@
+# src/services/ifra.py
+"""IFRA compliance evaluation.
+
+Limits are stored per material and product category in ifra_limit, as the
+maximum % of the material in the finished product. A formula line contributes
+to a material's final concentration as:
+
+    line percentage x dilution factor x dosage / 100
+
+- line percentage: weight % of the line in the concentrate (formula_ingredient.percentage)
+- dilution factor: `dilution_percent` / 100 for ingredients stocked as dilutions,
+  attributed to the material named by `dilution_of_id`
+- dosage: % of concentrate in the finished product (Formula.dosage_percent, default 100)
+
+Contributions are summed per (formula, material), so two dilutions of the
+same material count together. Sub-formulas (accords) contribute through their
+exploded composition (see formula_explosion), scaled by their line percentage.
+
+A whole-library check reads all limits, the ingredient dilution map, and
+formula settings with one query each. It then reads every formula line that
+touches a relevant material, one query per 500 such ingredients, plus one for
+sub-formula lines (and the explosion of any sub-formulas not already cached).
+Everything is then evaluated in one pass.
+"""
+from collections import defaultdict
+from itertools import chain
+from sqlalchemy import select
+from src.models.models import db, Formula, Ingredient, IfraLimit, formula_ingredient, formula_component
+from src.services.formula_explosion import explode_many
+from src.utils.serializers import chunked
+
+# IFRA Standards product categories (51st amendment)
+IFRA_CATEGORIES = (
+    '1', '2', '3', '4', '5A', '5B', '5C', '5D', '6', '7A', '7B', '8', '9', '10A', '10B', '11A', '11B', '12'
+)
+DEFAULT_DOSAGE = 100.0
+_MAX_DILUTION_DEPTH = 10 # Guards against dilution_of_id cycles
+
+
+class IfraInputError(ValueError):
+    """Raised for invalid categories, dosages or limit definitions."""
+
+
+def normalize_category(category):
+    if category is None or str(category).strip() == '':
+        return None
+    normalized = str(category).strip().upper()
+    if normalized not in IFRA_CATEGORIES:
+        raise IfraInputError(f"Unknown IFRA category '{category}'. Expected one of: {', '.join(IFRA_CATEGORIES)}")
+    return normalized
+
+
+def normalize_dosage(dosage):
+    if dosage is None or str(dosage).strip() == '':
+        return None
+    try:
+        dosage = float(dosage)
+    except (TypeError, ValueError):
+        raise IfraInputError("'dosage' must be a number")
+    if not 0 < dosage <= 100:
+        raise IfraInputError("'dosage' must be greater than 0 and at most 100")
+    return dosage
+
+
+def load_limits():
+    """{category: {material id: (max_concentration, limit id)}} for every stored limit."""
+    limits = defaultdict(dict)
+    rows = db.session.execute(select(
+        IfraLimit.__table__.c.id, IfraLimit.__table__.c.ingredient_id,
+        IfraLimit.__table__.c.product_category, IfraLimit.__table__.c.max_concentration
+    ))
+    for limit_id, material_id, category, max_concentration in rows:
+        limits[category][material_id] = (max_concentration, limit_id)
+    return limits
+
+
+def load_material_map():
+    """Map every ingredient id -> (material id, factor, name, ifra_restricted), following dilution chains."""
+    table = Ingredient.__table__
+    rows = {row.id: row for row in db.session.execute(select(
+        table.c.id, table.c.name, table.c.dilution_of_id, table.c.dilution_percent, table.c.ifra_restricted
+    ))}
+    materials = {}
+    for ingredient_id, row in rows.items():
+        material_id, factor, current = ingredient_id, 1.0, row
+        for _ in range(_MAX_DILUTION_DEPTH):
+            if current.dilution_percent is not None:
+                factor *= current.dilution_percent / 100
+            parent = rows.get(current.dilution_of_id) if current.dilution_of_id not in (None, current.id) else None
+            if parent is None:
+                break
+            material_id, current = parent.id, parent
+        materials[ingredient_id] = (material_id, factor, row.name, bool(row.ifra_restricted))
+    return materials
+
+
+def _formula_settings(formula_ids=None):
+    table = Formula.__table__
+    statement = select(table.c.id, table.c.name, table.c.product_category, table.c.dosage_percent)
+    settings = {}
+    id_chunks = [None] if formula_ids is None else list(chunked(formula_ids))
+    for id_chunk in id_chunks:
+        chunk_statement = statement if id_chunk is None else statement.where(table.c.id.in_(id_chunk))
+        for formula_id, name, category, dosage in db.session.execute(chunk_statement):
+            settings[formula_id] = (name, category, dosage)
+    return settings
+
+
+def _relevant_lines(ingredient_ids, formula_ids=None):
+    """Yield (formula id, ingredient id, percentage) for lines using `ingredient_ids`."""
+    for id_chunk in chunked(ingredient_ids):
+        statement = select(
+            formula_ingredient.c.formula_id, formula_ingredient.c.ingredient_id, formula_ingredient.c.percentage
+        ).where(formula_ingredient.c.ingredient_id.in_(id_chunk))
+        if formula_ids is not None:
+            statement = statement.where(formula_ingredient.c.formula_id.in_(formula_ids))
+        yield from db.session.execute(statement)
+
+
+def _component_lines(formula_ids=None):
+    """Yield (formula id, ingredient id, percentage) for raw ingredients reached through sub-formulas."""
+    id_chunks = [None] if formula_ids is None else list(chunked(formula_ids))
+    component_lines = []
+    for id_chunk in id_chunks:
+        statement = select(formula_component.c.formula_id, formula_component.c.component_id, formula_component.c.percentage)
+        if id_chunk is not None:
+            statement = statement.where(formula_component.c.formula_id.in_(id_chunk))
+        component_lines.extend(db.session.execute(statement))
+    if not component_lines:
+        return
+    explosions = explode_many({component_id for _, component_id, _ in component_lines})
+    for formula_id, component_id, percentage in component_lines:
+        explosion = explosions.get(component_id)
+        if explosion is None:
+            continue
+        for ingredient_id, share in explosion.composition.items():
+            yield formula_id, ingredient_id, (percentage or 0) * share / 100
+
+
+def evaluate(formula_ids=None, category=None, dosage=None):
+    """Check formulas (all if `formula_ids` is None) against the stored limits.
+
+    `category`/`dosage` override each formula's own product_category/dosage_percent.
+    Returns {formula id: result dict}; formulas with no category to check against are
+    reported with status 'unevaluated'.
+    """
+    limits = load_limits()
+    materials = load_material_map()
+    settings = _formula_settings(formula_ids)
+
+    limited_materials = {material_id for by_material in limits.values() for material_id in by_material}
+    restricted_materials = {material_id for material_id, _, _, restricted in materials.values() if restricted}
+    relevant_ingredients = [
+        ingredient_id for ingredient_id, (material_id, _, _, _) in materials.items()
+        if material_id in limited_materials or material_id in restricted_materials
+    ]
+
+    # (formula id, material id) -> [concentrate %, {contributing ingredient ids}]
+    totals = defaultdict(lambda: [0.0, set()])
+    relevant = set(relevant_ingredients)
+    nested = (line for line in _component_lines(formula_ids) if line[1] in relevant)
+    for formula_id, ingredient_id, percentage in chain(_relevant_lines(relevant_ingredients, formula_ids), nested):
+        if formula_id not in settings:
+            continue
+        material_id, factor, _, _ = materials[ingredient_id]
+        entry = totals[(formula_id, material_id)]
+        entry[0] += (percentage or 0) * factor
+        entry[1].add(ingredient_id)
+    materials_by_formula = defaultdict(list)
+    for (formula_id, material_id), (concentrate_percent, contributors) in totals.items():
+        materials_by_formula[formula_id].append((material_id, concentrate_percent, contributors))
+
+    results = {}
+    for formula_id, (name, own_category, own_dosage) in settings.items():
+        formula_category = category or own_category
+        formula_dosage = dosage or own_dosage or DEFAULT_DOSAGE
+        result = {
+            'id': formula_id, 'name': name, 'category': formula_category, 'dosage_percent': formula_dosage,
+            'violations': [], 'materials': [], 'unverified': []
+        }
+        if not formula_category:
+            result['status'] = 'unevaluated'
+            results[formula_id] = result
+            continue
+        category_limits = limits.get(formula_category, {})
+        for material_id, concentrate_percent, contributors in sorted(
+            materials_by_formula.get(formula_id, []), key=lambda item: materials[item[0]][2].lower()
+        ):
+            final_concentration = concentrate_percent * formula_dosage / 100
+            material = {
+                'material_id': material_id,
+                'name': materials[material_id][2],
+                'concentration_in_concentrate': concentrate_percent,
+                'final_concentration': final_concentration,
+                'ingredient_ids': sorted(contributors)
+            }
+            if material_id in category_limits:
+                max_concentration, limit_id = category_limits[material_id]
+                material['limit'] = max_concentration
+                material['limit_id'] = limit_id
+                material['usage_of_limit'] = (final_concentration / max_concentration) if max_concentration else None
+                material['compliant'] = final_concentration <= max_concentration
+                result['materials'].append(material)
+                if not material['compliant']:
+                    result['violations'].append(material)
+            elif materials[material_id][3]:
+                # Flagged as restricted, but no structured limit for this category
+                result['unverified'].append(material)
+        if result['violations']:
+            result['status'] = 'non_compliant'
+        elif result['unverified']:
+            result['status'] = 'unverified'
+        else:
+            result['status'] = 'compliant'
+        results[formula_id] = result
+    return results
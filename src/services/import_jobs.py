@@ -0,0 +1,150 @@
+# src/services/import_jobs.py
+"""Background ingredient imports.
+
+submit_import() copies the upload to a temporary file, records an ImportJob
+row and queues the import on a small thread pool (IMPORT_JOB_WORKERS threads;
+further jobs wait their turn), so the request returns at once. The worker runs
+the same streaming, chunked import as /api/import/process/stream and writes
+its progress to the job row after every chunk, so progress and results can be
+polled and survive page reloads. The pool lives in memory (one server process
+is assumed): jobs still queued or running when the process stops are marked
+failed at the next startup.
+"""
+import json
+import os
+import shutil
+import tempfile
+import threading
+import traceback
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime
+from sqlalchemy import update
+from src.models.models import db, ImportJob
+from src.services.ingredient_import import ImportReport, JsonRecordReader, import_records, iter_csv_records, open_upload
+
+IMPORT_JOB_WORKERS = 2
+FINISHED_STATUSES = ('completed', 'failed')
+
+_lock = threading.Lock()
+_executor = None
+
+
+def _get_executor():
+    global _executor
+    with _lock:
+        if _executor is None:
+            _executor = ThreadPoolExecutor(max_workers=IMPORT_JOB_WORKERS, thread_name_prefix='import-job')
+        return _executor
+
+
+def submit_import(app, upload, file_format, mapping, filename=None):
+    """Queue an import of the binary stream `upload` and return its ImportJob (already committed)."""
+    fd, path = tempfile.mkstemp(prefix='import-', suffix=f'.{file_format}')
+    try:
+        with os.fdopen(fd, 'wb') as spooled:
+            shutil.copyfileobj(upload, spooled) # The request's stream is gone once it returns
+        job = ImportJob(status='queued', filename=filename, file_format=file_format, total_bytes=os.path.getsize(path))
+        db.session.add(job)
+        db.session.commit()
+    except Exception:
+        os.remove(path)
+        raise
+    _get_executor().submit(_run_import, app, job.id, path, file_format, mapping)
+    return job
+
+
+def _update_job(job_id, **values):
+    db.session.execute(update(ImportJob.__table__).where(ImportJob.__table__.c.id == job_id).values(**values))
+    db.session.commit()
+
+
+def _report_values(report):
+    return {
+        'rows_processed': report.record_count, 'imported_count': report.imported_count,
+        'skipped_count': report.skipped_count, 'error_count': report.error_count,
+        'warning_count': report.warning_count
+    }
+
+
+def _run_import(app, job_id, path, file_format, mapping):
+    with app.app_context():
+        try:
+            _update_job(job_id, status='running', started_at=datetime.utcnow())
+            report = ImportReport()
+            reported_errors = [0]
+            with open(path, 'rb') as upload:
+                def save_progress(report):
+                    values = _report_values(report)
+                    values['bytes_read'] = upload.tell()
+                    if len(report.errors) != reported_errors[0]: # Messages are rewritten only when new ones arrive
+                        values['errors'] = json.dumps(report.errors)
+                        reported_errors[0] = len(report.errors)
+                    _update_job(job_id, **values)
+
+                file_content = open_upload(upload)
+                records = JsonRecordReader(file_content) if file_format == 'json' else iter_csv_records(file_content)
+                import_records(records, mapping, report, on_chunk=save_progress)
+            result = report.to_dict()
+            _update_job(
+                job_id, status='completed', message=result['message'], finished_at=datetime.utcnow(),
+                bytes_read=os.path.getsize(path), errors=json.dumps(report.errors), warnings=json.dumps(report.warnings),
+                **_report_values(report)
+            )
+        except Exception as e:
+            db.session.rollback()
+            print(f"--- IMPORT JOB {job_id} FAILED ---")
+            traceback.print_exc()
+            _update_job(job_id, status='failed', message=f'Import failed: {type(e).__name__} - {str(e)}', finished_at=datetime.utcnow())
+        finally:
+            try:
+                os.remove(path)
+            except OSError:
+                pass
+
+
+def fail_interrupted_jobs():
+    """Mark jobs left queued or running by a previous process as failed (their worker is gone)."""
+    result = db.session.execute(
+        update(ImportJob.__table__)
+        .where(ImportJob.__table__.c.status.notin_(FINISHED_STATUSES))
+        .values(status='failed', message='Import was interrupted by a server restart.', finished_at=datetime.utcnow())
+    )
+    db.session.commit()
+    return result.rowcount
+
+
+def job_to_dict(job):
+    """Job state for the API, with throughput and an ETA estimated from progress through the file."""
+    now = datetime.utcnow()
+    elapsed = ((job.finished_at or now) - job.started_at).total_seconds() if job.started_at else 0
+    rows_per_second = job.rows_processed / elapsed if elapsed > 0 and job.rows_processed else 0
+    progress = None
+    eta_seconds = None
+    if job.status == 'completed':
+        progress = 1.0
+    elif job.total_bytes:
+        progress = min((job.bytes_read or 0) / job.total_bytes, 1.0)
+        if job.status == 'running' and progress > 0:
+            eta_seconds = elapsed * (1 - progress) / progress
+    return {
+        'id': job.id,
+        'status': job.status,
+        'filename': job.filename,
+        'format': job.file_format,
+        'rows_processed': job.rows_processed or 0,
+        'imported_count': job.imported_count or 0,
+        'skipped_count': job.skipped_count or 0,
+        'error_count': job.error_count or 0,
+        'warning_count': job.warning_count or 0,
+        'errors': json.loads(job.errors) if job.errors else [],
+        'category_warnings': json.loads(job.warnings) if job.warnings else [],
+        'message': job.message,
+        'success': job.status == 'completed' and bool(job.imported_count) and not job.error_count,
+        'progress': progress,
+        'rows_per_second': round(rows_per_second, 1),
+        'elapsed_seconds': round(elapsed, 1),
+        'eta_seconds': round(eta_seconds, 1) if eta_seconds is not None else None,
+        'created_at': job.created_at.isoformat() if job.created_at else None,
+        'started_at': job.started_at.isoformat() if job.started_at else None,
+        'finished_at': job.finished_at.isoformat() if job.finished_at else None
+    }
@@ -0,0 +1,82 @@
+# src/services/ingredient_events.py
+"""Committed ingredient changes, delivered to in-memory indexes.
+
+Subscribers (trigram index, autocomplete, ...) register the ingredient columns
+they need. During a transaction, flushed Ingredient inserts/updates/deletes are
+recorded with those column values (objects are expired after commit, so values
+are captured at flush time), and the batch is delivered once the transaction
+commits. Bulk statements on the ingredient table can't be tracked row by row
+and are reported as `stale`, meaning the subscriber should rebuild.
+
+This is only the fast path: writes made by other processes, or with plain SQL,
+never show up here. Each batch carries the ingredient data version it
+committed, so subscribers can compare it with the version they were built at
+and rebuild when it doesn't follow on from it.
+"""
+from sqlalchemy import event
+from sqlalchemy.orm import Session
+from src.models.models import Ingredient
+from src.models import data_version, pending_changes
+
+_subscribers = [] # [(callback, fields)]
+_captured_fields = set()
+
+_PENDING_KEY = 'ingredient_events_pending'
+pending_changes.register(_PENDING_KEY) # Follows savepoint rollbacks, dropped on rollback
+
+
+def subscribe(callback, fields):
+    """Call `callback(upserts, deletes, stale, version)` after every commit that changed ingredients.
+
+    `upserts` maps ingredient id -> {field: value} for `fields`; `deletes` is a set of ids.
+    `version` is the ingredient table's data version after the commit.
+    """
+    _subscribers.append((callback, tuple(fields)))
+    _captured_fields.update(fields)
+
+
+def _pending(session):
+    return session.info.setdefault(_PENDING_KEY, {'upserts': {}, 'deletes': set(), 'stale': False})
+
+
+@event.listens_for(Session, 'after_flush')
+def _record_ingredient_writes(session, flush_context):
+    if not _subscribers:
+        return
+    changes = None
+    for obj in (*session.new, *session.dirty):
+        if isinstance(obj, Ingredient) and obj.id is not None:
+            changes = changes or _pending(session)
+            changes['upserts'][obj.id] = {field: getattr(obj, field) for field in _captured_fields}
+            changes['deletes'].discard(obj.id)
+    for obj in session.deleted:
+        if isinstance(obj, Ingredient):
+            changes = changes or _pending(session)
+            changes['upserts'].pop(obj.id, None)
+            changes['deletes'].add(obj.id)
+
+
+@event.listens_for(Session, 'do_orm_execute')
+def _record_bulk_ingredient_writes(orm_execute_state):
+    if orm_execute_state.is_select or not _subscribers:
+        return
+    table = getattr(orm_execute_state.statement, 'table', None)
+    if getattr(table, 'name', None) == Ingredient.__tablename__:
+        _pending(orm_execute_state.session)['stale'] = True
+
+
+@event.listens_for(Session, 'after_commit')
+def _deliver_on_commit(session):
+    if pending_changes.is_nested_commit(session):
+        return # Releasing a savepoint; deliver when the outer transaction commits
+    changes = session.info.pop(_PENDING_KEY, None)
+    if not changes:
+        return
+    version = data_version.transaction_version(session, Ingredient.__tablename__)
+    for callback, fields in _subscribers:
+        upserts = {
+            ingredient_id: {field: values.get(field) for field in fields}
+            for ingredient_id, values in changes['upserts'].items()
+        }
+        callback(upserts, changes['deletes'], changes['stale'], version)
+
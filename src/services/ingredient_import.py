@@ -0,0 +1,520 @@
+# src/services/ingredient_import.py
+"""Reading ingredient records from uploaded files and importing them.
+
+Uploads are read as streams: CSV row by row, JSON one record at a time (see
+JsonRecordReader), so nothing holds the whole file or all of its records.
+import_records() validates records in chunks of IMPORT_CHUNK_SIZE, bulk-inserts
+each chunk with Core executemany inside a SAVEPOINT and commits it, which keeps
+the session, the pending change feeds and the report small no matter how large
+the file is. Existing names and categories are read once per import
+(ImportContext), so records cost no lookup queries.
+"""
+import codecs
+import csv
+import io
+import json
+import re
+import traceback
+from itertools import chain, groupby, islice
+from sqlalchemy import insert, select
+from src.models.models import db, Ingredient, Category, ingredient_category
+from src.services.categorizer import FIELDS_TO_SCAN_FOR_KEYWORDS, keyword_categorizer
+from src.services.units import canonical_unit
+
+IMPORT_CHUNK_SIZE = 500
+MAX_REPORTED_MESSAGES = 1000 # Per list; further errors/warnings are only counted
+READ_SIZE = 64 * 1024
+
+_DECODER = json.JSONDecoder()
+_SEPARATORS = re.compile(r'[\s,:]*')
+
+
+class ImportFormatError(ValueError):
+    """Raised when an upload can't be read as the declared format."""
+
+
+# --- Reading uploads ---
+
+class _PrefixedStream(io.RawIOBase):
+    """Binary stream that returns `prefix` and then the rest of `stream`."""
+
+    def __init__(self, prefix, stream):
+        super().__init__()
+        self._prefix = prefix
+        self._stream = stream
+
+    def readable(self):
+        return True
+
+    def readinto(self, buffer):
+        if self._prefix:
+            size = min(len(buffer), len(self._prefix))
+            buffer[:size] = self._prefix[:size]
+            self._prefix = self._prefix[size:]
+            return size
+        data = self._stream.read(len(buffer))
+        buffer[:len(data)] = data
+        return len(data)
+
+
+def open_upload(binary_stream):
+    """Text stream over an uploaded file, decoded as it is read.
+
+    The encoding is chosen from the first READ_SIZE bytes: UTF-8 (with or without
+    BOM) if they decode, Latin-1 otherwise. Invalid bytes further into a UTF-8 file
+    are replaced rather than failing an import halfway through.
+    """
+    sample = binary_stream.read(READ_SIZE)
+    try:
+        # Not final: the sample may end inside a multi-byte character
+        codecs.getincrementaldecoder('utf-8-sig')().decode(sample, final=len(sample) < READ_SIZE)
+        encoding = 'utf-8-sig'
+    except UnicodeDecodeError:
+        encoding = 'latin-1'
+    raw = io.BufferedReader(_PrefixedStream(sample, binary_stream), READ_SIZE)
+    return io.TextIOWrapper(raw, encoding=encoding, errors='replace', newline='')
+
+
+def _as_text_stream(content):
+    return io.StringIO(content, newline='') if isinstance(content, str) else content
+
+
+def csv_rows(content, sniff=False):
+    """csv.reader over a string or text stream; with `sniff`, the dialect is guessed from the first 2 KB."""
+    text_stream = _as_text_stream(content)
+    if not sniff:
+        return csv.reader(text_stream)
+    sample = text_stream.read(2048)
+    try:
+        dialect = csv.Sniffer().sniff(sample)
+    except csv.Error:
+        dialect = 'excel'
+    sample += text_stream.readline() # Finish the last sampled line
+    return csv.reader(chain(io.StringIO(sample, newline=''), text_stream), dialect)
+
+
+def iter_csv_records(content):
+    """Yield each CSV row as a dict keyed by the header."""
+    try:
+        for row in csv.DictReader(_as_text_stream(content)):
+            yield dict(row)
+    except csv.Error as e:
+        raise ImportFormatError(f'Invalid CSV format: {e}.') from e
+
+
+class JsonRecordReader:
+    """Iterate the ingredient-like records of a JSON document without loading it whole.
+
+    As in gather_all_ingredient_records(), records are the objects found in lists,
+    at any depth; objects outside lists are searched rather than returned. Only the
+    containers around the records are walked; each record is decoded on its own,
+    so memory is bounded by the largest record rather than by the file.
+    Structure is read leniently between records (separators aren't checked), but
+    every record must be valid JSON.
+    """
+
+    def __init__(self, content, read_size=READ_SIZE):
+        self._stream = _as_text_stream(content)
+        self._read_size = read_size
+        self._buffer = ''
+        self._pos = 0
+        self._eof = False
+        self.root = None # 'array', 'object' or 'scalar' once reading has started
+        self.flat = True # Stays True while every root-array element is a record
+
+    def _fill(self):
+        """Append more input to the buffer; False at end of file."""
+        if self._eof:
+            return False
+        # Read at least as much as is buffered, so a large record is re-decoded a logarithmic number of times
+        data = self._stream.read(max(self._read_size, len(self._buffer) - self._pos))
+        if not data:
+            self._eof = True
+            return False
+        self._buffer = self._buffer[self._pos:] + data
+        self._pos = 0
+        return True
+
+    def _peek(self):
+        """Next significant character (after whitespace and separators), or None at end of file."""
+        while True:
+            self._pos = _SEPARATORS.match(self._buffer, self._pos).end()
+            if self._pos < len(self._buffer):
+                return self._buffer[self._pos]
+            if not self._fill():
+                return None
+
+    def _decode(self):
+        """Decode the value at the current position, reading more input until it is complete."""
+        while True:
+            try:
+                value, end = _DECODER.raw_decode(self._buffer, self._pos)
+            except json.JSONDecodeError as e:
+                # Errors near the end of the buffer (or in a string running past it) may just be truncation
+                truncated = len(self._buffer) - e.pos <= 64 or e.msg.startswith('Unterminated string')
+                if truncated and self._fill():
+                    continue
+                raise ImportFormatError(f'Invalid JSON format: {e.msg}.') from e
+            if end == len(self._buffer) and self._fill():
+                continue # A number or literal may continue in the next read
+            self._pos = end
+            return value
+
+    def __iter__(self):
+        stack = [] # Open containers, '[' or '{'
+        while True:
+            char = self._peek()
+            if char is None:
+                if stack or self.root is None:
+                    raise ImportFormatError('Invalid JSON format: unexpected end of file.')
+                return
+            if self.root is not None and not stack:
+                raise ImportFormatError('Invalid JSON format: extra data after the end of the document.')
+            if char == '{' and stack and stack[-1] == '[':
+                if len(stack) > 1:
+                    self.flat = False
+                record = self._decode()
+                yield record
+                continue
+            if char in ']}':
+                if not stack or '[{'[']}'.index(char)] != stack[-1]:
+                    raise ImportFormatError(f"Invalid JSON format: unexpected '{char}'.")
+                stack.pop()
+                self._pos += 1
+                continue
+            if stack == ['[']:
+                self.flat = False # Root-array element that isn't a record
+            if char in '[{':
+                self.root = self.root or ('array' if char == '[' else 'object')
+                stack.append(char)
+                self._pos += 1
+            else:
+                self.root = self.root or 'scalar'
+                self._decode() # Key, string or scalar between records
+
+
+# --- Importing records ---
+
+class ImportReport:
+    """Counts and messages for one import. Only the first MAX_REPORTED_MESSAGES of each kind are kept."""
+
+    def __init__(self):
+        self.record_count = 0
+        self.imported_count = 0
+        self.skipped_count = 0
+        self.errors = []
+        self.warnings = []
+        self.error_count = 0
+        self.warning_count = 0
+
+    def error(self, message):
+        self.error_count += 1
+        if len(self.errors) < MAX_REPORTED_MESSAGES:
+            self.errors.append(message)
+
+    def warning(self, message):
+        self.warning_count += 1
+        if len(self.warnings) < MAX_REPORTED_MESSAGES:
+            self.warnings.append(message)
+
+    def to_dict(self):
+        message = f'Import finished. Imported: {self.imported_count}, Skipped: {self.skipped_count}.'
+        if self.warning_count:
+            message += f" {self.warning_count} category assignment warning(s)."
+        if self.error_count:
+            message += f" {self.error_count} critical error(s) encountered."
+        elif not self.record_count and not self.warning_count:
+            message = "Import file was empty or contained no processable records."
+        return {
+            'success': self.imported_count > 0 and not self.error_count, 'message': message,
+            'imported_count': self.imported_count, 'skipped_count': self.skipped_count,
+            'errors': self.errors, 'category_warnings': self.warnings,
+            'error_count': self.error_count, 'warning_count': self.warning_count
+        }
+
+
+class ImportContext:
+    """Name and category lookups for one import, loaded with one query each before the first record.
+
+    Names are compared lowercased. Names imported so far are remembered with the
+    record number that introduced them, so duplicates within the file are told
+    apart from ones already in the database.
+    """
+
+    def __init__(self):
+        self._existing_names = {name.lower() for name, in db.session.execute(select(Ingredient.__table__.c.name))}
+        self._imported_names = {} # lowercased name -> record number
+        self._category_ids = {}
+        rows = db.session.execute(select(Category.__table__.c.id, Category.__table__.c.name).order_by(Category.__table__.c.id))
+        for category_id, name in rows:
+            self._category_ids.setdefault(name.lower(), category_id)
+
+    def name_exists(self, name):
+        return name.lower() in self._existing_names
+
+    def record_with_name(self, name):
+        """Number of the record in this import that already used `name`, or None."""
+        return self._imported_names.get(name.lower())
+
+    def add_name(self, name, record_number):
+        self._imported_names.setdefault(name.lower(), record_number)
+
+    def discard_name(self, name):
+        """Forget an imported name whose record ended up not being saved."""
+        self._imported_names.pop(name.lower(), None)
+
+    def category_id(self, name):
+        return self._category_ids.get(str(name).strip().lower())
+
+
+def normalize_unit_of_measurement(unit_str_raw):
+    """Map a free-form unit ('Grams', 'fl. oz', 'gtt') to its canonical symbol from the unit registry."""
+    if not unit_str_raw:
+        return 'g' 
+    
+    unit_str_stripped = str(unit_str_raw).strip()
+    # Units the registry doesn't know are kept as given rather than guessed
+    return canonical_unit(unit_str_stripped) or unit_str_stripped or 'g'
+
+
+def import_records(records, mapping, report=None, chunk_size=IMPORT_CHUNK_SIZE, on_chunk=None):
+    """Import ingredient `records` (any iterable of dicts) using the field `mapping`.
+
+    Records are consumed `chunk_size` at a time. A chunk is validated first, then
+    its ingredients and category links are inserted with one executemany each,
+    inside a SAVEPOINT, and committed before the next chunk is read. If the chunk's
+    insert fails, the savepoint is rolled back and its records are retried one by
+    one, so only the records the database rejects are skipped. If the input turns
+    out to be malformed part-way, the import stops there and the error is
+    reported; earlier chunks stay imported. `on_chunk(report)` is called after
+    each chunk, for progress reporting.
+    """
+    report = report or ImportReport()
+    context = ImportContext()
+    records = iter(records)
+    while True:
+        chunk, format_error = [], None
+        try:
+            chunk.extend(islice(records, chunk_size))
+        except ImportFormatError as e:
+            format_error = e # Records read before the error are still imported
+        rows = []
+        for item_data_flat in chunk:
+            report.record_count += 1
+            row = _prepare_record(report.record_count - 1, item_data_flat, mapping, report, context)
+            if row is not None:
+                rows.append(row)
+        if rows:
+            _save_chunk(rows, report, context)
+        if on_chunk is not None:
+            on_chunk(report)
+        if format_error is not None:
+            report.error(f"{format_error} Import stopped after {report.record_count} record(s).")
+            break
+        if len(chunk) < chunk_size:
+            break
+    if not report.record_count and not report.error_count:
+        report.error('No records were extracted to process.')
+    return report
+
+
+def _insert_rows(rows):
+    """Insert prepared (identifier, attributes, category ids) rows and their category links."""
+    table = Ingredient.__table__
+    # executemany needs the same columns in every row; consecutive runs keep file order
+    for _, group in groupby(rows, key=lambda row: sorted(row[1])):
+        db.session.execute(insert(table), [attributes for _, attributes, _ in group])
+    linked_rows = [row for row in rows if row[2]]
+    if not linked_rows:
+        return
+    # Names are unique, so they identify the new rows (SQLite can't return ids in order from executemany)
+    ingredient_ids = dict(db.session.execute(
+        select(table.c.name, table.c.id).where(table.c.name.in_([attributes['name'] for _, attributes, _ in linked_rows]))
+    ).all())
+    db.session.execute(ingredient_category.insert(), [
+        {'ingredient_id': ingredient_ids[attributes['name']], 'category_id': category_id}
+        for _, attributes, category_ids in linked_rows for category_id in category_ids
+    ])
+
+
+def _save_chunk(rows, report, context):
+    """Insert one chunk of prepared rows and commit it, isolating records the database rejects."""
+    saved = []
+    try:
+        with db.session.begin_nested():
+            _insert_rows(rows)
+        saved = rows
+    except Exception as e:
+        print(f"Chunk insert failed ({type(e).__name__} - {getattr(e, 'orig', e)}), retrying its {len(rows)} records one by one")
+        for row in rows:
+            try:
+                with db.session.begin_nested():
+                    _insert_rows([row])
+                saved.append(row)
+            except Exception as row_error:
+                report.error(f"Error saving {row[0]}: {type(row_error).__name__} - {getattr(row_error, 'orig', row_error)}. Record skipped.")
+                report.skipped_count += 1
+                context.discard_name(row[1]['name'])
+    if not saved:
+        db.session.rollback()
+        return
+    try:
+        db.session.commit()
+    except Exception as e:
+        db.session.rollback()
+        print(f"Database commit error: {str(e)}") 
+        report.error(f'Database commit failed: {str(e)}. {len(saved)} ingredient(s) from {saved[0][0]} to {saved[-1][0]} were rolled back.')
+        report.skipped_count += len(saved)
+        for row in saved:
+            context.discard_name(row[1]['name'])
+        return
+    report.imported_count += len(saved)
+
+
+def _prepare_record(index, item_data_flat, mapping, report, context):
+    """Validate and map one record to (identifier, ingredient attributes, category ids).
+
+    Returns None if the record is skipped; problems go to `report`. Nothing is written.
+    """
+    # Use 1-based indexing for user-facing messages
+    record_identifier_for_user = f"Record Index {index + 1}" 
+    item_name_value_for_error_msg = "Unknown Name" # Fallback if name cannot be determined early
+
+    new_ingredient_attrs = {} 
+    
+    try:
+        # Determine Name and update record_identifier_for_user early for better error messages
+        name_source_key = mapping.get('name')
+        item_name_value = None
+        if name_source_key and name_source_key in item_data_flat:
+            item_name_value = item_data_flat[name_source_key]
+        
+        if not item_name_value: 
+            common_name_keys = ['name', 'Name', 'IngredientName', 'Material Name', 'Product Name'] # Simplified list
+            for key_try in common_name_keys:
+                if key_try in item_data_flat and item_data_flat[key_try]:
+                    item_name_value = item_data_flat[key_try]; break
+        
+        if item_name_value and str(item_name_value).strip():
+            new_ingredient_attrs['name'] = str(item_name_value).strip()
+            item_name_value_for_error_msg = new_ingredient_attrs['name'] # Update for more specific error
+            record_identifier_for_user = f"Record '{item_name_value_for_error_msg}' (Index {index + 1})"
+        else:
+            field_name_for_error = f"'{name_source_key}'" if name_source_key else "mapped 'Name'"
+            report.error(f"{record_identifier_for_user}, Field {field_name_for_error}: Value is missing. This field is required. Record skipped."); 
+            report.skipped_count += 1
+            return
+        
+        # Check for duplicates, both against the database and earlier records of this file
+        if context.name_exists(new_ingredient_attrs['name']):
+            report.error(f"{record_identifier_for_user}: Skipped - Ingredient with this name already exists in the database."); 
+            report.skipped_count += 1
+            return
+        first_record_number = context.record_with_name(new_ingredient_attrs['name'])
+        if first_record_number is not None:
+            report.error(f"{record_identifier_for_user}: Skipped - Duplicate of record {first_record_number} in this file."); 
+            report.skipped_count += 1
+            return
+        
+        # Process other attributes
+        for model_attr, source_key_suggestion in mapping.items():
+            if model_attr == 'name' or model_attr == '_categories_source_key_': continue 
+            
+            value_from_source = None
+            actual_source_key_used = None # To report the correct field name in errors
+
+            if source_key_suggestion and source_key_suggestion in item_data_flat:
+                value_from_source = item_data_flat[source_key_suggestion]
+                actual_source_key_used = source_key_suggestion
+            elif model_attr in item_data_flat: 
+                value_from_source = item_data_flat[model_attr]
+                actual_source_key_used = model_attr
+            
+            field_name_for_error_reporting = f"'{actual_source_key_used}' (mapped to '{model_attr}')" if actual_source_key_used else f"'{model_attr}'"
+
+
+            if value_from_source is not None:
+                if model_attr == 'unit_of_measurement':
+                    normalized_unit = normalize_unit_of_measurement(value_from_source)
+                    if normalized_unit != value_from_source and value_from_source: # Log if changed
+                         report.warning(f"{record_identifier_for_user}, Field {field_name_for_error_reporting}: Unit '{value_from_source}' normalized to '{normalized_unit}'.")
+                    new_ingredient_attrs[model_attr] = normalized_unit
+                elif model_attr in ['cost_per_unit', 'stock_quantity', 'minimum_stock_threshold', 'density', 'drop_volume']:
+                    value_str_stripped = str(value_from_source).strip()
+                    if value_str_stripped != '':
+                        try: 
+                            cleaned_value_str = re.sub(r'[^\d\.-]', '', value_str_stripped)
+                            if cleaned_value_str: 
+                                new_ingredient_attrs[model_attr] = float(cleaned_value_str)
+                            else: # Value became empty after cleaning non-numeric chars
+                                report.warning(f"{record_identifier_for_user}, Field {field_name_for_error_reporting}: Value '{value_from_source}' became empty after removing non-numeric characters. Field left blank.")
+                        except (ValueError, TypeError): 
+                            report.error(f"{record_identifier_for_user}, Field {field_name_for_error_reporting}: Value '{value_from_source}' is not a valid number. Record processing might be incomplete for this field.");
+                            # Decide if this should increment skipped_count or just be a warning
+                elif model_attr == 'ifra_restricted':
+                    new_ingredient_attrs[model_attr] = str(value_from_source).lower().strip() in ['true', '1', 'yes', 'restricted']
+                else: 
+                    new_ingredient_attrs[model_attr] = str(value_from_source).strip()
+        
+        if 'unit_of_measurement' not in new_ingredient_attrs or not new_ingredient_attrs['unit_of_measurement']:
+            new_ingredient_attrs['unit_of_measurement'] = 'g' # Default if still not set
+
+        unknown_attrs = set(new_ingredient_attrs) - set(Ingredient.__table__.c.keys())
+        if unknown_attrs:
+            raise TypeError(f"'{sorted(unknown_attrs)[0]}' is an invalid keyword argument for Ingredient")
+
+        # Category assignment (remains largely the same, but error messages can use record_identifier_for_user)
+        assigned_category_ids = set()
+        source_field_for_categories = mapping.get('_categories_source_key_')
+        if source_field_for_categories and source_field_for_categories in item_data_flat:
+            category_data = item_data_flat[source_field_for_categories]
+            category_names_to_process = []
+            if isinstance(category_data, str):
+                try: 
+                    parsed_list = json.loads(category_data)
+                    if isinstance(parsed_list, list): category_names_to_process = [str(cn).strip() for cn in parsed_list if str(cn).strip()]
+                    else: category_names_to_process = [str(parsed_list).strip()] if str(parsed_list).strip() else []
+                except json.JSONDecodeError: 
+                    match = re.search(r"Fragrance Family:\s*([\w\s&/-]+)", category_data, re.IGNORECASE)
+                    if match: family_str = match.group(1); category_names_to_process = [name.strip() for name in re.split(r'[&/,]', family_str) if name.strip()]
+                    else: category_names_to_process = [name.strip() for name in category_data.split(',') if name.strip()]
+            elif isinstance(category_data, list): 
+                 category_names_to_process = [str(cn).strip() for cn in category_data if str(cn).strip()]
+
+            for cat_name_raw in category_names_to_process:
+                for cat_name in re.split(r'[&/,]', cat_name_raw): # Split by common delimiters
+                    cat_name = cat_name.strip()
+                    if not cat_name: continue
+                    category_id = context.category_id(cat_name)
+                    if category_id is None: 
+                        mapped_core_cat_name = keyword_categorizer.category_for(cat_name)
+                        if mapped_core_cat_name: category_id = context.category_id(mapped_core_cat_name)
+                        if category_id is None: 
+                            report.warning(f"{record_identifier_for_user}, Category '{cat_name}' (from source field '{source_field_for_categories}'): Not found or mapped."); continue 
+                    assigned_category_ids.add(category_id)
+        
+        text_to_scan_combined = ""
+        for target_model_field_for_keyword_scan in FIELDS_TO_SCAN_FOR_KEYWORDS:
+            source_key_for_keyword_scan = mapping.get(target_model_field_for_keyword_scan, target_model_field_for_keyword_scan) # Fallback to model field name
+            field_content_for_keywords = item_data_flat.get(source_key_for_keyword_scan)
+            if field_content_for_keywords is not None: text_to_scan_combined += " " + str(field_content_for_keywords).lower()
+        
+        if text_to_scan_combined.strip(): 
+            # One scan of the text finds every matched core category
+            for core_category_name, keyword in keyword_categorizer.categorize(text_to_scan_combined).items():
+                core_category_id = context.category_id(core_category_name)
+                if core_category_id is not None:
+                    assigned_category_ids.add(core_category_id)
+                else: # This means a core category defined in KEYWORD_TO_CORE_CATEGORY is missing from DB
+                     report.warning(f"{record_identifier_for_user}: Keyword '{keyword}' matched, but its target system category '{core_category_name}' is missing from the database.")
+
+        context.add_name(new_ingredient_attrs['name'], index + 1)
+        return record_identifier_for_user, new_ingredient_attrs, sorted(assigned_category_ids)
+
+    except Exception as e: 
+        # This is a catch-all for unexpected errors during a single record's processing
+        report.error(f"Error processing {record_identifier_for_user}: {type(e).__name__} - {str(e)}. Record skipped.")
+        report.skipped_count += 1
+        print(f"--- UNEXPECTED ERROR PROCESSING RECORD: {record_identifier_for_user} ---")
+        traceback.print_exc()
+        print(f"--- END ERROR ---")
@@ -0,0 +1,51 @@
+# src/services/ingredient_lookup.py
+"""In-memory snapshot backing /api/ingredients/lookup.
+
+The formula editor only needs id, name, unit and cost for every ingredient. The
+snapshot holds that as pre-encoded columnar JSON plus an ETag, and is rebuilt
+only when the ingredient table's data version has moved, so unchanged inventories
+are served after a single version query (or with a 304 when the client's ETag matches).
+"""
+import hashlib
+import json
+import threading
+from src.models.models import db, Ingredient
+from src.models import data_version
+
+LOOKUP_COLUMNS = ('id', 'name', 'unit', 'cost')
+
+_lock = threading.Lock()
+_snapshot = None # (ingredient data version, etag, body_bytes)
+
+
+def _build():
+    rows = db.session.query(
+        Ingredient.id, Ingredient.name, Ingredient.unit_of_measurement, Ingredient.cost_per_unit
+    ).order_by(Ingredient.name).all()
+    payload = {
+        'columns': list(LOOKUP_COLUMNS),
+        'count': len(rows),
+        'id': [row[0] for row in rows],
+        'name': [row[1] for row in rows],
+        'unit': [row[2] for row in rows],
+        'cost': [row[3] for row in rows],
+    }
+    body = json.dumps(payload, separators=(',', ':')).encode('utf-8')
+    return hashlib.sha1(body).hexdigest(), body
+
+
+def get_snapshot():
+    """Return (etag, body_bytes), rebuilding from the database only if ingredients changed."""
+    global _snapshot
+    # Read the version before querying: if a write lands mid-build, the snapshot is
+    # stored under the older version and rebuilt on the next call.
+    version = data_version.get_version(Ingredient.__tablename__)
+    with _lock:
+        if _snapshot is not None and _snapshot[0] == version:
+            return _snapshot[1], _snapshot[2]
+    etag, body = _build()
+    with _lock:
+        if _snapshot is None or _snapshot[0] < version:
+            _snapshot = (version, etag, body)
+    return etag, body
+
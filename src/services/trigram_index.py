@@ -0,0 +1,156 @@
+# src/services/trigram_index.py
+"""In-process trigram index for typo-tolerant ingredient name search.
+
+Every ingredient name and synonym is broken into trigrams (pg_trgm style: each
+word padded with two leading spaces and one trailing space) and stored in an
+inverted index. A query scores candidates by Jaccard similarity of trigram sets,
+so "ambrox" finds "Ambroxan" and "iso-e super" finds "Iso E Super".
+
+The index is built from the database on first use (or at startup via
+build_trigram_index()) and updated incrementally from committed ingredient
+writes. Bulk statements that can't be tracked row by row (e.g. deleting all
+ingredients) mark it stale, and it is rebuilt on the next search. The index
+also remembers the ingredient data version it reflects; a search that finds a
+different version in the database (another process or plain SQL wrote
+ingredients) rebuilds it first.
+"""
+import re
+import threading
+import unicodedata
+from collections import defaultdict
+from src.models.models import db, Ingredient
+from src.models import data_version
+from src.services import ingredient_events
+
+DEFAULT_MIN_SIMILARITY = 0.3
+DEFAULT_LIMIT = 200
+
+_SYNONYM_SPLIT = re.compile(r'[,;\n|]+')
+_NON_ALNUM = re.compile(r'[^0-9a-z]+')
+
+
+def normalize(text):
+    """Lowercase, strip accents and turn punctuation into spaces ('Iso-E Super®' -> 'iso e super')."""
+    text = unicodedata.normalize('NFKD', str(text or '')).encode('ascii', 'ignore').decode('ascii')
+    return _NON_ALNUM.sub(' ', text.lower()).strip()
+
+
+def trigrams(text):
+    grams = set()
+    for word in normalize(text).split():
+        padded = f'  {word} '
+        grams.update(padded[i:i + 3] for i in range(len(padded) - 2))
+    return grams
+
+
+def split_synonyms(synonyms):
+    return [s.strip() for s in _SYNONYM_SPLIT.split(synonyms or '') if s.strip()]
+
+
+class TrigramIndex:
+    """Inverted trigram index over (ingredient id, term) pairs. Not thread-safe on its own."""
+
+    def __init__(self):
+        self._postings = defaultdict(set) # trigram -> {term key}
+        self._terms = {} # term key -> (ingredient id, term text, trigram count)
+        self._keys_by_ingredient = defaultdict(list)
+        self._next_key = 0
+
+    def __len__(self):
+        return len(self._keys_by_ingredient)
+
+    def add(self, ingredient_id, name, synonyms=None):
+        self.remove(ingredient_id)
+        for term in [name, *split_synonyms(synonyms)]:
+            grams = trigrams(term)
+            if not grams:
+                continue
+            key = self._next_key
+            self._next_key += 1
+            self._terms[key] = (ingredient_id, term, len(grams))
+            self._keys_by_ingredient[ingredient_id].append(key)
+            for gram in grams:
+                self._postings[gram].add(key)
+
+    def remove(self, ingredient_id):
+        for key in self._keys_by_ingredient.pop(ingredient_id, ()):
+            _, term, _ = self._terms.pop(key)
+            for gram in trigrams(term):
+                posting = self._postings.get(gram)
+                if posting is not None:
+                    posting.discard(key)
+                    if not posting:
+                        del self._postings[gram]
+
+    def search(self, query, limit=DEFAULT_LIMIT, min_similarity=DEFAULT_MIN_SIMILARITY):
+        """Return [(ingredient_id, similarity, matched_term)] best first."""
+        query_grams = trigrams(query)
+        if not query_grams:
+            return []
+        shared_counts = defaultdict(int)
+        for gram in query_grams:
+            for key in self._postings.get(gram, ()):
+                shared_counts[key] += 1
+
+        best = {} # ingredient id -> (similarity, term)
+        query_size = len(query_grams)
+        for key, shared in shared_counts.items():
+            ingredient_id, term, term_size = self._terms[key]
+            similarity = shared / (query_size + term_size - shared)
+            if similarity >= min_similarity and similarity > best.get(ingredient_id, (0, None))[0]:
+                best[ingredient_id] = (similarity, term)
+        ranked = sorted(best.items(), key=lambda item: (-item[1][0], item[1][1].lower()))
+        return [(ingredient_id, round(similarity, 4), term) for ingredient_id, (similarity, term) in ranked[:limit]]
+
+
+_lock = threading.Lock()
+_index = None # Built lazily; None also means "stale, rebuild on next search"
+_index_version = None # Ingredient data version _index reflects
+
+
+def build_trigram_index(version=None):
+    """(Re)build the index from the database. Must run inside an app context."""
+    global _index, _index_version
+    # Read the version before querying: if a write lands mid-build, the index is
+    # stored under the older version and rebuilt on the next search
+    if version is None:
+        version = data_version.get_version(Ingredient.__tablename__)
+    index = TrigramIndex()
+    for ingredient_id, name, synonyms in db.session.query(Ingredient.id, Ingredient.name, Ingredient.synonyms):
+        index.add(ingredient_id, name, synonyms)
+    if data_version.transaction_version(db.session, Ingredient.__tablename__) is not None:
+        return index # Built from uncommitted writes: use it for this search only
+    with _lock:
+        _index, _index_version = index, version
+    return index
+
+
+def fuzzy_search(query, limit=DEFAULT_LIMIT, min_similarity=DEFAULT_MIN_SIMILARITY):
+    version = data_version.get_version(Ingredient.__tablename__)
+    with _lock:
+        index = _index if _index_version == version else None
+    if index is None:
+        # Use the index just built: a commit may mark the global stale (None) meanwhile
+        index = build_trigram_index(version)
+    with _lock: # Incremental updates mutate the index in place
+        return index.search(query, limit=limit, min_similarity=min_similarity)
+
+
+# --- Incremental maintenance ---
+
+def _apply_ingredient_changes(upserts, deletes, stale, version):
+    global _index, _index_version
+    with _lock:
+        if _index is None:
+            return # Will be rebuilt from the database on the next search anyway
+        if stale or version is None or version != _index_version + 1:
+            _index = None # Bulk statement, or writes this process didn't see
+            return
+        for ingredient_id in deletes:
+            _index.remove(ingredient_id)
+        for ingredient_id, values in upserts.items():
+            _index.add(ingredient_id, values['name'], values['synonyms'])
+        _index_version = version
+
+
+ingredient_events.subscribe(_apply_ingredient_changes, ('name', 'synonyms'))
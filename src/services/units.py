@@ -0,0 +1,112 @@
+# src/services/units.py
+"""Canonical unit registry and unit conversion for formula math.
+
+Every unit the app understands has one canonical symbol ('g', 'mL', 'drops', ...)
+and a dimension. Mass and volume units carry a factor to their base unit (g, mL).
+Volumes become mass through the ingredient's density (g/mL), and drops become
+volume through its drop volume (mL per drop). When an ingredient has neither,
+water-like defaults are used. Units such as 'parts' or 'ea' are recognised but
+cannot be converted to anything else.
+"""
+
+MASS, VOLUME, DROP, OTHER = 'mass', 'volume', 'drop', 'other'
+
+DEFAULT_DENSITY = 1.0 # g/mL
+DEFAULT_DROP_VOLUME = 0.05 # mL per drop (20 drops/mL, the usual dropper convention)
+
+# canonical symbol -> (dimension, factor to the dimension's base unit, aliases)
+UNITS = {
+    'mg': (MASS, 0.001, ('milligram', 'milligrams')),
+    'g': (MASS, 1.0, ('gram', 'grams', 'gr', 'gramme', 'grammes', 'gm', 'gms')),
+    'kg': (MASS, 1000.0, ('kgs', 'kilogram', 'kilograms', 'kilo', 'kilos')),
+    'oz': (MASS, 28.349523125, ('ounce', 'ounces')),
+    'lb': (MASS, 453.59237, ('lbs', 'pound', 'pounds')),
+    'uL': (VOLUME, 0.001, ('ul', 'µl', 'μl', 'microliter', 'microliters', 'microlitre', 'microlitres')),
+    'mL': (VOLUME, 1.0, ('ml', 'mls', 'milliliter', 'milliliters', 'millilitre', 'millilitres',
+                         'mililiter', 'mililiters', 'cc')),
+    'L': (VOLUME, 1000.0, ('l', 'liter', 'liters', 'litre', 'litres')),
+    'fl oz': (VOLUME, 29.5735295625, ('floz', 'fl. oz', 'fl.oz', 'fluid ounce', 'fluid ounces')),
+    'pt': (VOLUME, 473.176473, ('pint', 'pints')),
+    'qt': (VOLUME, 946.352946, ('quart', 'quarts')),
+    'gal': (VOLUME, 3785.411784, ('gallon', 'gallons')),
+    'drops': (DROP, 1.0, ('drop', 'gtt', 'gtts', 'drip', 'drips')),
+    '%': (OTHER, None, ('percent', 'pct')),
+    'parts': (OTHER, None, ('part', 'pts')),
+    'ea': (OTHER, None, ('each', 'pc', 'pcs', 'piece', 'pieces')),
+    'units': (OTHER, None, ('unit',)),
+}
+
+_ALIASES = {}
+for _symbol, (_dimension, _factor, _aliases) in UNITS.items():
+    for _alias in (_symbol, *_aliases):
+        _ALIASES[_alias.lower()] = _symbol
+
+
+class UnitConversionError(ValueError):
+    """Raised when a quantity cannot be converted between two units."""
+
+
+def canonical_unit(unit):
+    """Return the canonical symbol for `unit` ('Grams' -> 'g', 'ml' -> 'mL'), or None if unknown."""
+    if unit is None:
+        return None
+    return _ALIASES.get(' '.join(str(unit).split()).lower())
+
+
+def is_physical(unit):
+    """True if `unit` is a mass, volume or drop unit, i.e. convertible to grams."""
+    symbol = canonical_unit(unit)
+    return symbol is not None and UNITS[symbol][0] != OTHER
+
+
+def grams_per_unit(unit, density=None, drop_volume=None):
+    """Grams in one `unit` of an ingredient with the given density (g/mL) and drop volume (mL)."""
+    symbol = canonical_unit(unit)
+    if symbol is None:
+        raise UnitConversionError(f"Unknown unit '{unit}'")
+    dimension, factor, _ = UNITS[symbol]
+    density = density or DEFAULT_DENSITY
+    if dimension == MASS:
+        return factor
+    if dimension == VOLUME:
+        return factor * density
+    if dimension == DROP:
+        return (drop_volume or DEFAULT_DROP_VOLUME) * density
+    raise UnitConversionError(f"Unit '{symbol}' cannot be converted to a mass")
+
+
+def convert(quantity, from_unit, to_unit, density=None, drop_volume=None):
+    """Convert one quantity between units of the same ingredient."""
+    if (canonical_unit(from_unit) or from_unit) == (canonical_unit(to_unit) or to_unit):
+        return quantity # Same unit, even one the registry doesn't know
+    return quantity * grams_per_unit(from_unit, density, drop_volume) / grams_per_unit(to_unit, density, drop_volume)
+
+
+def to_grams(lines):
+    """Convert a whole formula at once.
+
+    `lines` is an iterable of (quantity, unit, density, drop_volume); returns a list of
+    masses in grams. Conversion factors are computed once per distinct
+    (unit, density, drop volume), so large formulas cost one multiplication per line.
+    """
+    factors = {}
+    masses = []
+    for quantity, unit, density, drop_volume in lines:
+        key = (unit, density, drop_volume)
+        if key not in factors:
+            factors[key] = grams_per_unit(unit, density, drop_volume)
+        masses.append(quantity * factors[key])
+    return masses
+
+
+def line_cost(quantity, unit, cost_per_unit, base_unit, density=None, drop_volume=None):
+    """Cost of `quantity` `unit` of an ingredient priced at `cost_per_unit` per `base_unit`.
+
+    Returns None if the ingredient has no price or the units cannot be reconciled.
+    """
+    if cost_per_unit is None or quantity is None:
+        return None
+    try:
+        return convert(quantity, unit or base_unit, base_unit or 'g', density, drop_volume) * cost_per_unit
+    except UnitConversionError:
+        return None
@@ -40,19 +40,21 @@ const app = Vue.createApp({
             formulas: [],
             formulaSearch: '',
             formulaPagination: { page: 1, per_page: 10, total_pages: 1, total_items: 0 },
-            currentFormula: { name: '', description: '', creator: '', version: '1.0', is_draft: true, notes: '', ingredients: [] },
+            currentFormula: { name: '', description: '', creator: '', version: '1.0', is_draft: true, notes: '', ingredients: [], sub_formulas: [] },
             viewedFormula: null, 
             formulaModalMode: 'add', 
             formulaModalInstance: null, 
             viewFormulaModalInstance: null, 
             allIngredientsForSelection: [], 
+            allFormulasForSelection: [], // For sub-formula (accord) lines
             formulaIngredientUnits: ['g', 'mL', 'drops', 'uL', 'oz', 'lb', 'kg', 'fl oz', 'pt', 'qt', 'gal', '%', 'parts', 'units', 'ea'],
 
             // --- Import/Export Data & State ---
-            importFile: null, importFileObject: null, rawFileContent: null,
+            importFile: null, importFileObject: null,
             importAnalysis: { format: '', structure: '', fields: [], item_count: 0, sample_data: [], mapping_suggestion: {}, main_array_key: null, data_path: '', message: '' },
             importMapping: {}, importType: 'ingredients', importStatus: '', importSuccess: false, importErrors: [],
             isAnalyzingFile: false, fileAnalyzedSuccessfully: false, categoryWarnings: [],
+            importJobId: null, importJobTimer: null, // Background import being polled (id kept in localStorage across reloads)
             
             // --- AI Integration Data & State ---
             // These will store dynamically fetched models or fallbacks
@@ -140,13 +142,16 @@ const app = Vue.createApp({
                 subcategories: this.categories.filter(sub => sub.parent_id === rc.id) 
             }));
         },
+        currentFormulaLines() {
+            // Ingredient lines and sub-formula lines together, for totals and percentages
+            if (!this.currentFormula) return [];
+            return [...(this.currentFormula.ingredients || []), ...(this.currentFormula.sub_formulas || [])];
+        },
         currentFormulaTotalQuantity() {
-            if (!this.currentFormula || !this.currentFormula.ingredients) return 0;
-            return this.currentFormula.ingredients.reduce((sum, item) => sum + (parseFloat(item.quantity) || 0), 0);
+            return this.currentFormulaLines.reduce((sum, item) => sum + (parseFloat(item.quantity) || 0), 0);
         },
         currentFormulaTotalCost() {
-            if (!this.currentFormula || !this.currentFormula.ingredients) return 0;
-            return this.currentFormula.ingredients.reduce((sum, item) => {
+            return this.currentFormulaLines.reduce((sum, item) => {
                 const cost = parseFloat(item.cost_per_unit) || 0;
                 const quantity = parseFloat(item.quantity) || 0;
                 return sum + (cost * quantity);
@@ -192,11 +197,13 @@ const app = Vue.createApp({
         this.loadDefaultPrompts(); 
         this.loadSavedPrompts(); 
         this.loadFallbackAIModels(); // Load fallbacks initially
+        this.resumeImportJob();
     }, 
     beforeUnmount() {
         window.removeEventListener('resize', this.handleWindowResize);
         if (this.resizeDebounceTimer) clearTimeout(this.resizeDebounceTimer);
         if (this.searchDebounceTimer) clearTimeout(this.searchDebounceTimer);
+        if (this.importJobTimer) clearTimeout(this.importJobTimer);
     }, 
     methods: {
         // --- DARK MODE METHODS ---
@@ -670,7 +677,6 @@ const app = Vue.createApp({
         navigateToImportData() { 
             this.importFile = null; 
             this.importFileObject = null; 
-            this.rawFileContent = null; 
             this.importAnalysis = {format:'', structure:'', fields:[], item_count:0, sample_data:[], mapping_suggestion:{}, main_array_key:null, message:'', data_path:''}; 
             this.importMapping = {}; 
             this.importStatus = ''; 
@@ -709,18 +715,8 @@ const app = Vue.createApp({
             this.importErrors = [];
             this.categoryWarnings = [];
             this.fileAnalyzedSuccessfully = false;
-            if (this.importFile) {
-                const r = new FileReader();
-                r.onload = e => {
-                    this.rawFileContent = e.target.result;
-                    this.analyzeFile(); 
-                };
-                r.onerror = e => {
-                    this.importStatus = "Error reading file.";
-                    this.importErrors = ["Could not read file."];
-                };
-                r.readAsText(this.importFile);
-            }
+            // The file is uploaded as-is for analysis and import, never read into the page
+            if (this.importFile) this.analyzeFile(); 
         },
         analyzeFile() {
             if (!this.importFile) { this.importStatus = 'Select file.'; return; }
@@ -759,27 +755,24 @@ const app = Vue.createApp({
             .finally(() => this.isAnalyzingFile = false);
         },
         processImport() {
-            if (!this.importAnalysis || !this.rawFileContent || !this.fileAnalyzedSuccessfully) { 
+            if (!this.importAnalysis || !this.importFile || !this.fileAnalyzedSuccessfully) { 
                 this.importStatus = 'Analyze file first.'; return; 
             }
-            this.importStatus = 'Processing...';
+            this.importStatus = 'Uploading...';
             this.importErrors = [];
             this.categoryWarnings = [];
             this.importSuccess = false;
-            const p = {
-                mapping: this.importMapping,
-                import_type: this.importType,
-                format: this.importAnalysis.format,
-                raw_file_content: this.rawFileContent, 
-                main_array_key: this.importAnalysis.main_array_key 
-            };
-            axios.post('/api/import/process', p)
+            // The import runs as a background job; the file is sent as-is and progress is polled
+            const fd = new FormData();
+            fd.append('file', this.importFile);
+            fd.append('mapping', JSON.stringify(this.importMapping));
+            fd.append('import_type', this.importType);
+            fd.append('format', this.importAnalysis.format);
+            axios.post('/api/import/jobs', fd, { headers: {'Content-Type': 'multipart/form-data'} })
             .then(res => {
-                this.importStatus = res.data.message || 'Import complete.';
-                this.importSuccess = res.data.success || false;
-                this.importErrors = res.data.errors || [];
-                this.categoryWarnings = res.data.category_warnings || [];
-                if (res.data.imported_count > 0) this.loadIngredients(); 
+                this.importJobId = res.data.id;
+                localStorage.setItem('importJobId', res.data.id);
+                this.showImportJob(res.data);
             })
             .catch(e => {
                 this.importStatus = 'Error processing.';
@@ -787,6 +780,34 @@ const app = Vue.createApp({
                 this.importSuccess = false;
             });
         },
+        resumeImportJob() {
+            const storedJobId = localStorage.getItem('importJobId');
+            if (storedJobId) { this.importJobId = storedJobId; this.pollImportJob(); }
+        },
+        pollImportJob() {
+            if (!this.importJobId) return;
+            axios.get(`/api/import/jobs/${this.importJobId}`)
+            .then(res => this.showImportJob(res.data))
+            .catch(e => {
+                if (e.response?.status === 404) { localStorage.removeItem('importJobId'); this.importJobId = null; return; }
+                this.importJobTimer = setTimeout(() => this.pollImportJob(), 3000); // Retry after a network hiccup
+            });
+        },
+        showImportJob(job) {
+            this.importErrors = job.errors || [];
+            this.categoryWarnings = job.category_warnings || [];
+            if (job.status === 'queued' || job.status === 'running') {
+                const eta = job.eta_seconds !== null && job.eta_seconds !== undefined ? `, about ${Math.ceil(job.eta_seconds)}s left` : '';
+                this.importStatus = job.status === 'queued' ? 'Import queued...' : `Importing... ${job.rows_processed} rows processed (${job.rows_per_second} rows/s${eta}).`;
+                this.importJobTimer = setTimeout(() => this.pollImportJob(), 1000);
+                return;
+            }
+            this.importStatus = job.message || (job.status === 'failed' ? 'Import failed.' : 'Import complete.');
+            this.importSuccess = job.success || false;
+            localStorage.removeItem('importJobId');
+            this.importJobId = null;
+            if (job.imported_count > 0) this.loadIngredients(); 
+        },
         formatFieldName(f) { 
             if (!f) return ''; 
             return f.replace(/_/g, ' ').replace(/\b\w/g, l => l.toUpperCase()); 
@@ -1070,13 +1091,15 @@ const app = Vue.createApp({
                 });
         },
         fetchAllIngredientsForSelection() { 
-            axios.get('/api/ingredients', { params: { per_page: 10000 } }) 
+            // Compact columnar payload; the browser revalidates it with an ETag
+            axios.get('/api/ingredients/lookup') 
                 .then(response => {
-                    this.allIngredientsForSelection = response.data.items.map(ing => ({
-                        id: ing.id,
-                        name: ing.name,
-                        unit_of_measurement: ing.unit_of_measurement,
-                        cost_per_unit: ing.cost_per_unit
+                    const data = response.data;
+                    this.allIngredientsForSelection = data.id.map((id, i) => ({
+                        id: id,
+                        name: data.name[i],
+                        unit_of_measurement: data.unit[i],
+                        cost_per_unit: data.cost[i]
                     }));
                 })
                 .catch(error => {
@@ -1104,7 +1127,7 @@ const app = Vue.createApp({
             if (mode === 'add') {
                 this.currentFormula = {
                     name: '', description: '', creator: '', version: '1.0',
-                    is_draft: true, notes: '', ingredients: []
+                    is_draft: true, notes: '', ingredients: [], sub_formulas: []
                 };
             } else if (mode === 'edit' && formula) {
                  axios.get(`/api/formulas/${formula.id}`)
@@ -1119,6 +1142,11 @@ const app = Vue.createApp({
                                 cost_per_unit: masterIng ? masterIng.cost_per_unit : 0
                             };
                         });
+                        // Sub-formula lines are sent back on save, so accords survive an edit
+                        this.currentFormula.sub_formulas = (this.currentFormula.sub_formulas || []).map(sf => ({
+                            ...sf,
+                            cost_per_unit: sf.quantity ? (sf.cost || 0) / sf.quantity : 0
+                        }));
                     })
                     .catch(error => {
                         alert('Error fetching formula details for editing.');
@@ -1137,6 +1165,7 @@ const app = Vue.createApp({
             if (this.allIngredientsForSelection.length === 0) {
                  this.fetchAllIngredientsForSelection();
             }
+            this.fetchAllFormulasForSelection();
             // Ensure a model is selected for the current AI service
             this.updateSelectedModelForCurrentService();
         },
@@ -1162,6 +1191,50 @@ const app = Vue.createApp({
             this.currentFormula.ingredients.splice(index, 1);
             this.recalculateFormulaPercentages();
         },
+        fetchAllFormulasForSelection(cursor = '', collected = []) {
+            // Walks the keyset pages so large libraries are listed in full
+            axios.get('/api/formulas', { params: { cursor, per_page: 500, sort_by: 'name', sort_direction: 'asc', include_total: false } })
+                .then(response => {
+                    const formulas = collected.concat(response.data.items.map(f => ({
+                        id: f.id,
+                        name: f.name,
+                        cost_per_unit: f.total_quantity ? (f.total_cost || 0) / f.total_quantity : 0
+                    })));
+                    if (response.data.pagination.next_cursor) {
+                        this.fetchAllFormulasForSelection(response.data.pagination.next_cursor, formulas);
+                    } else {
+                        this.allFormulasForSelection = formulas;
+                    }
+                })
+                .catch(error => {
+                    console.error('Error fetching formulas for sub-formula selection:', error);
+                    this.allFormulasForSelection = [];
+                });
+        },
+        addSubFormulaToCurrentFormula() {
+            this.currentFormula.sub_formulas.push({
+                formula_id: null,
+                name: '',
+                quantity: 0,
+                unit: 'g',
+                percentage: 0,
+                notes: '',
+                cost_per_unit: 0
+            });
+        },
+        removeSubFormulaFromCurrentFormula(index) {
+            this.currentFormula.sub_formulas.splice(index, 1);
+            this.recalculateFormulaPercentages();
+        },
+        onSubFormulaSelectInFormula(event, subFormula) {
+            const selectedFormula = this.allFormulasForSelection.find(f => f.id === parseInt(event.target.value));
+            if (selectedFormula) {
+                subFormula.formula_id = selectedFormula.id;
+                subFormula.name = selectedFormula.name;
+                subFormula.cost_per_unit = selectedFormula.cost_per_unit;
+            }
+            this.recalculateFormulaPercentages();
+        },
         onIngredientSelectInFormula(event, formulaIngredient) { 
             const selectedIngredientId = parseInt(event.target.value);
             const ingredient = this.allIngredientsForSelection.find(i => i.id === selectedIngredientId);
@@ -1175,11 +1248,11 @@ const app = Vue.createApp({
         recalculateFormulaPercentages() {
             const totalQuantity = this.currentFormulaTotalQuantity; 
             if (totalQuantity > 0) {
-                this.currentFormula.ingredients.forEach(item => {
+                this.currentFormulaLines.forEach(item => {
                     item.percentage = ((parseFloat(item.quantity) || 0) / totalQuantity) * 100;
                 });
             } else {
-                this.currentFormula.ingredients.forEach(item => {
+                this.currentFormulaLines.forEach(item => {
                     item.percentage = 0;
                 });
             }
@@ -1193,6 +1266,12 @@ const app = Vue.createApp({
                     unit: ing.unit,
                     percentage: parseFloat(ing.percentage) || 0, 
                     notes: ing.notes
+                })),
+                sub_formulas: (this.currentFormula.sub_formulas || []).map(sf => ({
+                    formula_id: sf.formula_id,
+                    quantity: parseFloat(sf.quantity) || 0,
+                    unit: sf.unit,
+                    notes: sf.notes
                 }))
             };
 
@@ -1244,7 +1323,9 @@ const app = Vue.createApp({
                         this.loadFormulas();
                     })
                     .catch(error => {
-                        alert('Error deleting formula: ' + (error.response?.data?.error || error.message));
+                        const usedBy = error.response?.data?.used_by; // 409: still used as an accord
+                        const parents = usedBy ? '\nUsed by: ' + usedBy.map(f => f.name).join(', ') : '';
+                        alert('Error deleting formula: ' + (error.response?.data?.error || error.message) + parents);
                     });
             }
         },
@@ -1424,6 +1505,12 @@ const app = Vue.createApp({
             },
             deep: true 
         },
+        'currentFormula.sub_formulas': {
+            handler() {
+                this.recalculateFormulaPercentages();
+            },
+            deep: true
+        },
         formulaSearch(newValue, oldValue) { 
             if (newValue !== oldValue) { 
                 this.triggerFormulaSearch();
@@ -0,0 +1,89 @@
+# src/utils/pagination.py
+"""Pagination helpers shared by the list endpoints.
+
+Offset pagination (page/per_page) stays the default. Keyset ("cursor") pagination
+is opt-in: the client passes `cursor=` (empty for the first page) and gets back an
+opaque `next_cursor` that encodes the sort value and id of the last row returned,
+so every page is an indexed range scan instead of an OFFSET scan.
+"""
+import base64
+import json
+from datetime import datetime
+from flask import request
+from sqlalchemy import and_, or_, DateTime
+
+
+class InvalidCursor(ValueError):
+    """Raised when a client-supplied cursor cannot be decoded."""
+
+
+def get_bool_arg(name, default):
+    """Read a boolean query-string flag (true/false, 1/0, yes/no)."""
+    value = request.args.get(name)
+    if value is None or value.strip() == '':
+        return default
+    return value.strip().lower() in ('1', 'true', 'yes', 'on')
+
+
+def encode_cursor(sort_value, row_id):
+    if isinstance(sort_value, datetime):
+        sort_value = sort_value.isoformat()
+    raw = json.dumps([sort_value, row_id], separators=(',', ':')).encode('utf-8')
+    return base64.urlsafe_b64encode(raw).decode('ascii').rstrip('=')
+
+
+def decode_cursor(token, sort_column):
+    """Return (sort_value, row_id) from a token produced by encode_cursor()."""
+    try:
+        padded = token + '=' * (-len(token) % 4)
+        sort_value, row_id = json.loads(base64.urlsafe_b64decode(padded.encode('ascii')))
+        if not isinstance(row_id, int):
+            raise ValueError('cursor id must be an integer')
+        if sort_value is not None and isinstance(sort_column.type, DateTime):
+            sort_value = datetime.fromisoformat(sort_value)
+        return sort_value, row_id
+    except (ValueError, TypeError) as e: # Covers base64, UTF-8 and JSON decoding errors
+        raise InvalidCursor('Invalid cursor') from e
+
+
+def _after_cursor_condition(sort_column, id_column, descending, sort_value, row_id):
+    """Rows strictly after (sort_value, row_id) in the given order.
+
+    NULL sort values are treated as the smallest values, matching how SQLite and MySQL
+    order them: first when ascending, last when descending.
+    """
+    if not descending:
+        if sort_value is None:
+            return or_(and_(sort_column.is_(None), id_column > row_id), sort_column.isnot(None))
+        return or_(sort_column > sort_value, and_(sort_column == sort_value, id_column > row_id))
+    if sort_value is None:
+        return and_(sort_column.is_(None), id_column < row_id)
+    return or_(
+        sort_column < sort_value,
+        and_(sort_column == sort_value, id_column < row_id),
+        sort_column.is_(None)
+    )
+
+
+def keyset_paginate(query, sort_column, id_column, descending, cursor, per_page):
+    """Fetch one page of `query` after `cursor`, ordered by (sort_column, id_column).
+
+    `query` must not already be ordered. Returns (items, next_cursor); next_cursor is
+    None on the last page.
+    """
+    per_page = max(per_page, 1)
+    if cursor:
+        sort_value, row_id = decode_cursor(cursor, sort_column)
+        query = query.filter(_after_cursor_condition(sort_column, id_column, descending, sort_value, row_id))
+    if descending:
+        query = query.order_by(sort_column.desc(), id_column.desc())
+    else:
+        query = query.order_by(sort_column.asc(), id_column.asc())
+
+    rows = query.limit(per_page + 1).all() # One extra row tells us whether another page exists
+    items = rows[:per_page]
+    next_cursor = None
+    if len(rows) > per_page and items:
+        last = items[-1]
+        next_cursor = encode_cursor(getattr(last, sort_column.key), getattr(last, id_column.key))
+    return items, next_cursor
@@ -0,0 +1,95 @@
+# src/utils/serializers.py
+"""Shared JSON serialization for API responses.
+
+Ingredient categories are loaded for a whole page with one batched query instead
+of one lazy load per row, and callers can restrict the output to a sparse fieldset
+(`?fields=id,name,stock_quantity`), in which case only those columns are loaded.
+"""
+from flask import request
+from sqlalchemy.orm import load_only
+from src.models.models import db, Ingredient, Category, ingredient_category
+
+# Keep IN (...) lists under SQLite's bound-parameter limit on older builds
+ID_CHUNK_SIZE = 500
+
+INGREDIENT_DETAIL_FIELDS = (
+    'id', 'name', 'synonyms', 'description', 'supplier', 'supplier_code', 'cost_per_unit',
+    'unit_of_measurement', 'stock_quantity', 'minimum_stock_threshold', 'viscosity', 'density', 'drop_volume', 'color', 'odor_profile',
+    'ifra_restricted', 'ifra_restriction_details', 'dilution_of_id', 'dilution_percent', 'safety_notes', 'notes', 'categories',
+    'date_added', 'last_updated'
+)
+INGREDIENT_LIST_FIELDS = (
+    'id', 'name', 'description', 'supplier', 'cost_per_unit', 'unit_of_measurement', 'stock_quantity',
+    'categories', 'supplier_code', 'minimum_stock_threshold', 'notes', 'date_added', 'last_updated'
+)
+
+
+class InvalidFields(ValueError):
+    """Raised when `fields=` names something that cannot be serialized."""
+
+
+def chunked(values, size=ID_CHUNK_SIZE):
+    values = list(values)
+    for start in range(0, len(values), size):
+        yield values[start:start + size]
+
+
+def requested_fields(default_fields, allowed_fields=INGREDIENT_DETAIL_FIELDS):
+    """Return the fieldset from the `fields` query parameter, or `default_fields` if absent."""
+    raw = request.args.get('fields')
+    if raw is None or not raw.strip():
+        return tuple(default_fields)
+    fields = tuple(dict.fromkeys(f.strip() for f in raw.split(',') if f.strip())) # De-duplicate, keep order
+    unknown = [f for f in fields if f not in allowed_fields]
+    if unknown:
+        raise InvalidFields(f"Unknown field(s): {', '.join(unknown)}")
+    return fields
+
+
+def ingredient_load_options(fields, extra_columns=()):
+    """Query options that load only the columns needed for `fields` (plus any sort/key columns)."""
+    column_names = {'id'} | {f for f in fields if f in Ingredient.__table__.columns}
+    column_names |= {c.key for c in extra_columns}
+    return load_only(*(getattr(Ingredient, name) for name in sorted(column_names)))
+
+
+def load_ingredient_categories(ingredient_ids):
+    """Map ingredient id -> [{'id', 'name'}, ...] using one query per chunk of ids."""
+    categories_by_ingredient = {ingredient_id: [] for ingredient_id in ingredient_ids}
+    for id_chunk in chunked(categories_by_ingredient.keys()):
+        rows = db.session.query(
+            ingredient_category.c.ingredient_id, Category.id, Category.name
+        ).join(Category, Category.id == ingredient_category.c.category_id).filter(
+            ingredient_category.c.ingredient_id.in_(id_chunk)
+        ).order_by(Category.name).all()
+        for ingredient_id, category_id, category_name in rows:
+            categories_by_ingredient[ingredient_id].append({'id': category_id, 'name': category_name})
+    return categories_by_ingredient
+
+
+def _ingredient_value(ingredient, field):
+    value = getattr(ingredient, field)
+    if field in ('date_added', 'last_updated'):
+        return value.isoformat() if value else None
+    return value
+
+
+def serialize_ingredients(ingredients, fields=INGREDIENT_LIST_FIELDS):
+    """Serialize a list of Ingredient rows with a fixed number of queries."""
+    categories_by_ingredient = {}
+    if 'categories' in fields and ingredients:
+        categories_by_ingredient = load_ingredient_categories([ing.id for ing in ingredients])
+    items = []
+    for ingredient in ingredients:
+        item = {}
+        for field in fields:
+            if field == 'categories':
+                item['categories'] = categories_by_ingredient.get(ingredient.id, [])
+            else:
+                item[field] = _ingredient_value(ingredient, field)
+        items.append(item)
+    return items
+
+
+def serialize_ingredient(ingredient, fields=INGREDIENT_DETAIL_FIELDS):
+    return serialize_ingredients([ingredient], fields)[0]
@@ -0,0 +1,23 @@
+# tests/conftest.py
+import os
+import sys
+import pytest
+from flask import Flask
+
+# Make the `src` package importable when pytest runs from the project root (as src/main.py does)
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from src.models.models import db, init_db
+
+
+@pytest.fixture
+def app(tmp_path):
+    """App on a fresh SQLite database, with an app context pushed for the test."""
+    app = Flask(__name__)
+    app.config['SQLALCHEMY_DATABASE_URI'] = f"sqlite:///{tmp_path / 'perfumery.db'}"
+    app.config['SQLALCHEMY_TRACK_MODIFICATIONS'] = False
+    init_db(app)
+    with app.app_context():
+        yield app
+        db.session.remove()
+        db.engine.dispose()
@@ -0,0 +1,58 @@
+# tests/test_categorizer.py
+import random
+import re
+import pytest
+from src.services.categorizer import KEYWORD_TO_CORE_CATEGORY, KeywordCategorizer, keyword_categorizer
+
+
+# The import's original approach: one regex search per keyword
+_PER_KEYWORD_PATTERNS = [
+    (keyword, re.compile(rf'\b{re.escape(keyword)}\b' if ' ' not in keyword else re.escape(keyword)))
+    for keyword in (keyword.lower() for keyword in KEYWORD_TO_CORE_CATEGORY)
+]
+
+
+def _per_keyword_matches(text):
+    text = text.lower()
+    return {keyword for keyword, pattern in _PER_KEYWORD_PATTERNS if pattern.search(text)}
+
+
+def _random_texts(count, seed):
+    keywords = list(KEYWORD_TO_CORE_CATEGORY)
+    filler = ['fresh', 'sub', 'ly', 'oil', 'extract', '-', '/', ',', 'sublime', 'peelings', 'x', '', 'the', '(', ')']
+    rng = random.Random(seed)
+    texts = []
+    for _ in range(count):
+        pieces = [rng.choice(keywords if rng.random() < 0.5 else filler) for _ in range(rng.randint(1, 12))]
+        joiners = [rng.choice([' ', '', '-', ', ']) for _ in pieces]
+        texts.append(''.join(piece + joiner for piece, joiner in zip(pieces, joiners)))
+    return texts
+
+
+@pytest.mark.parametrize('text', [
+    'Fresh lemon and bergamot with a hint of orange peel',
+    'Sublime accord', # 'lime' only matches as a whole word
+    'ORANGE-PEEL; Lime, lime, LIME',
+    'citronellol/citronellal blend',
+    '',
+])
+def test_matches_agree_with_per_keyword_search(text):
+    assert set(keyword_categorizer.matches(text)) == _per_keyword_matches(text)
+
+
+def test_matches_agree_with_per_keyword_search_on_random_texts():
+    for text in _random_texts(2000, seed=7):
+        assert set(keyword_categorizer.matches(text)) == _per_keyword_matches(text), text
+
+
+def test_overlapping_and_prefix_keywords():
+    categorizer = KeywordCategorizer({'orange': 'Citrus', 'orange peel': 'Citrus', 'or': 'Other', 'peel': 'Green'})
+    assert set(categorizer.matches('orange peel')) == {'orange', 'orange peel', 'peel'}
+    assert set(categorizer.matches('or orange')) == {'or', 'orange'}
+    assert categorizer.matches('orangey') == {}
+    assert categorizer.categorize('orange peel or') == {'Citrus': 'orange', 'Green': 'peel', 'Other': 'or'}
+
+
+def test_category_for_is_case_insensitive():
+    assert keyword_categorizer.category_for('Lemon') == 'Citrus'
+    assert keyword_categorizer.category_for('no such keyword') is None
@@ -0,0 +1,150 @@
+# tests/test_formula_calc.py
+import pytest
+from sqlalchemy import update
+from src.models.models import db, Formula, Ingredient, formula_ingredient, formula_component
+from src.services.formula_calc import (
+    calculate_formula, insert_formula_lines, recompute_formula_totals, count_formula_lines, FormulaInputError
+)
+
+
+def _ingredient(name, cost_per_unit=None, unit='g', density=None):
+    ingredient = Ingredient(name=name, cost_per_unit=cost_per_unit, unit_of_measurement=unit, density=density)
+    db.session.add(ingredient)
+    db.session.flush()
+    return ingredient
+
+
+def _formula(name, lines):
+    """Save a formula the way the create route does."""
+    calculation = calculate_formula(lines)
+    formula = Formula(name=name)
+    calculation.apply_to(formula)
+    db.session.add(formula)
+    db.session.flush()
+    insert_formula_lines(formula.id, calculation.lines, calculation.components)
+    db.session.commit()
+    return formula
+
+
+def _percentages(table, formula_id, id_column):
+    rows = db.session.query(getattr(table.c, id_column), table.c.percentage).filter(table.c.formula_id == formula_id)
+    return {ref_id: percentage for ref_id, percentage in rows}
+
+
+def test_calculate_formula_totals_mixed_mass_and_volume_lines(app):
+    bergamot = _ingredient('Bergamot', cost_per_unit=40.0, unit='kg')
+    ethanol = _ingredient('Ethanol', cost_per_unit=0.01, unit='g', density=0.8)
+
+    calculation = calculate_formula([
+        {'id': bergamot.id, 'quantity': 200, 'unit': 'g', 'notes': 'top'},
+        {'id': ethanol.id, 'quantity': 1000, 'unit': 'mL'}
+    ])
+
+    assert calculation.total_unit == 'g'
+    assert calculation.total_quantity == pytest.approx(200 + 800) # 1000 mL at 0.8 g/mL
+    assert calculation.total_cost == pytest.approx(0.2 * 40.0 + 800 * 0.01)
+    lines = {line['ingredient_id']: line for line in calculation.lines}
+    assert lines[bergamot.id]['percentage'] == pytest.approx(20.0)
+    assert lines[ethanol.id]['percentage'] == pytest.approx(80.0)
+    assert lines[bergamot.id]['notes'] == 'top'
+    assert lines[ethanol.id]['unit'] == 'mL'
+    assert calculation.components == []
+
+
+def test_calculate_formula_in_parts(app):
+    a, b = _ingredient('A', 1.0), _ingredient('B', 2.0)
+    calculation = calculate_formula([{'id': a.id, 'quantity': 3, 'unit': 'parts'}, {'id': b.id, 'quantity': 1, 'unit': 'parts'}])
+    assert calculation.total_unit == 'parts'
+    assert calculation.total_quantity == 4
+    assert [line['percentage'] for line in calculation.lines] == [75.0, 25.0]
+    assert calculation.unpriced_ids == [a.id, b.id] # Priced per gram, so parts can't be costed
+
+
+def test_calculate_formula_rejects_bad_lines(app):
+    a = _ingredient('A', 1.0)
+    with pytest.raises(FormulaInputError) as error:
+        calculate_formula([{'id': a.id, 'quantity': 1}, {'id': 999, 'quantity': 1}, {'formula_id': 998, 'quantity': 1}])
+    assert error.value.unknown_ids == [999]
+    assert error.value.unknown_formula_ids == [998]
+
+    with pytest.raises(FormulaInputError) as error:
+        calculate_formula([{'id': a.id, 'quantity': 1}, {'id': a.id, 'quantity': 2}])
+    assert error.value.duplicate_ids == [a.id]
+
+    with pytest.raises(FormulaInputError):
+        calculate_formula([{'id': a.id, 'quantity': 1, 'unit': 'parts'}, {'id': _ingredient('B').id, 'quantity': 1, 'unit': 'g'}])
+
+
+def test_calculate_formula_prices_sub_formulas_from_their_totals(app):
+    a, b = _ingredient('A', 1.0), _ingredient('B', 2.0)
+    accord = _formula('Accord', [{'id': a.id, 'quantity': 10, 'unit': 'g'}])
+
+    calculation = calculate_formula([
+        {'id': b.id, 'quantity': 30, 'unit': 'g'},
+        {'formula_id': accord.id, 'quantity': 10, 'unit': 'g'}
+    ])
+
+    assert calculation.total_quantity == pytest.approx(40)
+    assert calculation.total_cost == pytest.approx(30 * 2.0 + 10 * 1.0)
+    assert calculation.components == [
+        {'component_id': accord.id, 'quantity': 10.0, 'unit': 'g', 'percentage': 25.0, 'notes': ''}
+    ]
+
+
+def test_recompute_formula_totals_recomputes_parents_after_their_sub_formulas(app):
+    a, b = _ingredient('A', 1.0), _ingredient('B', 2.0)
+    accord = _formula('Accord', [{'id': a.id, 'quantity': 10, 'unit': 'g'}])
+    parent = _formula('Parent', [{'id': b.id, 'quantity': 10, 'unit': 'g'}, {'formula_id': accord.id, 'quantity': 10, 'unit': 'g'}])
+    top = _formula('Top', [{'formula_id': parent.id, 'quantity': 40, 'unit': 'g'}])
+    assert (parent.total_cost, top.total_cost) == (pytest.approx(30.0), pytest.approx(60.0)) # 40 g at 1.5 per g
+
+    # A Core update bypasses the price-change listeners, so nothing has been recomputed yet
+    db.session.execute(update(Ingredient.__table__).where(Ingredient.__table__.c.id == a.id).values(cost_per_unit=3.0))
+    updated = recompute_formula_totals([accord.id])
+    db.session.commit()
+
+    assert updated == 3 # The accord, then its parent, then the parent's parent
+    accord, parent, top = (db.session.get(Formula, formula_id) for formula_id in (accord.id, parent.id, top.id))
+    assert accord.total_cost == pytest.approx(30.0)
+    assert parent.total_cost == pytest.approx(10 * 2.0 + 30.0) # Priced from the accord's new total
+    assert top.total_cost == pytest.approx(40 * 50.0 / 20) # 40 g of a 20 g formula costing 50
+    assert (parent.ingredient_count, top.ingredient_count) == (2, 1)
+
+
+def test_recompute_formula_totals_rewrites_line_percentages(app):
+    a, b = _ingredient('A', 1.0, unit='g'), _ingredient('B', 1.0, unit='g')
+    accord = _formula('Accord', [{'id': a.id, 'quantity': 10, 'unit': 'g'}])
+    parent = _formula('Parent', [{'id': b.id, 'quantity': 5, 'unit': 'mL'}, {'formula_id': accord.id, 'quantity': 5, 'unit': 'g'}])
+    assert _percentages(formula_ingredient, parent.id, 'ingredient_id') == {b.id: pytest.approx(50.0)}
+
+    # Density only matters for volume lines: 5 mL of B becomes 15 g
+    db.session.execute(update(Ingredient.__table__).where(Ingredient.__table__.c.id == b.id).values(density=3.0))
+    recompute_formula_totals([parent.id])
+    db.session.commit()
+
+    assert db.session.get(Formula, parent.id).total_quantity == pytest.approx(20.0)
+    assert _percentages(formula_ingredient, parent.id, 'ingredient_id') == {b.id: pytest.approx(75.0)}
+    assert _percentages(formula_component, parent.id, 'component_id') == {accord.id: pytest.approx(25.0)}
+
+
+def test_recompute_formula_totals_without_ids_covers_every_formula(app):
+    a = _ingredient('A', 1.0)
+    first = _formula('First', [{'id': a.id, 'quantity': 1, 'unit': 'g'}])
+    second = _formula('Second', [{'id': a.id, 'quantity': 2, 'unit': 'g'}])
+    db.session.execute(update(Ingredient.__table__).values(cost_per_unit=5.0))
+
+    assert recompute_formula_totals() == 2
+    db.session.commit()
+    assert db.session.get(Formula, first.id).total_cost == pytest.approx(5.0)
+    assert db.session.get(Formula, second.id).total_cost == pytest.approx(10.0)
+
+
+def test_count_formula_lines_counts_ingredient_and_sub_formula_lines(app):
+    a, b = _ingredient('A', 1.0), _ingredient('B', 1.0)
+    accord = _formula('Accord', [{'id': a.id, 'quantity': 1, 'unit': 'g'}, {'id': b.id, 'quantity': 1, 'unit': 'g'}])
+    parent = _formula('Parent', [{'id': a.id, 'quantity': 1, 'unit': 'g'}, {'formula_id': accord.id, 'quantity': 1, 'unit': 'g'}])
+    empty = _formula('Empty', [])
+
+    assert count_formula_lines([accord.id, parent.id, empty.id]) == {accord.id: 2, parent.id: 2, empty.id: 0}
+    # The denormalized column agrees with the line tables
+    assert [db.session.get(Formula, f.id).ingredient_count for f in (accord, parent, empty)] == [2, 2, 0]
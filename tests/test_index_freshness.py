@@ -0,0 +1,117 @@
+# tests/test_index_freshness.py
+"""In-memory indexes follow writes made outside this process.
+
+Another worker's commit is simulated with Core statements on a separate
+connection: they change the data and bump data_version, as that worker's session
+would, without going through this process's session events.
+"""
+import pytest
+from sqlalchemy import update
+from src.models.models import db, Formula, Ingredient, DataVersion, formula_ingredient
+from src.services import autocomplete, formula_explosion, formula_similarity, trigram_index
+from src.services.formula_calc import calculate_formula, insert_formula_lines
+
+
+def _external_write(statement, *table_names):
+    with db.engine.begin() as connection:
+        connection.execute(statement)
+        connection.execute(
+            update(DataVersion).where(DataVersion.table_name.in_(table_names)).values(version=DataVersion.version + 1)
+        )
+
+
+def _ingredient(name, **values):
+    ingredient = Ingredient(name=name, unit_of_measurement='g', **values)
+    db.session.add(ingredient)
+    db.session.commit()
+    return ingredient
+
+
+def _formula(name, lines):
+    calculation = calculate_formula(lines)
+    formula = Formula(name=name)
+    calculation.apply_to(formula)
+    db.session.add(formula)
+    db.session.flush()
+    insert_formula_lines(formula.id, calculation.lines, calculation.components)
+    db.session.commit()
+    return formula
+
+
+@pytest.fixture
+def count_builds(monkeypatch):
+    """Count calls to `module.attribute` (an index build function)."""
+    counts = {}
+
+    def count(module, attribute):
+        original = getattr(module, attribute)
+
+        def counted(*args, **kwargs):
+            counts[attribute] = counts.get(attribute, 0) + 1
+            return original(*args, **kwargs)
+        monkeypatch.setattr(module, attribute, counted)
+        return counts
+    return count
+
+
+def test_fuzzy_search_rebuilds_after_external_write(app, count_builds):
+    ambrox = _ingredient('Ambroxan')
+    builds = count_builds(trigram_index, 'build_trigram_index')
+    assert [hit[0] for hit in trigram_index.fuzzy_search('ambrox')] == [ambrox.id]
+
+    # This process's own commit is applied incrementally
+    hedione = _ingredient('Hedione')
+    assert [hit[0] for hit in trigram_index.fuzzy_search('hedion')] == [hedione.id]
+    assert builds == {'build_trigram_index': 1}
+
+    _external_write(update(Ingredient).where(Ingredient.id == ambrox.id).values(name='Cetalox'), 'ingredient')
+    assert [hit[0] for hit in trigram_index.fuzzy_search('cetalox')] == [ambrox.id]
+    assert trigram_index.fuzzy_search('ambroxan') == []
+    assert builds == {'build_trigram_index': 2}
+
+
+def test_suggest_rebuilds_after_external_write(app, count_builds):
+    iso = _ingredient('Iso E Super', supplier_code='IFF-1')
+    builds = count_builds(autocomplete, 'build_autocomplete_index')
+    assert [item['id'] for item in autocomplete.suggest('iso')] == [iso.id]
+
+    _ingredient('Isoraldeine')
+    assert len(autocomplete.suggest('iso')) == 2
+    assert builds == {'build_autocomplete_index': 1}
+
+    _external_write(update(Ingredient).where(Ingredient.id == iso.id).values(supplier_code='XYZ-9'), 'ingredient')
+    assert [item['id'] for item in autocomplete.suggest('xyz')] == [iso.id]
+    assert builds == {'build_autocomplete_index': 2}
+
+
+def test_similar_rebuilds_after_external_write(app, count_builds):
+    a, b, c = _ingredient('A'), _ingredient('B'), _ingredient('C')
+    first = _formula('First', [{'id': a.id, 'quantity': 50}, {'id': b.id, 'quantity': 50}])
+    second = _formula('Second', [{'id': a.id, 'quantity': 50}, {'id': b.id, 'quantity': 50}])
+    builds = count_builds(formula_similarity, 'build_similarity_index')
+    assert formula_similarity.find_similar(first.id)[0][2] == 1.0
+
+    _formula('Third', [{'id': c.id, 'quantity': 100}])
+    assert [match[0] for match in formula_similarity.find_similar(first.id)] == [second.id]
+    assert builds == {'build_similarity_index': 1}
+
+    _external_write(
+        update(formula_ingredient).where(formula_ingredient.c.formula_id == second.id, formula_ingredient.c.ingredient_id == b.id)
+        .values(percentage=0), 'formula_ingredient'
+    )
+    assert formula_similarity.find_similar(first.id)[0][2] < 1.0
+    assert builds == {'build_similarity_index': 2}
+
+
+def test_explode_drops_cache_after_external_write(app):
+    a, b = _ingredient('A'), _ingredient('B')
+    accord = _formula('Accord', [{'id': a.id, 'quantity': 50}, {'id': b.id, 'quantity': 50}])
+    top = _formula('Top', [{'formula_id': accord.id, 'quantity': 10, 'unit': 'g'}])
+    assert formula_explosion.explode(top.id).composition == {a.id: 50.0, b.id: 50.0}
+    assert formula_explosion.explode(top.id) is formula_explosion.explode(top.id) # Served from the cache
+
+    _external_write(
+        update(formula_ingredient).where(formula_ingredient.c.formula_id == accord.id, formula_ingredient.c.ingredient_id == b.id)
+        .values(percentage=20), 'formula_ingredient'
+    )
+    assert formula_explosion.explode(top.id).composition == {a.id: 50.0, b.id: 20.0}
@@ -0,0 +1,80 @@
+# tests/test_ingredient_import.py
+from sqlalchemy import select
+from src.models.models import db, Category, Ingredient, ingredient_category
+from src.services.ingredient_import import ImportContext, ImportReport, _save_chunk, import_records
+
+MAPPING = {'name': 'name', 'cost_per_unit': 'cost', '_categories_source_key_': 'categories'}
+
+
+def _names():
+    return set(db.session.scalars(select(Ingredient.name)))
+
+
+def _row(name, category_ids=()):
+    return f"Record '{name}'", {'name': name, 'unit_of_measurement': 'g'}, list(category_ids)
+
+
+def test_import_records_commits_each_chunk(app):
+    records = [{'name': f'Material {i}', 'cost': f'${i}.50'} for i in range(7)]
+    chunk_reports = []
+
+    report = import_records(records, MAPPING, chunk_size=3, on_chunk=lambda r: chunk_reports.append(r.imported_count))
+
+    assert report.imported_count == 7
+    assert report.skipped_count == 0
+    assert chunk_reports == [3, 6, 7]
+    assert db.session.scalar(select(Ingredient.cost_per_unit).where(Ingredient.name == 'Material 4')) == 4.5
+
+
+def test_import_records_skips_duplicates_in_file_and_database(app):
+    db.session.add(Ingredient(name='Vanillin', unit_of_measurement='g'))
+    db.session.commit()
+
+    report = import_records(
+        [{'name': 'vanillin'}, {'name': 'Coumarin'}, {'name': 'COUMARIN'}], MAPPING, chunk_size=2
+    )
+
+    assert report.imported_count == 1
+    assert report.skipped_count == 2
+    assert _names() == {'Vanillin', 'Coumarin'}
+
+
+def test_save_chunk_retries_rows_one_by_one_when_the_chunk_insert_fails(app):
+    category = Category(name='Woody')
+    db.session.add(category)
+    db.session.commit()
+    context = ImportContext()
+    rows = [_row('Cedarwood', [category.id]), _row('Iso E Super'), _row('Sandalwood', [category.id])]
+    for _, attributes, _ in rows:
+        context.add_name(attributes['name'], 1)
+    # Written after the context was loaded, so only the database's unique constraint catches it
+    db.session.add(Ingredient(name='Iso E Super', unit_of_measurement='g'))
+    db.session.commit()
+    report = ImportReport()
+
+    _save_chunk(rows, report, context)
+
+    assert report.imported_count == 2
+    assert report.skipped_count == 1
+    assert report.error_count == 1
+    assert "Record 'Iso E Super'" in report.errors[0]
+    assert _names() == {'Cedarwood', 'Iso E Super', 'Sandalwood'}
+    linked = set(db.session.scalars(
+        select(Ingredient.name).join(ingredient_category, ingredient_category.c.ingredient_id == Ingredient.id)
+    ))
+    assert linked == {'Cedarwood', 'Sandalwood'}
+    # The rejected name is forgotten, the saved ones are kept
+    assert context.record_with_name('iso e super') is None
+    assert context.record_with_name('cedarwood') == 1
+
+
+def test_save_chunk_rolls_back_when_every_row_is_rejected(app):
+    db.session.add(Ingredient(name='Hedione', unit_of_measurement='g'))
+    db.session.commit()
+    report = ImportReport()
+
+    _save_chunk([_row('Hedione')], report, ImportContext())
+
+    assert report.imported_count == 0
+    assert report.skipped_count == 1
+    assert _names() == {'Hedione'}
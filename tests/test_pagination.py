@@ -0,0 +1,69 @@
+# tests/test_pagination.py
+from datetime import datetime
+import pytest
+from src.models.models import db, Ingredient
+from src.utils.pagination import encode_cursor, decode_cursor, keyset_paginate, InvalidCursor
+
+
+@pytest.mark.parametrize('sort_column, sort_value', [
+    (Ingredient.name, 'Rose absolute'),
+    (Ingredient.name, 'Ylang — extra ✿'),
+    (Ingredient.cost_per_unit, 12.5),
+    (Ingredient.cost_per_unit, None),
+    (Ingredient.last_updated, datetime(2024, 3, 1, 12, 30, 45, 123456)),
+])
+def test_cursor_round_trip(sort_column, sort_value):
+    token = encode_cursor(sort_value, 42)
+    assert '=' not in token # URL-safe, unpadded
+    assert decode_cursor(token, sort_column) == (sort_value, 42)
+
+
+def test_cursor_without_padding_decodes():
+    assert decode_cursor('WzEsMl0', Ingredient.cost_per_unit) == (1, 2) # [1,2]
+
+
+@pytest.mark.parametrize('token', [
+    '', 'not a cursor', encode_cursor('x', 1)[:-3],
+    'WyJhIiwiYiJd', # ["a","b"]: the id is not an integer
+])
+def test_invalid_cursor(token):
+    with pytest.raises(InvalidCursor):
+        decode_cursor(token, Ingredient.name)
+
+
+def _walk(sort_column, descending, per_page):
+    """Follow next_cursor from the first page to the last; returns the ids in order."""
+    ids, cursor, pages = [], '', 0
+    while True:
+        items, cursor = keyset_paginate(Ingredient.query, sort_column, Ingredient.id, descending, cursor, per_page)
+        ids.extend(item.id for item in items)
+        pages += 1
+        assert pages < 100
+        if cursor is None:
+            return ids
+
+
+@pytest.mark.parametrize('descending', [False, True])
+@pytest.mark.parametrize('per_page', [1, 2, 3, 7, 50])
+def test_keyset_pages_match_the_full_ordering(app, descending, per_page):
+    # Repeated and missing (NULL) sort values, so ties are broken by id across page boundaries
+    costs = [5.0, None, 1.0, 5.0, 3.0, None, 5.0, 1.0, 2.0, None, 4.0]
+    for position, cost in enumerate(costs):
+        db.session.add(Ingredient(name=f'Material {position:02d}', cost_per_unit=cost))
+    db.session.commit()
+
+    # NULLs sort as the smallest values: first ascending, last descending
+    def key(item):
+        return (item.cost_per_unit is not None, item.cost_per_unit or 0, item.id)
+    expected = [item.id for item in sorted(Ingredient.query.all(), key=key, reverse=descending)]
+
+    assert _walk(Ingredient.cost_per_unit, descending, per_page) == expected
+
+
+def test_keyset_pages_by_name(app):
+    for name in ('b', 'a', 'd', 'c', 'e'):
+        db.session.add(Ingredient(name=name))
+    db.session.commit()
+    by_name = {item.id: item.name for item in Ingredient.query}
+    assert [by_name[i] for i in _walk(Ingredient.name, False, 2)] == ['a', 'b', 'c', 'd', 'e']
+    assert [by_name[i] for i in _walk(Ingredient.name, True, 2)] == ['e', 'd', 'c', 'b', 'a']
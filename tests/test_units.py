@@ -0,0 +1,62 @@
+# tests/test_units.py
+import pytest
+from src.services.units import (
+    canonical_unit, convert, line_cost, UnitConversionError, DEFAULT_DROP_VOLUME
+)
+
+
+def test_canonical_unit_accepts_aliases():
+    assert canonical_unit('Grams') == 'g'
+    assert canonical_unit(' fl.  oz ') == 'fl oz' # Surrounding and repeated spaces are ignored
+    assert canonical_unit('fluid ounces') == 'fl oz'
+    assert canonical_unit('ML') == 'mL'
+    assert canonical_unit('gtt') == 'drops'
+    assert canonical_unit('furlongs') is None
+
+
+def test_convert_mass_units():
+    assert convert(1500, 'g', 'kg') == pytest.approx(1.5)
+    assert convert(1, 'lb', 'oz') == pytest.approx(16)
+    assert convert(250, 'mg', 'g') == pytest.approx(0.25)
+
+
+def test_convert_same_unit_returns_quantity_unchanged():
+    assert convert(7, 'grams', 'g') == 7
+    assert convert(3, 'parts', 'parts') == 3
+    assert convert(3, 'scoops', 'scoops') == 3 # Unknown to the registry, but the same unit
+
+
+def test_convert_volume_to_mass_uses_density():
+    assert convert(10, 'mL', 'g') == pytest.approx(10) # Water-like default
+    assert convert(10, 'mL', 'g', density=0.85) == pytest.approx(8.5)
+    assert convert(1, 'L', 'kg', density=0.9) == pytest.approx(0.9)
+    assert convert(17, 'g', 'mL', density=0.85) == pytest.approx(20)
+
+
+def test_convert_drops_uses_drop_volume():
+    assert convert(20, 'drops', 'mL') == pytest.approx(20 * DEFAULT_DROP_VOLUME)
+    assert convert(10, 'drops', 'g', density=0.9, drop_volume=0.03) == pytest.approx(10 * 0.03 * 0.9)
+
+
+def test_convert_rejects_unconvertible_units():
+    with pytest.raises(UnitConversionError):
+        convert(1, 'parts', 'g')
+    with pytest.raises(UnitConversionError):
+        convert(1, 'furlongs', 'g')
+
+
+def test_line_cost_converts_into_the_pricing_unit():
+    assert line_cost(500, 'g', 20.0, 'kg') == pytest.approx(10.0)
+    assert line_cost(2, 'oz', 1.0, 'g') == pytest.approx(2 * 28.349523125)
+    # 10 mL of a 0.8 g/mL material priced per gram
+    assert line_cost(10, 'mL', 0.5, 'g', density=0.8) == pytest.approx(4.0)
+
+
+def test_line_cost_defaults_the_line_unit_to_the_pricing_unit():
+    assert line_cost(3, None, 2.0, 'mL') == pytest.approx(6.0)
+
+
+def test_line_cost_is_none_without_a_price_or_a_conversion():
+    assert line_cost(5, 'g', None, 'g') is None
+    assert line_cost(None, 'g', 1.0, 'g') is None
+    assert line_cost(5, 'parts', 1.0, 'g') is None